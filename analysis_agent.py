@@ -1,165 +1,694 @@
-from crewai import Agent
-from communication import AgentMessage, MessageQueue
-from config import config
-import logging
-from datetime import datetime
-
-class Task:
-    def __init__(self, text, agent_name="analysis_agent"):
-        self.text = text
-        self.output_json = None
-        self.output_pydantic = None 
-        self.human_input = None  
-        self.description = None 
-        self.metadata = {} 
-        self.agent = agent_name 
-        self.id = "task_" + str(id(self))
-
-    def prompt(self):
-        return self.text
-
-class AnalysisAgent:
-    def __init__(self, message_queue: MessageQueue):
-        self.message_queue = message_queue
-        self.agent_name = "analysis_agent"
-        self.logger = logging.getLogger(__name__)
-        
-        self.agent = Agent(
-            role="Data Analyst",
-            goal="Analyze information and extract key insights from any content",
-            backstory="You are an expert analyst who can find patterns and insights in any information.",
-            allow_delegation=False,
-            verbose=True,
-            model=config.MODEL
-        )
-    
-    def process_messages(self):
-        """Process incoming messages from research agent"""
-        while True:
-            message = self.message_queue.receive_message(self.agent_name)
-            if message:
-                self._handle_message(message)
-            else:
-                break
-    
-    def _safe_execute_task(self, task):
-        """Safely execute task with proper error handling"""
-        try:
-            # Use the agent's kickoff method instead of execute_task if available
-            if hasattr(self.agent, 'kickoff'):
-                result = self.agent.kickoff(task.prompt())
-                return result
-            else:
-                # Fallback to execute_task but handle potential issues
-                self.agent.execute_task(task)
-                return getattr(task, "output_json", None) or getattr(task, "result", None)
-        except Exception as e:
-            self.logger.error(f"Task execution error: {str(e)}")
-            return f"Analysis could not be completed due to: {str(e)}"
-    
-    def _handle_message(self, message: AgentMessage):
-        """Handle different types of messages"""
-        try:
-            if message.message_type == "research_data":
-                self.logger.info("Analysis Agent received research data")
-                
-                # Safely extract content with validation
-                content = message.content
-                if not isinstance(content, dict):
-                    raise ValueError("Message content is not a dictionary")
-                
-                research_data = content.get("research_data", "")
-                topic = content.get("topic", "Unknown topic")
-                
-                # Ensure research_data is a string for processing
-                if not isinstance(research_data, str):
-                    if hasattr(research_data, '__str__'):
-                        research_text = str(research_data)
-                    else:
-                        research_text = f"Research data in format: {type(research_data)}"
-                else:
-                    research_text = research_data
-                
-                # Create a simpler task structure to avoid CrewAI issues
-                task_text = f"""
-                Analyze this research data about {topic} and extract key points, themes, and insights.
-                Provide a comprehensive analysis with the most important information.
-                
-                RESEARCH DATA:
-                {research_text}
-                
-                Please provide your analysis in a structured format with clear sections.
-                """
-                
-                task = Task(task_text, agent_name="analysis_agent")
-                
-                # Use safe execution
-                analysis_result = self._safe_execute_task(task)
-                
-                # If analysis failed, provide a basic analysis
-                if analysis_result is None or "could not be completed" in str(analysis_result):
-                    analysis_result = self._fallback_analysis(topic, research_text)
-                
-                # Send to summary agent
-                response_message = AgentMessage(
-                    sender=self.agent_name,
-                    receiver="summary_agent",
-                    content={
-                        "topic": topic,
-                        "research_data": research_text[:500] + "..." if len(research_text) > 500 else research_text,  # Truncate if too long
-                        "analysis_data": analysis_result,
-                        "status": "success"
-                    },
-                    message_type="analysis",
-                    timestamp=datetime.now().isoformat()
-                )
-                self.message_queue.send_message(response_message)
-                self.logger.info("Analysis completed and sent to summary agent")
-                
-            elif message.message_type == "error":
-                self.logger.warning("Analysis Agent received error message")
-                # Forward error to summary agent with proper structure
-                error_message = AgentMessage(
-                    sender=self.agent_name,
-                    receiver="summary_agent",
-                    content={
-                        "topic": message.content.get("topic", "unknown"),
-                        "error": f"Analysis failed: {message.content.get('error', 'Unknown error')}",
-                        "status": "error"
-                    },
-                    message_type="error",
-                    timestamp=datetime.now().isoformat()
-                )
-                self.message_queue.send_message(error_message)
-                
-        except Exception as e:
-            self.logger.error(f"Analysis agent failed: {str(e)}")
-            error_message = AgentMessage(
-                sender=self.agent_name,
-                receiver="summary_agent",
-                content={
-                    "topic": message.content.get("topic", "unknown") if 'message' in locals() else "unknown",
-                    "error": f"Analysis failed: {str(e)}",
-                    "status": "error"
-                },
-                message_type="error",
-                timestamp=datetime.now().isoformat()
-            )
-            self.message_queue.send_message(error_message)
-    
-    def _fallback_analysis(self, topic, research_text):
-        """Provide a fallback analysis when CrewAI fails"""
-        self.logger.info("Using fallback analysis method")
-        
-        # Simple keyword-based analysis as fallback
-        keywords = ["AI", "artificial intelligence", "healthcare", "medical", "diagnosis", "treatment"]
-        found_keywords = [kw for kw in keywords if kw.lower() in research_text.lower()]
-        
-        return {
-            "status": "fallback_analysis",
-            "topic": topic,
-            "key_themes": found_keywords,
-            "summary": f"Based on research about {topic}, key areas discussed include: {', '.join(found_keywords) if found_keywords else 'general topics'}",
-            "insights": "Analysis completed using fallback method due to technical constraints.",
-            "data_length": len(research_text)
+from communication import AgentMessage, MessageQueue, AsyncMessageQueue
+from blob_store import release_refs, resolve, store_large
+from caching import ResponseCache
+from chunking import build_digest, chunk_text, estimate_tokens, pack
+from dedup import SourceDeduplicator
+from result_store import RefreshPlan, analysis_basis, analysis_delta, get_result_store, plan_refresh
+from resilience import CircuitBreaker, get_policy
+from logging_setup import sampled
+from metrics import current_trace, inc, in_context, span, traced_stage
+from config import config
+from text_analysis import analyze_text, load_background
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+
+# Joins partial analyses in a reduce prompt
+PARTIAL_SEPARATOR = "\n\n---\n\n"
+# How long a stream's final message waits for partial messages that are still being picked up
+PARTIAL_WAIT = 5.0
+
+class Task:
+    def __init__(self, text, agent_name="analysis_agent"):
+        self.text = text
+        self.output_json = None
+        self.output_pydantic = None 
+        self.human_input = None  
+        self.description = None 
+        self.metadata = {} 
+        self.agent = agent_name 
+        self.id = "task_" + str(id(self))
+
+    def prompt(self):
+        return self.text
+
+class AnalysisAgent:
+    def __init__(self, message_queue: MessageQueue, async_queue: Optional[AsyncMessageQueue] = None,
+                 response_cache: Optional[ResponseCache] = None):
+        self.message_queue = message_queue
+        self.async_queue = async_queue
+        self.agent_name = "analysis_agent"
+        self.role = "Data Analyst"
+        self.logger = logging.getLogger(__name__)
+        
+        # Opt-in cache of model responses for byte-identical prompts
+        if response_cache is None and config.LLM_CACHE_ENABLED:
+            response_cache = ResponseCache.from_config(config)
+        self.response_cache = response_cache
+        self.llm_policy = get_policy("llm")
+        # Mirrored and syndicated copies of a source are analyzed once
+        self.deduplicator = SourceDeduplicator.from_config(config) if config.DEDUP_ENABLED else None
+        
+        # Analyses started on pipelined research batches, by stream id, until the stream's final message
+        self._streams: Dict[str, Dict] = {}
+        self._streams_changed = threading.Condition()
+        self._partial_pool: Optional[ThreadPoolExecutor] = None
+        
+        # crewai is imported and the CrewAI agent built on first use
+        self._agent = None
+        self._agent_lock = threading.Lock()
+    
+    @property
+    def agent(self):
+        """CrewAI agent, constructed on first access"""
+        if self._agent is None:
+            with self._agent_lock:
+                if self._agent is None:
+                    self._agent = self._build_agent()
+        return self._agent
+    
+    @agent.setter
+    def agent(self, agent):
+        self._agent = agent
+    
+    def _build_agent(self):
+        from crewai import Agent
+        return Agent(
+            role=self.role,
+            goal="Analyze information and extract key insights from any content",
+            backstory="You are an expert analyst who can find patterns and insights in any information.",
+            allow_delegation=False,
+            verbose=True,
+            model=config.MODEL
+        )
+    
+    def process_messages(self):
+        """Process incoming messages from research agent"""
+        while self.process_next_message():
+            pass
+    
+    def process_next_message(self) -> bool:
+        """Handle a single pending message, returning False when the queue is empty"""
+        message = self.message_queue.receive_message(self.agent_name)
+        if message is None:
+            return False
+        self._handle_message(message)
+        # Handled (or failed over to an error message): a durable queue may now forget it
+        self.message_queue.ack(message)
+        release_refs(message.content)
+        return True
+    
+    async def aprocess_messages(self):
+        """Async variant of process_messages using the async message queue"""
+        while await self.aprocess_next_message():
+            pass
+    
+    async def aprocess_next_message(self) -> bool:
+        """Handle a single pending async message, returning False when none is waiting"""
+        message = self.async_queue.receive_nowait(self.agent_name)
+        if message is None:
+            return False
+        await self._ahandle_message(message)
+        release_refs(message.content)
+        return True
+    
+    def _safe_execute_task(self, task, use_cache: bool = True):
+        """Safely execute task with proper error handling"""
+        cached = self._cached_response(task.prompt(), use_cache)
+        if cached is not None:
+            return cached
+        try:
+            started = time.perf_counter()
+            # Use the agent's kickoff method instead of execute_task if available
+            if hasattr(self.agent, 'kickoff'):
+                with span("analysis.llm"):
+                    result = self.llm_policy.call(self.agent.kickoff, task.prompt())
+            else:
+                # Fallback to execute_task but handle potential issues
+                with span("analysis.llm"):
+                    self.llm_policy.call(self.agent.execute_task, task)
+                result = getattr(task, "output_json", None) or getattr(task, "result", None)
+            self._store_response(task.prompt(), result, started, use_cache)
+            return result
+        except Exception as e:
+            self.logger.error("Task execution error: %s", e)
+            return f"Analysis could not be completed due to: {str(e)}"
+    
+    async def _asafe_execute_task(self, task, use_cache: bool = True):
+        """Async variant of _safe_execute_task"""
+        if not hasattr(self.agent, 'kickoff_async'):
+            # Blocking agents run on a worker thread so the event loop stays free
+            return await asyncio.to_thread(self._safe_execute_task, task, use_cache)
+        cached = self._cached_response(task.prompt(), use_cache)
+        if cached is not None:
+            return cached
+        try:
+            started = time.perf_counter()
+            with span("analysis.llm"):
+                result = await self.llm_policy.acall(self.agent.kickoff_async, task.prompt())
+            self._store_response(task.prompt(), result, started, use_cache)
+            return result
+        except Exception as e:
+            self.logger.error("Task execution error: %s", e)
+            return f"Analysis could not be completed due to: {str(e)}"
+    
+    def _cached_response(self, prompt: str, use_cache: bool):
+        """Look up a previous model response for this exact prompt"""
+        if self.response_cache is None:
+            return None
+        if not use_cache:
+            self.response_cache.record_bypass()
+            return None
+        cached = self.response_cache.get(config.MODEL, self.role, prompt)
+        if cached is not None:
+            self.logger.info("Analysis served from LLM response cache", extra=sampled("analysis.cache_hit"))
+        return cached
+    
+    def _store_response(self, prompt: str, result, started: float, use_cache: bool):
+        """Cache a successful model response (never fallbacks or errors)"""
+        if self.response_cache is None or not use_cache or result is None:
+            return
+        self.response_cache.set(config.MODEL, self.role, prompt, str(result), time.perf_counter() - started)
+    
+    def _handle_message(self, message: AgentMessage):
+        """Handle different types of messages"""
+        if message.message_type == "research_partial":
+            # Not a stage of its own: the work joins the topic's analysis stage when research finishes
+            self._start_partial(message)
+        else:
+            self._handle_stage_message(message)
+    
+    async def _ahandle_message(self, message: AgentMessage):
+        """Async variant of _handle_message"""
+        if message.message_type == "research_partial":
+            self._astart_partial(message)
+        else:
+            await self._ahandle_stage_message(message)
+    
+    @traced_stage("analysis")
+    def _handle_stage_message(self, message: AgentMessage):
+        try:
+            if message.message_type == "research_data":
+                topic, research_text, task = self._prepare_analysis(message)
+                refresh = self._refresh_plan(topic, research_text, message)
+                pipeline = message.metadata.get("pipeline")
+                
+                # Use safe execution
+                if refresh is not None:
+                    analysis_result = self._run_refresh(topic, research_text, task, refresh)
+                elif pipeline is not None:
+                    analysis_result = self._finish_pipeline(topic, research_text, task, pipeline)
+                else:
+                    analysis_result = self._run_analysis(topic, research_text, task)
+                response_message = self._analysis_message(topic, research_text, analysis_result, refresh)
+                
+            elif message.message_type == "error":
+                self._drop_stream(message)
+                response_message = self._forward_error(message)
+            else:
+                return
+        except Exception as e:
+            response_message = self._failure_message(message, e)
+        
+        self.message_queue.send_message(response_message)
+        if response_message.message_type == "analysis":
+            self.logger.debug("Analysis completed and sent to summary agent")
+    
+    @traced_stage("analysis")
+    async def _ahandle_stage_message(self, message: AgentMessage):
+        try:
+            if message.message_type == "research_data":
+                topic, research_text, task = self._prepare_analysis(message)
+                refresh = self._refresh_plan(topic, research_text, message)
+                pipeline = message.metadata.get("pipeline")
+                if refresh is not None:
+                    analysis_result = await self._arun_refresh(topic, research_text, task, refresh)
+                elif pipeline is not None:
+                    analysis_result = await self._afinish_pipeline(topic, research_text, task, pipeline)
+                else:
+                    analysis_result = await self._arun_analysis(topic, research_text, task)
+                response_message = self._analysis_message(topic, research_text, analysis_result, refresh)
+                
+            elif message.message_type == "error":
+                self._drop_stream(message)
+                response_message = self._forward_error(message)
+            else:
+                return
+        except Exception as e:
+            response_message = self._failure_message(message, e)
+        
+        await self.async_queue.send_message(response_message)
+        if response_message.message_type == "analysis":
+            self.logger.debug("Analysis completed and sent to summary agent")
+    
+    def _run_analysis(self, topic: str, research_text: str, task):
+        """Analyze in one prompt, or map-reduce over token-budgeted chunks when the data is too large"""
+        reason = self._fast_analysis_reason(research_text)
+        if reason is not None:
+            return self._keyphrase_analysis(topic, research_text, "fast_analysis", reason)
+        chunks = chunk_text(research_text, config.ANALYSIS_CHUNK_TOKENS)
+        if len(chunks) <= 1:
+            return self._safe_execute_task(task)
+        
+        self.logger.debug("Research data for '%s' split into %s chunks for analysis", topic, len(chunks))
+        return self._reduce(topic, self._successful(self._map_tasks(self._chunk_tasks(topic, chunks))))
+    
+    async def _arun_analysis(self, topic: str, research_text: str, task):
+        """Async variant of _run_analysis"""
+        reason = self._fast_analysis_reason(research_text)
+        if reason is not None:
+            return self._keyphrase_analysis(topic, research_text, "fast_analysis", reason)
+        chunks = chunk_text(research_text, config.ANALYSIS_CHUNK_TOKENS)
+        if len(chunks) <= 1:
+            return await self._asafe_execute_task(task)
+        
+        self.logger.debug("Research data for '%s' split into %s chunks for analysis", topic, len(chunks))
+        return await self._areduce(topic, self._successful(await self._amap_tasks(self._chunk_tasks(topic, chunks))))
+    
+    def _reduce(self, topic: str, partials: List[str]):
+        """Merge partial analyses, a prompt's worth at a time, until one is left"""
+        while len(partials) > 1:
+            reduced = self._successful(self._map_tasks(
+                [self._reduce_task(topic, group) for group in self._reduce_groups(partials)]
+            ))
+            if not reduced:
+                break
+            partials = reduced
+        return PARTIAL_SEPARATOR.join(partials) if partials else None
+    
+    async def _areduce(self, topic: str, partials: List[str]):
+        """Async variant of _reduce"""
+        while len(partials) > 1:
+            reduced = self._successful(await self._amap_tasks(
+                [self._reduce_task(topic, group) for group in self._reduce_groups(partials)]
+            ))
+            if not reduced:
+                break
+            partials = reduced
+        return PARTIAL_SEPARATOR.join(partials) if partials else None
+    
+    def _start_partial(self, message: AgentMessage):
+        """Start analyzing a batch of pipelined research while the rest is still being gathered"""
+        tasks = self._partial_tasks(message)
+        futures = None
+        if tasks is not None:
+            pool = self._partial_executor()
+            futures = [pool.submit(in_context(self._safe_execute_task), task) for task in tasks]
+        self._add_part(message.metadata["pipeline"], futures)
+    
+    def _astart_partial(self, message: AgentMessage):
+        """Async variant of _start_partial; the analyses run as tasks on the event loop"""
+        tasks = self._partial_tasks(message)
+        futures = None
+        if tasks is not None:
+            futures = [asyncio.ensure_future(self._asafe_execute_task(task)) for task in tasks]
+        self._add_part(message.metadata["pipeline"], futures)
+    
+    def _partial_tasks(self, message: AgentMessage) -> Optional[List[Task]]:
+        """Analysis tasks for a research_partial message; None if it can't be analyzed"""
+        try:
+            topic = message.content.get("topic", "Unknown topic")
+            research_text = str(resolve(message.content.get("research_data", "")))
+            # Fast analysis needs no head start: it runs on the complete research text
+            if self._fast_analysis_reason(research_text) is not None:
+                return []
+            pipeline = message.metadata["pipeline"]
+            if self.deduplicator is not None:
+                with self._streams_changed:
+                    sent = self._stream_state(pipeline["stream"])["sources"]
+                # Also drops copies of sources sent in the stream's earlier batches
+                research_text = self.deduplicator.dedup(topic, research_text, sent)
+            part = pipeline["part"]
+            return [self._partial_task(topic, chunk, part) for chunk in chunk_text(research_text, config.ANALYSIS_CHUNK_TOKENS)]
+        except Exception as e:
+            self.logger.error("Partial analysis failed: %s", e)
+            return None
+    
+    def _partial_executor(self) -> ThreadPoolExecutor:
+        with self._streams_changed:
+            if self._partial_pool is None:
+                self._partial_pool = ThreadPoolExecutor(max_workers=max(1, config.ANALYSIS_MAP_WORKERS),
+                                                        thread_name_prefix="analysis_partial")
+            return self._partial_pool
+    
+    def _add_part(self, pipeline: Dict, futures: Optional[list]):
+        """Record the analyses started for one part of a stream (None if the part failed)"""
+        with self._streams_changed:
+            # Streams whose final message never came (the topic timed out) are dropped
+            cutoff = time.perf_counter() - config.PIPELINE_TIMEOUT
+            for stream in [stream for stream, state in self._streams.items() if state["started"] < cutoff]:
+                del self._streams[stream]
+            self._stream_state(pipeline["stream"])["parts"][pipeline["part"]] = futures
+            self._streams_changed.notify_all()
+    
+    def _stream_state(self, stream: str) -> Dict:
+        """A stream's state, created for its first part (call with _streams_changed held)"""
+        return self._streams.setdefault(
+            stream, {"parts": {}, "sources": [], "started": time.perf_counter(), "wall": time.time()}
+        )
+    
+    def _take_stream(self, pipeline: Dict, timeout: float) -> Optional[Dict]:
+        """Remove and return a stream's state once all its parts are in; None if any is missing or failed"""
+        stream, parts = pipeline["stream"], pipeline["parts"]
+        with self._streams_changed:
+            # Every part was queued before the final message, but another stage worker may still be recording one
+            self._streams_changed.wait_for(lambda: len(self._streams.get(stream, {}).get("parts", ())) >= parts,
+                                           timeout)
+            state = self._streams.pop(stream, None)
+        if state is None or len(state["parts"]) < parts or any(futures is None for futures in state["parts"].values()):
+            return None
+        return state
+    
+    def _drop_stream(self, message: AgentMessage):
+        pipeline = message.metadata.get("pipeline")
+        if pipeline is not None:
+            with self._streams_changed:
+                self._streams.pop(pipeline["stream"], None)
+    
+    def _finish_pipeline(self, topic: str, research_text: str, task, pipeline: Dict):
+        """Merge the analyses started on a stream's partial messages, or analyze it all if any is missing"""
+        state = self._take_stream(pipeline, PARTIAL_WAIT)
+        futures = self._stream_futures(topic, research_text, state)
+        if not futures:
+            return self._run_analysis(topic, research_text, task)
+        results = [future.result() for future in futures]
+        self._record_partials(state)
+        partials = self._successful(results)
+        if self._fits_one_prompt(partials):
+            return PARTIAL_SEPARATOR.join(partials) if partials else None
+        return self._reduce(topic, partials)
+    
+    async def _afinish_pipeline(self, topic: str, research_text: str, task, pipeline: Dict):
+        """Async variant of _finish_pipeline"""
+        # Messages are handled in order on the event loop, so every part is already recorded
+        state = self._take_stream(pipeline, 0)
+        futures = self._stream_futures(topic, research_text, state)
+        if not futures:
+            return await self._arun_analysis(topic, research_text, task)
+        results = await asyncio.gather(*futures)
+        self._record_partials(state)
+        partials = self._successful(results)
+        if self._fits_one_prompt(partials):
+            return PARTIAL_SEPARATOR.join(partials) if partials else None
+        return await self._areduce(topic, partials)
+    
+    def _stream_futures(self, topic: str, research_text: str, state: Optional[Dict]) -> list:
+        """A stream's partial analyses in part order; empty when the full research text must be analyzed"""
+        if state is None:
+            self.logger.warning("Partial analyses for '%s' are missing, analyzing the complete research data", topic)
+            return []
+        if self._fast_analysis_reason(research_text) is not None:
+            return []
+        return [future for part in sorted(state["parts"]) for future in state["parts"][part]]
+    
+    def _fits_one_prompt(self, partials: List[str]) -> bool:
+        """Whether partial analyses go to the summary as they are.
+        
+        Merging them is what the summary prompt does anyway, so a reduce
+        call would only add a model round trip after research finishes.
+        """
+        return estimate_tokens(PARTIAL_SEPARATOR.join(partials)) <= config.ANALYSIS_CHUNK_TOKENS
+    
+    def _record_partials(self, state: Dict):
+        """Span from the first partial message to the last partial analysis, overlapping research"""
+        trace = current_trace()
+        if trace is not None:
+            trace.add_span("analysis.partials", state["wall"], time.perf_counter() - state["started"],
+                           parts=len(state["parts"]))
+        inc("analysis_partials_total", len(state["parts"]))
+    
+    def _refresh_plan(self, topic: str, research_text: str, message: AgentMessage) -> Optional[RefreshPlan]:
+        """Reuse plan against the topic's stored results, for research sent in refresh mode"""
+        store = get_result_store()
+        if not message.content.get("refresh") or store is None:
+            return None
+        plan = plan_refresh(store.latest(topic), research_text, config.REFRESH_GROUP_TOKENS)
+        self.logger.info("Refreshing '%s': %s", topic, plan.counts)
+        return plan
+    
+    def _run_refresh(self, topic: str, research_text: str, task, plan: RefreshPlan):
+        """Analyze only the sources not covered by a reusable partial analysis, then merge"""
+        if plan.unchanged:
+            plan.partials = plan.reused
+            return plan.previous.analysis
+        reason = self._fast_analysis_reason(research_text)
+        if reason is not None:
+            return self._keyphrase_analysis(topic, research_text, "fast_analysis", reason)
+        if len(plan.groups) == 1 and not plan.reused:
+            # Nothing to reuse or merge with: the usual single prompt
+            results = [self._safe_execute_task(task)]
+        else:
+            results = self._map_tasks(self._chunk_tasks(topic, [group["text"] for group in plan.groups]))
+        if not plan.add_results(results, self._analysis_failed):
+            return None
+        return self._reduce(topic, [partial["analysis"] for partial in plan.partials])
+    
+    async def _arun_refresh(self, topic: str, research_text: str, task, plan: RefreshPlan):
+        """Async variant of _run_refresh"""
+        if plan.unchanged:
+            plan.partials = plan.reused
+            return plan.previous.analysis
+        reason = self._fast_analysis_reason(research_text)
+        if reason is not None:
+            return self._keyphrase_analysis(topic, research_text, "fast_analysis", reason)
+        if len(plan.groups) == 1 and not plan.reused:
+            results = [await self._asafe_execute_task(task)]
+        else:
+            results = await self._amap_tasks(self._chunk_tasks(topic, [group["text"] for group in plan.groups]))
+        if not plan.add_results(results, self._analysis_failed):
+            return None
+        return await self._areduce(topic, [partial["analysis"] for partial in plan.partials])
+    
+    def _record_refresh(self, topic: str, plan: RefreshPlan, analysis_result, complete: bool) -> Dict:
+        """Store the refreshed analysis as a new version; the summary is carried over if it still fits"""
+        previous = plan.previous
+        if not isinstance(analysis_result, (str, dict)):
+            analysis_result = str(analysis_result)
+        basis = analysis_basis(analysis_result)
+        # The summary is compared against the analysis it was written from, not just the last one
+        previous_basis = previous.stats.get("summary_basis") if previous is not None and previous.summary is not None else None
+        if previous_basis is None:
+            delta = 1.0
+        else:
+            delta = 0.0 if plan.unchanged else analysis_delta(previous_basis, basis)
+        reuse_summary = previous_basis is not None and delta < config.REFRESH_RESUMMARIZE_DELTA
+        stats = {**plan.counts, "complete": complete, "analysis_delta": round(delta, 3),
+                 "summary_reused": reuse_summary, "summary_basis": previous_basis if reuse_summary else basis}
+        version = get_result_store().add_version(topic, plan.sources, plan.partials, analysis_result, stats,
+                                                 summary=previous.summary if reuse_summary else None)
+        inc("refresh_sources_total", plan.counts["analyzed_sources"], outcome="analyzed")
+        inc("refresh_sources_total", plan.counts["sources"] - plan.counts["analyzed_sources"], outcome="reused")
+        self.logger.info("Stored version %s of '%s' (analysis delta %.2f, summary %s)", version, topic, delta,
+                         "reused" if reuse_summary else "regenerated")
+        return {"version": version, "analysis_delta": stats["analysis_delta"], "summary_reused": reuse_summary}
+    
+    def _map_tasks(self, tasks: List[Task]) -> list:
+        """Run independent analysis tasks in parallel, preserving order"""
+        if len(tasks) == 1:
+            return [self._safe_execute_task(tasks[0])]
+        workers = max(1, min(len(tasks), config.ANALYSIS_MAP_WORKERS))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis_map") as pool:
+            return list(pool.map(in_context(self._safe_execute_task), tasks))
+    
+    async def _amap_tasks(self, tasks: List[Task]) -> list:
+        limit = asyncio.Semaphore(max(1, config.ANALYSIS_MAP_WORKERS))
+        
+        async def run(task):
+            async with limit:
+                return await self._asafe_execute_task(task)
+        
+        return await asyncio.gather(*(run(task) for task in tasks))
+    
+    def _successful(self, results) -> List[str]:
+        return [str(result) for result in results if not self._analysis_failed(result)]
+    
+    def _analysis_failed(self, result) -> bool:
+        return result is None or "could not be completed" in str(result)
+    
+    def _reduce_groups(self, partials: List[str]) -> List[str]:
+        """Merge as many partial analyses per reduce prompt as fit the chunk budget"""
+        groups = pack(partials, config.ANALYSIS_CHUNK_TOKENS, separator=PARTIAL_SEPARATOR)
+        if len(groups) == len(partials):
+            # Every partial fills a chunk by itself; merge pairwise so the reduction still converges
+            groups = [PARTIAL_SEPARATOR.join(partials[i:i + 2]) for i in range(0, len(partials), 2)]
+        return groups
+    
+    def _chunk_tasks(self, topic: str, chunks: List[str]) -> List[Task]:
+        return [self._chunk_task(topic, chunk, index, len(chunks)) for index, chunk in enumerate(chunks, 1)]
+    
+    def _chunk_task(self, topic: str, chunk: str, index: int, total: int) -> Task:
+        task_text = f"""
+        Analyze part {index} of {total} of the research data about {topic}.
+        Extract the key points, themes, facts and insights found in this part.
+        
+        RESEARCH DATA (PART {index}/{total}):
+        {chunk}
+        
+        Be concise; your notes will be merged with the analyses of the other parts.
+        """
+        return Task(task_text, agent_name="analysis_agent")
+    
+    def _partial_task(self, topic: str, chunk: str, part: int) -> Task:
+        task_text = f"""
+        Analyze batch {part} of the research data about {topic}; more sources are still being gathered.
+        Extract the key points, themes, facts and insights found in this batch.
+        
+        RESEARCH DATA (BATCH {part}):
+        {chunk}
+        
+        Be concise; your notes will be merged with the analyses of the other batches.
+        """
+        return Task(task_text, agent_name="analysis_agent")
+    
+    def _reduce_task(self, topic: str, partials: str) -> Task:
+        task_text = f"""
+        Merge these partial analyses of research data about {topic} into a single analysis.
+        Combine overlapping points, keep every distinct insight and note any contradictions.
+        
+        PARTIAL ANALYSES:
+        {partials}
+        
+        Please provide your analysis in a structured format with clear sections.
+        """
+        return Task(task_text, agent_name="analysis_agent")
+    
+    def _prepare_analysis(self, message: AgentMessage):
+        """Validate a research_data message and build its analysis task"""
+        self.logger.debug("Analysis Agent received research data")
+        
+        # Safely extract content with validation
+        content = message.content
+        if not isinstance(content, dict):
+            raise ValueError("Message content is not a dictionary")
+        
+        research_data = resolve(content.get("research_data", ""))
+        topic = content.get("topic", "Unknown topic")
+        
+        # Ensure research_data is a string for processing
+        if not isinstance(research_data, str):
+            if hasattr(research_data, '__str__'):
+                research_text = str(research_data)
+            else:
+                research_text = f"Research data in format: {type(research_data)}"
+        else:
+            research_text = research_data
+        if self.deduplicator is not None:
+            research_text = self.deduplicator.dedup(topic, research_text)
+        
+        # Create a simpler task structure to avoid CrewAI issues
+        task_text = f"""
+        Analyze this research data about {topic} and extract key points, themes, and insights.
+        Provide a comprehensive analysis with the most important information.
+        
+        RESEARCH DATA:
+        {research_text}
+        
+        Please provide your analysis in a structured format with clear sections.
+        """
+        
+        return topic, research_text, Task(task_text, agent_name="analysis_agent")
+    
+    def _analysis_message(self, topic, research_text, analysis_result,
+                          refresh: Optional[RefreshPlan] = None) -> AgentMessage:
+        """Build the message that carries a finished analysis to the summary agent"""
+        # If analysis failed, provide a basic analysis
+        complete = not self._analysis_failed(analysis_result) and not isinstance(analysis_result, dict)
+        if self._analysis_failed(analysis_result):
+            analysis_result = self._fallback_analysis(topic, research_text)
+        
+        content = {
+            "topic": topic,
+            # Budgeted digest covering every source, rather than a leading slice
+            "research_data": build_digest(research_text, config.SUMMARY_DIGEST_TOKENS),
+            "analysis_data": store_large(analysis_result),
+            "status": "success"
+        }
+        if refresh is not None:
+            content["refresh"] = self._record_refresh(topic, refresh, analysis_result, complete)
+        
+        # Send to summary agent
+        return AgentMessage(
+            sender=self.agent_name,
+            receiver="summary_agent",
+            content=content,
+            message_type="analysis",
+            timestamp=datetime.now().isoformat()
+        )
+    
+    def _forward_error(self, message: AgentMessage) -> AgentMessage:
+        """Forward an upstream error to summary agent with proper structure"""
+        self.logger.warning("Analysis Agent received error message")
+        return AgentMessage(
+            sender=self.agent_name,
+            receiver="summary_agent",
+            content={
+                "topic": message.content.get("topic", "unknown"),
+                "error": f"Analysis failed: {message.content.get('error', 'Unknown error')}",
+                "status": "error"
+            },
+            message_type="error",
+            timestamp=datetime.now().isoformat()
+        )
+    
+    def _failure_message(self, message: AgentMessage, error: Exception) -> AgentMessage:
+        self.logger.error("Analysis agent failed: %s", error)
+        return AgentMessage(
+            sender=self.agent_name,
+            receiver="summary_agent",
+            content={
+                "topic": message.content.get("topic", "unknown") if isinstance(message.content, dict) else "unknown",
+                "error": f"Analysis failed: {str(error)}",
+                "status": "error"
+            },
+            message_type="error",
+            timestamp=datetime.now().isoformat()
+        )
+    
+    def _fallback_analysis(self, topic, research_text):
+        """Provide a fallback analysis when CrewAI fails"""
+        self.logger.debug("Using fallback analysis method")
+        inc("fallbacks_total", stage="analysis")
+        return self._keyphrase_analysis(topic, research_text, "fallback_analysis", "llm_failed")
+    
+    def _fast_analysis_reason(self, research_text: str) -> Optional[str]:
+        """Why this analysis should skip the model (per ANALYSIS_MODE), or None to call it"""
+        if config.ANALYSIS_MODE == "fast":
+            return "mode"
+        if config.ANALYSIS_MODE != "auto":
+            return None
+        # Repeated errors and timeouts (a slow model) open the circuit
+        if self.llm_policy.breaker.state == CircuitBreaker.OPEN:
+            return "circuit_open"
+        if config.ANALYSIS_FAST_ABOVE_TOKENS and estimate_tokens(research_text) > config.ANALYSIS_FAST_ABOVE_TOKENS:
+            return "over_budget"
+        return None
+    
+    def _keyphrase_analysis(self, topic, research_text, status: str, reason: str):
+        """Offline TF-IDF keyphrase analysis of the research data (see text_analysis)"""
+        with span("analysis.keyphrases"):
+            result = analyze_text(research_text, top_k=config.ANALYSIS_TOP_THEMES,
+                                  per_source=config.ANALYSIS_SOURCE_THEMES,
+                                  background=load_background(config.ANALYSIS_BACKGROUND_CORPUS))
+        inc("analysis_keyphrase_total", reason=reason)
+        
+        themes = result.theme_names()
+        insights = []
+        if result.shared_themes:
+            insights.append(f"Covered by most sources: {', '.join(result.shared_themes)}.")
+        distinct = sum(1 for _, source_themes in result.source_themes if source_themes)
+        if distinct:
+            insights.append(f"{distinct} of {result.documents} source(s) have distinctive themes (see source_themes).")
+        return {
+            "status": status,
+            "topic": topic,
+            "key_themes": themes,
+            "source_themes": {label: source_themes for label, source_themes in result.source_themes},
+            "summary": f"Based on {result.documents} source(s) about {topic}, the most prominent themes are: "
+                       f"{', '.join(themes) if themes else 'general topics'}",
+            "insights": " ".join(insights) or "No distinctive themes were found in the research data.",
+            "data_length": len(research_text)
         }
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""
+Offline latency benchmark for the research pipeline.
+
+Runs the orchestrator with stubbed LLM agents so no API key or network
+access is needed, and compares the event-driven pipeline against the old
+1-second polling loop.
+
+    python benchmark.py --topics 3 --llm-latency 0.05
+
+--startup instead measures CLI startup (import plus orchestrator
+construction) in fresh interpreters with a -X importtime breakdown;
+--check makes it exit non-zero when startup exceeds its budget or pulls in
+a module that should only load on first use.
+
+    python benchmark.py --startup --check
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict
+
+os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# Stubs are local; don't let the upstream rate limiter dominate the measurements
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "0")
+
+from enhanced_orchestrator import EnhancedResearchOrchestrator
+
+# What a short-lived CLI or cron run pays before doing any work
+STARTUP_SNIPPET = "from enhanced_orchestrator import EnhancedResearchOrchestrator; EnhancedResearchOrchestrator(use_mcp=True)"
+# Heavy packages that must only be imported when an agent first needs them
+DEFERRED_MODULES = ("crewai", "langchain", "duckduckgo_search")
+
+
+class StubLLM:
+    """Stand-in for a CrewAI Agent that answers after a fixed delay.
+
+    jitter spreads each call's latency uniformly by +/- that fraction,
+    drawn from a seeded generator so runs are repeatable. With busy=True
+    the latency is spent spinning on the CPU instead of sleeping, standing
+    in for local CPU-bound processing.
+    """
+    def __init__(self, latency: float, response: str, jitter: float = 0.0, seed: int = 0, busy: bool = False):
+        self.latency = latency
+        self.response = response
+        self.jitter = jitter
+        self.busy = busy
+        self._random = random.Random(seed)
+        # Streaming goes through agent.llm, as with a real CrewAI agent
+        self.llm = self
+
+    def _delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def _wait(self, seconds: float):
+        if not self.busy:
+            time.sleep(seconds)
+            return
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+    def kickoff(self, prompt: str) -> str:
+        self._wait(self._delay())
+        return self.response
+
+    def execute_task(self, task) -> str:
+        return self.kickoff(task)
+
+    async def kickoff_async(self, prompt: str) -> str:
+        if self.busy:
+            self._wait(self._delay())
+        else:
+            await asyncio.sleep(self._delay())
+        return self.response
+
+    def stream(self, prompt: str):
+        """Yield the response word by word, spreading the latency across tokens"""
+        words = self.response.split(" ")
+        delay = self._delay()
+        for word in words:
+            self._wait(delay / len(words))
+            yield word + " "
+
+
+def install_stub_llm(agent, latency: float, response_chars: int, jitter: float = 0.0, seed: int = 0,
+                     busy: bool = False):
+    """Give an analysis or summary agent a StubLLM.
+
+    Module-level so that, bound with functools.partial, it can be passed as
+    the worker_initializer of stage worker processes.
+    """
+    offset = 1 if agent.agent_name == "analysis_agent" else 2
+    agent.agent = StubLLM(latency, make_text(response_chars, seed=offset), jitter, seed + offset, busy=busy)
+
+
+class StubSearchBackend:
+    """Deterministic stand-in for a web search backend.
+
+    Each query draws max_results documents from a fixed pool, seeded by
+    the query text, so query variants overlap the way real results do and
+    the same query always returns the same hits.
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, body_chars: int = 400,
+                 pool_size: int = 20, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.body_chars = body_chars
+        self.pool_size = pool_size
+        self.seed = seed
+        self._random = random.Random(seed)
+
+    def search(self, query: str, max_results: int = 5):
+        delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter)) if self.jitter else self.latency
+        time.sleep(delay)
+        picks = random.Random(f"{self.seed}:{query}").sample(range(self.pool_size), min(max_results, self.pool_size))
+        return [
+            {"title": f"Document {doc}", "href": f"https://example.org/doc/{doc}",
+             "body": make_text(self.body_chars, seed=doc)}
+            for doc in picks
+        ]
+
+
+def make_text(chars: int, seed: int = 0) -> str:
+    """Deterministic filler prose of about chars characters"""
+    words = ["model", "patients", "diagnosis", "imaging", "triage", "clinical", "data", "accuracy",
+             "workflow", "risk", "outcomes", "hospital", "trial", "privacy", "bias", "deployment"]
+    rng = random.Random(seed)
+    sentences = []
+    length = 0
+    while length < chars:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(6, 14))).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)[:max(chars, 0)]
+
+
+def make_research_payload(chars: int, source_chars: int = 600) -> str:
+    """Research text of about chars characters, formatted like ResearchAgent's sources"""
+    sources = []
+    length = 0
+    while length < chars:
+        index = len(sources) + 1
+        source = (f"Source {index}:\nTitle: Document {index}\nURL: https://example.org/doc/{index}\n"
+                  f"Content: {make_text(source_chars, seed=index)}")
+        sources.append(source)
+        length += len(source) + 2
+    return "\n\n".join(sources)
+
+
+def build_orchestrator(llm_latency: float, research_latency: float) -> EnhancedResearchOrchestrator:
+    """Orchestrator using the mock MCP research tools and stubbed LLM agents"""
+    orchestrator = EnhancedResearchOrchestrator(use_mcp=True)
+    mcp_server = orchestrator.research_agent.mcp_server
+    execute_tool = mcp_server.execute_tool
+
+    def slow_execute_tool(tool_name, parameters):
+        time.sleep(research_latency)
+        return execute_tool(tool_name, parameters)
+
+    mcp_server.execute_tool = slow_execute_tool
+    orchestrator.analysis_agent.agent = StubLLM(llm_latency, "Key themes: diagnostics, triage, imaging.")
+    orchestrator.summary_agent.agent = StubLLM(llm_latency, "AI is improving diagnostics and triage.")
+    return orchestrator
+
+
+def polling_process_topic(orchestrator: EnhancedResearchOrchestrator, topic: str, max_wait_time: float = 60):
+    """The pre-event-driven pipeline loop: drain every agent, then sleep for a second.
+
+    Research runs on its own thread here, as it would with any agent working
+    independently of the caller; that is the case the polling loop exists for.
+    """
+    request_id = uuid.uuid4().hex[:16]
+    result_future = orchestrator.summary_agent.result_future(request_id)
+    threading.Thread(target=orchestrator.research_agent.execute, args=(topic,),
+                     kwargs={"trace_id": request_id}).start()
+    start_time = time.time()
+    while time.time() - start_time < max_wait_time:
+        orchestrator.analysis_agent.process_messages()
+        orchestrator.summary_agent.process_messages()
+        if result_future.done():
+            return result_future.result()
+        time.sleep(1)
+    orchestrator.summary_agent.release_result(request_id)
+    return None
+
+
+def run(label: str, func, topics):
+    latencies = []
+    for topic in topics:
+        started = time.perf_counter()
+        func(topic)
+        latencies.append(time.perf_counter() - started)
+    print(f"{label:<14} mean {statistics.mean(latencies) * 1000:8.1f} ms   "
+          f"max {max(latencies) * 1000:8.1f} ms   ({len(latencies)} topics)")
+    return latencies
+
+
+def measure_startup(runs: int = 5) -> Dict[str, Any]:
+    """Time STARTUP_SNIPPET in fresh interpreters and break down its imports.
+
+    Returns the median wall time, import time per root package (from the
+    last run) and any DEFERRED_MODULES that were loaded.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    walls = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SNIPPET],
+                              cwd=here, capture_output=True, text=True)
+        walls.append(time.perf_counter() - started)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Startup snippet failed:\n{proc.stderr[-2000:]}")
+
+    # Self time summed per root package, e.g. everything under pydantic.*
+    by_package: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header row
+        package = name.strip().split(".")[0]
+        by_package[package] = by_package.get(package, 0.0) + int(self_us) / 1_000_000
+
+    return {
+        "wall": statistics.median(walls),
+        "import_seconds": sum(by_package.values()),
+        "top_imports": sorted(by_package.items(), key=lambda item: item[1], reverse=True),
+        "deferred_loaded": [module for module in DEFERRED_MODULES if module in by_package]
+    }
+
+
+def startup_report(runs: int, budget: float, check: bool) -> int:
+    """Print the startup breakdown; with check, return 1 on a budget or lazy-import regression"""
+    result = measure_startup(runs)
+    print(f"startup wall {result['wall'] * 1000:8.1f} ms (median of {runs})   "
+          f"imports {result['import_seconds'] * 1000:8.1f} ms   budget {budget * 1000:.0f} ms")
+    for module, seconds in result["top_imports"][:10]:
+        print(f"  {module:<32} {seconds * 1000:8.1f} ms")
+
+    failures = []
+    if result["wall"] > budget:
+        failures.append(f"startup took {result['wall'] * 1000:.1f} ms, budget is {budget * 1000:.0f} ms")
+    if result["deferred_loaded"]:
+        failures.append(f"imported at startup: {', '.join(result['deferred_loaded'])}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if check and failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline latency benchmark")
+    parser.add_argument("--topics", type=int, default=3, help="Number of topics to run per mode")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stubbed LLM latency in seconds")
+    parser.add_argument("--research-latency", type=float, default=0.1, help="Stubbed MCP tool latency in seconds")
+    parser.add_argument("--startup", action="store_true", help="Measure CLI startup instead of pipeline latency")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters to time for --startup")
+    parser.add_argument("--startup-budget", type=float, default=1.5, help="Startup wall time budget in seconds")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero if --startup exceeds its budget")
+    args = parser.parse_args()
+
+    if args.startup:
+        return startup_report(args.startup_runs, args.startup_budget, args.check)
+
+    topics = [f"benchmark topic {i}" for i in range(args.topics)]
+
+    orchestrator = build_orchestrator(args.llm_latency, args.research_latency)
+    event_driven = run("event-driven", orchestrator.process_topic, topics)
+
+    # Same agents, but without delivery callbacks, driven by the old polling loop
+    orchestrator.message_queue.unsubscribe(orchestrator.analysis_agent.agent_name)
+    orchestrator.message_queue.unsubscribe(orchestrator.summary_agent.agent_name)
+    polling = run("polling", lambda topic: polling_process_topic(orchestrator, topic), topics)
+
+    saved = statistics.mean(polling) - statistics.mean(event_driven)
+    print(f"End-to-end latency saved per topic: {saved * 1000:.1f} ms")
+
+    orchestrator = build_orchestrator(args.llm_latency, args.research_latency)
+    ttfb = []
+    for topic in topics:
+        for event in orchestrator.process_topic_stream(topic):
+            if event["event"] == "done":
+                ttfb.append(event["ttfb"])
+    print(f"{'streaming':<14} time to first summary token {statistics.mean(ttfb) * 1000:8.1f} ms")
+
+    # The per-call deadline holds while a stage is still working
+    deadline = 0.25
+    orchestrator = build_orchestrator(max(1.0, deadline * 4), args.research_latency)
+    started = time.perf_counter()
+    result = orchestrator.process_topic("benchmark timeout topic", timeout=deadline)
+    elapsed = time.perf_counter() - started
+    status = "timed out" if result.startswith("ERROR: Pipeline timeout") else "completed"
+    print(f"{'timeout':<14} {status} after {elapsed * 1000:8.1f} ms (deadline {deadline * 1000:.0f} ms)")
+    orchestrator.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""
+Offline benchmark suite for the research pipeline.
+
+Runs the full pipeline against deterministic stand-ins for the LLM and the
+web search backend (see benchmark.py), so no API key or network access is
+needed and repeated runs are comparable. Measures:
+
+- end-to-end latency percentiles and per-stage latency (research,
+  analysis, summary) for topics run one at a time
+- throughput in topics/sec for process_topics() at several concurrency levels
+- MessageQueue / AsyncMessageQueue cost per operation, and the durable
+  SQLite queue with batched and per-write commits, with a research-sized
+  payload inline and by blob store reference
+- peak traced memory while a batch runs
+- offline text processing (keyphrase analysis, extractive summaries) on
+  research-formatted text
+
+Results are written as JSON; --compare checks them against an earlier run
+and exits non-zero if any metric regressed by more than --tolerance.
+
+    python benchmark_suite.py --output baseline.json
+    python benchmark_suite.py --compare baseline.json --output current.json
+    python benchmark_suite.py --queue-backend sqlite   # pipeline runs on the durable queue
+    python benchmark_suite.py --stage-processes 4 --busy-llm   # CPU-bound stages in worker processes
+    python benchmark_suite.py --fanout 4 --pipelined   # analysis starts on partial research
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+# Every run pays for its searches and model calls
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+from benchmark import StubLLM, StubSearchBackend, install_stub_llm, make_research_payload
+from blob_store import BlobRef, FileBlobStore
+from communication import AgentMessage, AsyncMessageQueue, MessageQueue
+from config import config
+from dedup import SourceDeduplicator
+from durable_queue import DurableMessageQueue
+from enhanced_orchestrator import EnhancedResearchOrchestrator
+from text_analysis import analyze_text, summarize
+
+# Metrics where a larger value is better; everything else is a cost
+HIGHER_IS_BETTER = ("throughput",)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p90/p99 (nearest rank), mean and max of samples"""
+    ordered = sorted(samples)
+
+    def rank(pct: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+    return {"p50": rank(50), "p90": rank(90), "p99": rank(99),
+            "mean": statistics.mean(ordered), "max": ordered[-1]}
+
+
+class StageClock:
+    """Message queue observer recording when each topic's stage results are sent"""
+
+    def __init__(self):
+        self.marks: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, message: AgentMessage):
+        topic = message.content.get("topic") if isinstance(message.content, dict) else None
+        with self._lock:
+            self.marks.setdefault(topic, {})[message.message_type] = time.perf_counter()
+
+
+def build_orchestrator(args) -> EnhancedResearchOrchestrator:
+    """Orchestrator using the standard research agent with every outbound call stubbed"""
+    # The same stubs are installed in stage worker processes, if any
+    stub = functools.partial(install_stub_llm, latency=args.llm_latency, response_chars=args.response_chars,
+                             jitter=args.jitter, seed=args.seed, busy=args.busy_llm)
+    orchestrator = EnhancedResearchOrchestrator(use_mcp=False, worker_initializer=stub)
+    research = orchestrator.research_agent
+    research.search_backend = StubSearchBackend(args.search_latency, args.jitter, body_chars=args.body_chars,
+                                                seed=args.seed)
+    research.fanout_queries = args.fanout
+    research.agent = StubLLM(args.llm_latency, make_research_payload(args.research_chars), args.jitter, args.seed)
+    stub(orchestrator.analysis_agent)
+    stub(orchestrator.summary_agent)
+    return orchestrator
+
+
+def bench_latency(args) -> Dict[str, Any]:
+    """Run topics one at a time, recording end-to-end and per-stage latency"""
+    orchestrator = build_orchestrator(args)
+    clock = StageClock()
+    orchestrator.message_queue.add_observer(clock)
+
+    end_to_end, stages = [], {"research": [], "analysis": [], "summary": []}
+    try:
+        for i in range(args.topics):
+            topic = f"latency topic {i}"
+            started = time.perf_counter()
+            orchestrator.process_topic(topic)
+            finished = time.perf_counter()
+            marks = clock.marks.get(topic, {})
+            end_to_end.append(finished - started)
+            # Messages sent from worker processes aren't observed here, so stages may be missing
+            if "research_data" in marks and "analysis" in marks:
+                stages["research"].append(marks["research_data"] - started)
+                stages["analysis"].append(marks["analysis"] - marks["research_data"])
+                stages["summary"].append(finished - marks["analysis"])
+    finally:
+        orchestrator.shutdown()
+
+    return {
+        "end_to_end": percentiles(end_to_end),
+        "stages": {stage: percentiles(samples) for stage, samples in stages.items() if samples}
+    }
+
+
+def bench_throughput(args) -> Dict[str, float]:
+    """Topics per second through process_topics() at each concurrency level"""
+    throughput = {}
+    for level in args.concurrency:
+        orchestrator = build_orchestrator(args)
+        topics = [f"throughput topic {level}-{i}" for i in range(max(args.topics, level * 2))]
+        try:
+            started = time.perf_counter()
+            orchestrator.process_topics(topics, concurrency=level)
+            throughput[str(level)] = len(topics) / (time.perf_counter() - started)
+        finally:
+            orchestrator.shutdown()
+    return throughput
+
+
+def bench_queue(args) -> Dict[str, float]:
+    """Microseconds per send+receive pair on the sync and async queues"""
+    message = AgentMessage(sender="benchmark", receiver="sink", content={"topic": "queue"},
+                           message_type="research_data", timestamp="0")
+    count = args.queue_ops
+    results = {}
+
+    queue = MessageQueue()
+    started = time.perf_counter()
+    for _ in range(count):
+        queue.send_message(message)
+        queue.receive_message("sink")
+    results["send_receive_us"] = (time.perf_counter() - started) / count * 1e6
+
+    queue.subscribe("sink", lambda: None)
+    queue.add_observer(lambda message: None)
+    started = time.perf_counter()
+    for _ in range(count):
+        queue.send_message(message)
+        queue.receive_message("sink")
+    results["send_receive_observed_us"] = (time.perf_counter() - started) / count * 1e6
+
+    queue = MessageQueue()
+    started = time.perf_counter()
+    for _ in range(count):
+        queue.send_message(message)
+    for _ in range(count):
+        queue.receive_message("sink")
+    results["burst_send_receive_us"] = (time.perf_counter() - started) / count * 1e6
+
+    async def async_round_trips() -> float:
+        async_queue = AsyncMessageQueue()
+        started = time.perf_counter()
+        for _ in range(count):
+            await async_queue.send_message(message)
+            async_queue.receive_nowait("sink")
+        return time.perf_counter() - started
+
+    results["async_send_receive_us"] = asyncio.run(async_round_trips()) / count * 1e6
+
+    # Durable queue: a receive commits a still-uncommitted send, so round trips pay one
+    # commit per message; bursts share a commit per QUEUE_PREFETCH claims
+    with tempfile.TemporaryDirectory() as directory:
+        for name, interval in (("durable", config.QUEUE_COMMIT_INTERVAL), ("durable_unbatched", 0.0)):
+            durable = DurableMessageQueue(os.path.join(directory, f"{name}.sqlite3"), commit_interval=interval)
+            started = time.perf_counter()
+            for _ in range(count):
+                durable.send_message(message)
+                durable.ack(durable.receive_message("sink"))
+            results[f"{name}_send_receive_ack_us"] = (time.perf_counter() - started) / count * 1e6
+
+            started = time.perf_counter()
+            for _ in range(count):
+                durable.send_message(message)
+            for _ in range(count):
+                durable.ack(durable.receive_message("sink"))
+            results[f"{name}_burst_send_receive_ack_us"] = (time.perf_counter() - started) / count * 1e6
+            durable.close()
+
+        # A research-sized payload inline in the row, and by reference to a file blob
+        payload = make_research_payload(args.research_chars)
+        blobs = FileBlobStore(os.path.join(directory, "blobs"))
+        durable = DurableMessageQueue(os.path.join(directory, "payload.sqlite3"))
+        rounds = max(1, count // 20)
+        for name, wrap in (("inline", lambda: payload), ("blob", lambda: blobs.put(payload))):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                durable.send_message(message.model_copy(update={"content": {"topic": "queue", "research_data": wrap()}}))
+                received = durable.receive_message("sink")
+                resolve_with(blobs, received.content["research_data"])
+                durable.ack(received)
+            results[f"durable_payload_{name}_us"] = (time.perf_counter() - started) / rounds * 1e6
+        durable.close()
+    return results
+
+
+def resolve_with(blobs: FileBlobStore, value) -> str:
+    ref = BlobRef.from_value(value)
+    return blobs.text(ref) if ref is not None else value
+
+
+def bench_memory(args) -> Dict[str, int]:
+    """Peak memory allocated by Python while a batch of topics runs"""
+    orchestrator = build_orchestrator(args)
+    topics = [f"memory topic {i}" for i in range(args.topics)]
+    tracemalloc.start()
+    try:
+        orchestrator.process_topics(topics)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        orchestrator.shutdown()
+    return {"peak_bytes": peak}
+
+
+def bench_text(args) -> Dict[str, float]:
+    """Milliseconds per call of the offline text engines on research-formatted text"""
+    results = {}
+    for name, chars in (("100kb", 100_000), ("1mb", 1_000_000)):
+        text = make_research_payload(chars, source_chars=args.body_chars)
+        analyze_text(text)
+        rounds = 5
+        started = time.perf_counter()
+        for _ in range(rounds):
+            analyze_text(text)
+        results[f"keyphrases_{name}_ms"] = (time.perf_counter() - started) / rounds * 1000
+    # The summary stage sees a research digest plus the analysis, a few KB per topic
+    for name, chars in (("4kb", 4_000), ("100kb", 100_000)):
+        text = make_research_payload(chars, source_chars=args.body_chars)
+        summarize(text)
+        rounds = 5
+        started = time.perf_counter()
+        for _ in range(rounds):
+            summarize(text)
+        results[f"textrank_{name}_ms"] = (time.perf_counter() - started) / rounds * 1000
+    # A fresh index per round, so every source of the megabyte is fingerprinted and compared
+    text = make_research_payload(1_000_000, source_chars=args.body_chars)
+    SourceDeduplicator().dedup("warmup", text)
+    rounds = 5
+    elapsed = 0.0
+    for _ in range(rounds):
+        deduplicator = SourceDeduplicator()
+        started = time.perf_counter()
+        deduplicator.dedup("benchmark", text)
+        elapsed += time.perf_counter() - started
+    results["dedup_1mb_ms"] = elapsed / rounds * 1000
+    return results
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Numeric metrics as dotted paths, e.g. latency.end_to_end.p50"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print metric changes against baseline and return the regressions beyond tolerance"""
+    now, before = flatten(current["metrics"]), flatten(baseline["metrics"])
+    regressions = []
+    print(f"\n{'metric':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(now.keys() & before.keys()):
+        old, new = before[name], now[name]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if name.startswith(HIGHER_IS_BETTER) else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        print(f"{name:<44} {old:12.4f} {new:12.4f} {change:+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite with stubbed LLM and search")
+    parser.add_argument("--topics", type=int, default=20, help="Topics per latency, throughput and memory run")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")],
+                        default=[1, 2, 4, 8], help="Comma-separated process_topics() concurrency levels")
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="Stubbed LLM latency in seconds")
+    parser.add_argument("--search-latency", type=float, default=0.01, help="Stubbed search latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency jitter as a fraction of the latency")
+    parser.add_argument("--fanout", type=int, default=1, help="Search queries per topic (1 = LLM-driven research)")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Stream fan-out research to analysis in batches (needs --fanout > 1)")
+    parser.add_argument("--research-chars", type=int, default=8000, help="Research payload size for LLM-driven research")
+    parser.add_argument("--body-chars", type=int, default=400, help="Body size of each stubbed search result")
+    parser.add_argument("--response-chars", type=int, default=1200, help="Analysis and summary response size")
+    parser.add_argument("--queue-ops", type=int, default=20000, help="Operations per queue microbenchmark")
+    parser.add_argument("--queue-backend", choices=["memory", "sqlite"], default="memory",
+                        help="Message queue backend for the pipeline runs")
+    parser.add_argument("--stage-processes", type=int, default=0,
+                        help="Run analysis and summary in this many worker processes each (implies sqlite queue)")
+    parser.add_argument("--busy-llm", action="store_true",
+                        help="Stubbed analysis/summary latency spins the CPU instead of sleeping")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency jitter and stub content")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression per metric")
+    args = parser.parse_args()
+
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "tolerance")}
+    results = {
+        "meta": {"commit": git_commit(), "python": platform.python_version(),
+                 "platform": platform.platform(), "created": time.time(), "params": params},
+        "metrics": {}
+    }
+    metrics = results["metrics"]
+
+    queue_dir = tempfile.TemporaryDirectory()
+    config.QUEUE_BACKEND = "sqlite" if args.stage_processes else args.queue_backend
+    config.ANALYSIS_PROCESSES = config.SUMMARY_PROCESSES = args.stage_processes
+    config.QUEUE_PATH = os.path.join(queue_dir.name, "message_queue.sqlite3")
+    config.RESEARCH_PIPELINED = args.pipelined
+
+    metrics["latency"] = bench_latency(args)
+    end_to_end = metrics["latency"]["end_to_end"]
+    print(f"latency        p50 {end_to_end['p50'] * 1000:8.1f} ms   p90 {end_to_end['p90'] * 1000:8.1f} ms   "
+          f"p99 {end_to_end['p99'] * 1000:8.1f} ms")
+    for stage, stats in metrics["latency"]["stages"].items():
+        print(f"  {stage:<12} p50 {stats['p50'] * 1000:8.1f} ms   p90 {stats['p90'] * 1000:8.1f} ms")
+
+    metrics["throughput"] = bench_throughput(args)
+    for level, rate in metrics["throughput"].items():
+        print(f"throughput     concurrency {level:>3}   {rate:8.2f} topics/s")
+
+    metrics["queue"] = bench_queue(args)
+    for name, cost in metrics["queue"].items():
+        print(f"queue          {name:<28} {cost:8.2f} us")
+
+    metrics["memory"] = bench_memory(args)
+    print(f"memory         peak {metrics['memory']['peak_bytes'] / 1e6:8.2f} MB")
+
+    metrics["text"] = bench_text(args)
+    for name, cost in metrics["text"].items():
+        print(f"text           {name:<28} {cost:8.2f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("params") != params:
+            print("Warning: baseline was recorded with different parameters")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Content-addressed store for large message payloads.
+
+Research text can run to megabytes. Instead of carrying it inside every
+AgentMessage (and serializing it into every durable queue row), the sender
+stores it once and the message carries a BlobRef: a small handle holding the
+SHA-256 digest and size. Receivers read the payload back with resolve().
+
+- MemoryBlobStore keeps payloads in process, reference counted, for the
+  in-memory queue.
+- FileBlobStore writes one file per digest and reads them through read-only
+  mmaps, so worker processes sharing the durable queue read the page cache
+  directly. Messages may be redelivered after a crash, so files are not
+  deleted on release; blobs unused for BLOB_TTL seconds are pruned instead.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+from config import config
+
+# Serialized form of a BlobRef, e.g. in durable queue rows
+REF_KEY = "$blob"
+
+
+class BlobRef:
+    """Handle to a stored payload"""
+    __slots__ = ("digest", "size")
+
+    def __init__(self, digest: str, size: int):
+        self.digest = digest
+        self.size = size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {REF_KEY: self.digest, "size": self.size}
+
+    @classmethod
+    def from_value(cls, value: Any) -> Optional["BlobRef"]:
+        """The BlobRef held in value (a handle or its serialized dict), or None"""
+        if isinstance(value, BlobRef):
+            return value
+        if isinstance(value, dict) and REF_KEY in value:
+            return cls(value[REF_KEY], value.get("size", 0))
+        return None
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, BlobRef) and other.digest == self.digest
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __repr__(self) -> str:
+        return f"BlobRef({self.digest[:12]}, {self.size} bytes)"
+
+
+class BlobNotFoundError(KeyError):
+    """Raised when a handle refers to a payload that is no longer stored"""
+    pass
+
+
+def _encode(data: Union[str, bytes]) -> bytes:
+    return data.encode("utf-8") if isinstance(data, str) else bytes(data)
+
+
+class MemoryBlobStore:
+    """In-process blob store; a payload is dropped when its last reference is released"""
+
+    def __init__(self):
+        # Payloads are kept as given: text() on a str payload returns the original object, uncopied
+        self._blobs: Dict[str, Union[str, bytes]] = {}
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"puts": 0, "deduplicated": 0, "reads": 0, "released": 0}
+
+    def put(self, data: Union[str, bytes]) -> BlobRef:
+        payload = _encode(data)
+        digest = hashlib.sha256(payload).hexdigest()
+        with self._lock:
+            self._stats["puts"] += 1
+            if digest in self._blobs:
+                self._stats["deduplicated"] += 1
+            else:
+                self._blobs[digest] = data if isinstance(data, str) else payload
+            self._refs[digest] = self._refs.get(digest, 0) + 1
+        return BlobRef(digest, len(payload))
+
+    def _get(self, ref: BlobRef) -> Union[str, bytes]:
+        with self._lock:
+            payload = self._blobs.get(ref.digest)
+            self._stats["reads"] += 1
+        if payload is None:
+            raise BlobNotFoundError(ref.digest)
+        return payload
+
+    def view(self, ref: BlobRef) -> memoryview:
+        """Read-only view of the payload's bytes (zero-copy for payloads stored as bytes)"""
+        payload = self._get(ref)
+        return memoryview(_encode(payload) if isinstance(payload, str) else payload)
+
+    def text(self, ref: BlobRef) -> str:
+        payload = self._get(ref)
+        return payload if isinstance(payload, str) else str(payload, "utf-8")
+
+    def release(self, ref: BlobRef):
+        with self._lock:
+            count = self._refs.get(ref.digest, 0) - 1
+            if count > 0:
+                self._refs[ref.digest] = count
+                return
+            self._refs.pop(ref.digest, None)
+            if self._blobs.pop(ref.digest, None) is not None:
+                self._stats["released"] += 1
+
+    def __contains__(self, ref: BlobRef) -> bool:
+        return ref.digest in self._blobs
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "backend": "memory", "blobs": len(self._blobs),
+                    "bytes": sum(len(payload) for payload in self._blobs.values())}
+
+
+class FileBlobStore:
+    """Blob store with one file per digest, shared by every process using the same directory"""
+
+    def __init__(self, directory: str, ttl: float = 86400.0):
+        self.directory = directory
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._stats = {"puts": 0, "deduplicated": 0, "reads": 0, "pruned": 0}
+        os.makedirs(directory, exist_ok=True)
+        self.prune()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, data: Union[str, bytes]) -> BlobRef:
+        payload = _encode(data)
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self._path(digest)
+        with self._lock:
+            self._stats["puts"] += 1
+        if os.path.exists(path):
+            # Refresh the mtime so the blob survives the next prune
+            os.utime(path)
+            with self._lock:
+                self._stats["deduplicated"] += 1
+            return BlobRef(digest, len(payload))
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers in other processes never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return BlobRef(digest, len(payload))
+
+    def view(self, ref: BlobRef) -> memoryview:
+        """Read-only view backed by an mmap of the blob file; pages are loaded on access"""
+        try:
+            with open(self._path(ref.digest), "rb") as f:
+                if ref.size == 0 or os.fstat(f.fileno()).st_size == 0:
+                    return memoryview(b"")
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            raise BlobNotFoundError(ref.digest) from None
+        with self._lock:
+            self._stats["reads"] += 1
+        return memoryview(mapped)
+
+    def text(self, ref: BlobRef) -> str:
+        view = self.view(ref)
+        try:
+            return str(view, "utf-8")
+        finally:
+            view.release()
+
+    def release(self, ref: BlobRef):
+        # A redelivered message may still need the file; prune() removes it once unused
+        pass
+
+    def prune(self) -> int:
+        """Delete blobs not written or reused for ttl seconds, returning how many"""
+        if not self.ttl:
+            return 0
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        if removed:
+            self.logger.info("Pruned %s unused blob(s) from %s", removed, self.directory)
+            with self._lock:
+                self._stats["pruned"] += removed
+        return removed
+
+    def __contains__(self, ref: BlobRef) -> bool:
+        return os.path.exists(self._path(ref.digest))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "backend": "file", "directory": self.directory}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Shared blob store selected by BLOB_STORE, or None when disabled"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = config.BLOB_STORE
+            if backend == "auto":
+                # Durable queue rows outlive the process, so their payloads must too
+                backend = "file" if config.QUEUE_BACKEND == "sqlite" else "memory"
+            if backend == "memory":
+                _store = MemoryBlobStore()
+            elif backend == "file":
+                _store = FileBlobStore(config.BLOB_STORE_PATH, config.BLOB_TTL)
+            elif backend != "off":
+                raise ValueError(f"Unknown BLOB_STORE: {config.BLOB_STORE}")
+        return _store
+
+
+def store_large(value: Any) -> Any:
+    """A BlobRef for text of at least BLOB_MIN_CHARS, otherwise value unchanged"""
+    if not isinstance(value, str) or len(value) < config.BLOB_MIN_CHARS:
+        return value
+    store = get_blob_store()
+    return store.put(value) if store is not None else value
+
+
+def resolve(value: Any) -> Any:
+    """The payload behind a BlobRef (or its serialized dict); any other value unchanged"""
+    ref = BlobRef.from_value(value)
+    if ref is None:
+        return value
+    store = get_blob_store()
+    if store is None:
+        raise BlobNotFoundError(ref.digest)
+    return store.text(ref)
+
+
+def release_refs(content: Any):
+    """Release every BlobRef among a message content dict's values"""
+    if not isinstance(content, dict):
+        return
+    store = None
+    for value in content.values():
+        ref = BlobRef.from_value(value)
+        if ref is not None:
+            store = store or get_blob_store()
+            if store is not None:
+                store.release(ref)
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from metrics import inc
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with an optional per-entry TTL"""
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None) -> int:
+        """Store value, returning the number of entries evicted to make room"""
+        if self.max_entries <= 0:
+            return 0
+        if expires_at is None and self.ttl:
+            expires_at = time.time() + self.ttl
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Persistent key/value cache in SQLite with TTL and LRU eviction by count and size"""
+
+    def __init__(self, path: str, table: str = "cache", ttl: Optional[float] = None,
+                 max_entries: int = 0, max_bytes: int = 0):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL, meta TEXT)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return {"value": ..., "meta": ..., "created_at": ...} for a live entry, or None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at, meta FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at, meta = row
+            if self.ttl and created_at + self.ttl < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return {"value": json.loads(value), "meta": json.loads(meta) if meta else {}, "created_at": created_at}
+
+    def set(self, key: str, value: Any, meta: Optional[Dict[str, Any]] = None) -> int:
+        """Store a JSON-serializable value, returning the number of entries evicted"""
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, accessed_at, meta) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now, json.dumps(meta) if meta else None)
+            )
+            evicted = self._evict(now)
+            self._conn.commit()
+        return evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def _evict(self, now: float) -> int:
+        """Drop expired entries, then least recently used ones until within limits"""
+        evicted = 0
+        if self.ttl:
+            evicted += self._conn.execute(
+                f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl,)
+            ).rowcount
+        if self.max_entries:
+            evicted += self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+            ).rowcount
+        if self.max_bytes:
+            total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._conn.execute(
+                    f"SELECT key, size FROM {self.table} ORDER BY accessed_at ASC"
+                ).fetchall()
+                doomed = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", doomed)
+                evicted += len(doomed)
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SearchCache:
+    """Two-tier (memory LRU + SQLite) cache of web search results"""
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 3600,
+                 memory_entries: int = 256, max_entries: int = 10000):
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self.memory = LRUCache(max_entries=memory_entries, ttl=ttl)
+        self.disk = SQLiteCache(path, table="search_results", ttl=ttl, max_entries=max_entries) if path else None
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "SearchCache":
+        return cls(
+            path=config.SEARCH_CACHE_PATH or None,
+            ttl=config.SEARCH_CACHE_TTL,
+            memory_entries=config.SEARCH_CACHE_MEMORY_ENTRIES,
+            max_entries=config.SEARCH_CACHE_MAX_ENTRIES
+        )
+
+    @staticmethod
+    def make_key(query: str, max_results: int) -> str:
+        normalized = " ".join(query.lower().split())
+        return hashlib.sha256(f"{normalized}\x00{max_results}".encode("utf-8")).hexdigest()
+
+    def get(self, query: str, max_results: int):
+        key = self.make_key(query, max_results)
+        results = self.memory.get(key)
+        if results is not None:
+            self._count("memory_hits")
+            return results
+
+        entry = self.disk.get(key) if self.disk else None
+        if entry is not None:
+            self._count("disk_hits")
+            # Promote to memory without extending the entry's original lifetime
+            self.memory.set(key, entry["value"], expires_at=entry["created_at"] + self.ttl if self.ttl else None)
+            return entry["value"]
+
+        self._count("misses")
+        return None
+
+    def set(self, query: str, max_results: int, results):
+        key = self.make_key(query, max_results)
+        evicted = self.memory.set(key, results)
+        if self.disk:
+            evicted += self.disk.set(key, results, meta={"query": query})
+        self._count("stores")
+        self._count("evictions", evicted)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk:
+            self.disk.clear()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+        inc("cache_events_total", amount, cache="search", event=name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        if self.disk:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+class ResponseCache:
+    """Content-addressed cache of LLM responses keyed by (model, role, normalized prompt).
+
+    Only successful model responses should be stored; callers must never
+    pass fallback or error results to set().
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50_000_000, max_entries: int = 5000,
+                 ttl: Optional[float] = None, memory_entries: int = 64):
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self.memory = LRUCache(max_entries=memory_entries, ttl=ttl)
+        self.disk = SQLiteCache(path, table="llm_responses", ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "bypassed": 0, "evictions": 0, "latency_saved": 0.0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "ResponseCache":
+        return cls(
+            path=config.LLM_CACHE_PATH,
+            max_bytes=config.LLM_CACHE_MAX_BYTES,
+            max_entries=config.LLM_CACHE_MAX_ENTRIES,
+            ttl=config.LLM_CACHE_TTL or None
+        )
+
+    @staticmethod
+    def make_key(model: str, role: str, prompt: str) -> str:
+        # Prompts are built from indented f-strings; whitespace differences don't change meaning
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(f"{model}\x00{role}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, role: str, prompt: str) -> Optional[str]:
+        key = self.make_key(model, role, prompt)
+        entry = self.memory.get(key)
+        if entry is None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry, expires_at=entry["created_at"] + self.ttl if self.ttl else None)
+        if entry is None:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        self._count("latency_saved", entry["meta"].get("latency", 0.0))
+        return entry["value"]
+
+    def set(self, model: str, role: str, prompt: str, response: str, latency: float = 0.0):
+        """Store a successful model response and how long it took to produce"""
+        key = self.make_key(model, role, prompt)
+        meta = {"latency": latency, "model": model, "role": role}
+        evicted = self.disk.set(key, response, meta=meta)
+        self.memory.set(key, {"value": response, "meta": meta})
+        self._count("stores")
+        self._count("evictions", evicted)
+
+    def record_bypass(self):
+        self._count("bypassed")
+
+    def _count(self, name: str, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+        if name == "latency_saved":
+            inc("llm_cache_latency_saved_seconds_total", amount)
+        else:
+            inc("cache_events_total", amount, cache="llm", event=name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["disk"] = self.disk.stats()
+        return stats
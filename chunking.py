@@ -0,0 +1,101 @@
+import math
+import re
+from typing import List
+
+# Rough tokens-per-character ratio for English prose with common BPE tokenizers.
+# Budgets only need to be conservative, not exact, so no tokenizer is loaded.
+CHARS_PER_TOKEN = 4
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Conservative token count estimate for budgeting prompts"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_units(text: str, max_tokens: int) -> List[str]:
+    """Split text into units no larger than max_tokens.
+
+    Paragraphs (and so "Source N:" blocks) are kept whole when they fit,
+    otherwise split on sentence boundaries; only a single oversized
+    sentence is cut mid-text.
+    """
+    units = []
+    for paragraph in _PARAGRAPH_BREAK.split(text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            if estimate_tokens(sentence) <= max_tokens:
+                units.append(sentence)
+                continue
+            width = max_tokens * CHARS_PER_TOKEN
+            units.extend(sentence[i:i + width] for i in range(0, len(sentence), width))
+    return units
+
+
+def pack(units: List[str], max_tokens: int, separator: str = "\n\n") -> List[str]:
+    """Greedily join consecutive units into chunks of at most max_tokens"""
+    chunks = []
+    current: List[str] = []
+    size = 0
+    separator_tokens = estimate_tokens(separator)
+    for unit in units:
+        tokens = estimate_tokens(unit)
+        if current and size + separator_tokens + tokens > max_tokens:
+            chunks.append(separator.join(current))
+            current, size = [], 0
+        size += tokens + (separator_tokens if current else 0)
+        current.append(unit)
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def chunk_text(text: str, max_tokens: int) -> List[str]:
+    """Split text into token-budgeted chunks on source, paragraph and sentence boundaries"""
+    if estimate_tokens(text) <= max_tokens:
+        return [text] if text.strip() else []
+    return pack(split_units(text, max_tokens), max_tokens)
+
+
+def build_digest(text: str, max_tokens: int) -> str:
+    """Fit text into max_tokens while covering every paragraph.
+
+    Text that already fits is returned unchanged. Otherwise sentences are
+    taken round-robin from each paragraph (leading sentences first), so
+    every source contributes before any one source is covered in depth,
+    and the picked sentences are emitted in their original order.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    paragraphs = [
+        [sentence for sentence in _SENTENCE_END.split(paragraph.strip()) if sentence]
+        for paragraph in _PARAGRAPH_BREAK.split(text.strip()) if paragraph.strip()
+    ]
+    picked = [0] * len(paragraphs)
+    budget = max_tokens
+    progress = True
+    while progress:
+        progress = False
+        for index, sentences in enumerate(paragraphs):
+            if picked[index] >= len(sentences):
+                continue
+            cost = estimate_tokens(sentences[picked[index]]) + 1
+            if cost > budget:
+                continue
+            budget -= cost
+            picked[index] += 1
+            progress = True
+
+    digest = [" ".join(sentences[:count]) for sentences, count in zip(paragraphs, picked) if count]
+    if not digest:
+        # Not even one whole sentence fits; fall back to a hard cut
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return "\n\n".join(digest)
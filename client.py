@@ -0,0 +1,115 @@
+"""
+Thin client for server.py.
+
+Submits topics to a running research server and prints the summary as it
+streams back. Only the standard library and config are imported, so a
+request costs a socket round trip rather than building the agent system.
+
+    python client.py "Artificial intelligence in healthcare"
+    python client.py --stats
+    python client.py --metrics prometheus
+"""
+import argparse
+import json
+import socket
+import sys
+from typing import Any, Dict, Iterator, Optional
+
+from config import config
+
+
+class ResearchClient:
+    """Client for the research server's JSON-lines protocol"""
+
+    def __init__(self, socket_path: Optional[str] = None, host: Optional[str] = None,
+                 port: Optional[int] = None, connect_timeout: float = 5.0):
+        self.socket_path = config.SERVER_SOCKET if socket_path is None else socket_path
+        self.host = host or config.SERVER_HOST
+        self.port = port or config.SERVER_PORT
+        self.connect_timeout = connect_timeout
+
+    def stream(self, topic: str, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Yield the server's events for topic as they arrive"""
+        request = {"topic": topic}
+        if timeout is not None:
+            request["timeout"] = timeout
+        return self._request(request)
+
+    def research(self, topic: str, timeout: Optional[float] = None) -> str:
+        """Return the complete summary for topic, raising RuntimeError on a pipeline error"""
+        tokens = []
+        for event in self.stream(topic, timeout):
+            if event["event"] == "token":
+                tokens.append(event["text"])
+            elif event["event"] == "error":
+                raise RuntimeError(event.get("error", "Research failed"))
+        return "".join(tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        for event in self._request({"command": "stats"}):
+            return event
+        return {}
+
+    def metrics(self, format: str = "json"):
+        """Server metrics as Prometheus text or a JSON snapshot"""
+        for event in self._request({"command": "metrics", "format": format}):
+            if event["event"] == "error":
+                raise RuntimeError(event.get("error"))
+            return event["body"]
+        return None
+
+    def _connect(self) -> socket.socket:
+        if self.socket_path:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.connect_timeout)
+            sock.connect(self.socket_path)
+        else:
+            sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        # The server enforces the pipeline timeout; reads wait as long as it takes
+        sock.settimeout(None)
+        return sock
+
+    def _request(self, request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        with self._connect() as sock:
+            sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with sock.makefile("r", encoding="utf-8") as lines:
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Submit topics to a running research server")
+    parser.add_argument("topics", nargs="*", help="Topics to research")
+    parser.add_argument("--socket", help="Unix socket path (default: SERVER_SOCKET)")
+    parser.add_argument("--host", help="TCP host (default: SERVER_HOST)")
+    parser.add_argument("--port", type=int, help="TCP port (default: SERVER_PORT)")
+    parser.add_argument("--timeout", type=float, help="Pipeline timeout per topic in seconds")
+    parser.add_argument("--stats", action="store_true", help="Print server statistics")
+    parser.add_argument("--metrics", choices=["json", "prometheus"], help="Print server metrics in this format")
+    args = parser.parse_args()
+
+    client = ResearchClient(args.socket, args.host, args.port)
+    if args.stats:
+        print(json.dumps(client.stats(), indent=2))
+    if args.metrics:
+        body = client.metrics(args.metrics)
+        print(body if isinstance(body, str) else json.dumps(body, indent=2), end="" if isinstance(body, str) else "\n")
+    status = 0
+    for topic in args.topics:
+        print(f"\n{'=' * 60}\nRESEARCH: {topic}\n{'=' * 60}")
+        for event in client.stream(topic, args.timeout):
+            if event["event"] == "token":
+                print(event["text"], end="", flush=True)
+            elif event["event"] == "queued":
+                print("(queued, waiting for a free slot)", flush=True)
+            elif event["event"] == "done":
+                print(f"\n\n[first token {event['ttfb'] or 0:.2f}s, total {event['elapsed']:.2f}s]")
+            elif event["event"] == "error":
+                print(f"\nERROR: {event.get('error')}", file=sys.stderr)
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,281 @@
-from typing import Dict, Any, Optional
-from pydantic import BaseModel
-import logging
-from datetime import datetime
-
-class AgentMessage(BaseModel):
-    """Standard message format for agent communication"""
-    sender: str
-    receiver: str
-    content: Any
-    message_type: str  # "research_data", "analysis", "error", "retry"
-    timestamp: str
-    metadata: Dict[str, Any] = {}
-
-class MessageQueue:
-    """Simple in-memory message queue for agent communication"""
-    def __init__(self):
-        self.messages = []
-        self.logger = logging.getLogger(__name__)
-    
-    def send_message(self, message: AgentMessage):
-        """Send message between agents"""
-        self.messages.append(message)
-        self.logger.info(f"{message.sender} -> {message.receiver}: {message.message_type}")
-    
-    def receive_message(self, agent_name: str) -> Optional[AgentMessage]:
-        """Receive message for specific agent"""
-        for i, msg in enumerate(self.messages):
-            if msg.receiver == agent_name:
-                return self.messages.pop(i)
-        return None
\ No newline at end of file
+from typing import Dict, Any, Optional, List, Callable
+from pydantic import BaseModel
+from collections import deque
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from logging_setup import sampled
+from metrics import record_dequeue, stamp_outgoing
+
+class AgentMessage(BaseModel):
+    """Standard message format for agent communication"""
+    sender: str
+    receiver: str
+    content: Any
+    message_type: str  # "research_data", "research_partial", "analysis", "error", "retry"
+    timestamp: str
+    metadata: Dict[str, Any] = {}
+
+class QueueFullError(Exception):
+    """Raised when a receiver's queue is at capacity and the producer cannot wait"""
+    pass
+
+class MessageQueue:
+    """In-memory message queue with a separate FIFO per receiver"""
+    def __init__(self, max_size: int = 0, full_policy: str = "block", send_timeout: Optional[float] = None):
+        # max_size is a per-receiver capacity; 0 means unbounded
+        if full_policy not in ("block", "reject"):
+            raise ValueError(f"Unknown full_policy: {full_policy}")
+        self.max_size = max_size
+        self.full_policy = full_policy
+        self.send_timeout = send_timeout
+        self.logger = logging.getLogger(__name__)
+
+        self._queues: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._stats = {"sent": 0, "received": 0, "rejected": 0, "blocked": 0, "blocked_seconds": 0.0}
+        self._peak_depth: Dict[str, int] = {}
+        self._subscribers: Dict[str, List[Callable[[], None]]] = {}
+        self._observers: List[Callable[[AgentMessage], None]] = []
+
+    def subscribe(self, agent_name: str, callback: Callable[[], None]):
+        """Call callback whenever a message is delivered to agent_name"""
+        with self._lock:
+            self._subscribers.setdefault(agent_name, []).append(callback)
+
+    def unsubscribe(self, agent_name: str, callback: Optional[Callable[[], None]] = None):
+        """Remove one subscriber for agent_name, or all of them"""
+        with self._lock:
+            if callback is None:
+                self._subscribers.pop(agent_name, None)
+            elif callback in self._subscribers.get(agent_name, []):
+                self._subscribers[agent_name].remove(callback)
+
+    def add_observer(self, callback: Callable[[AgentMessage], None]):
+        """Call callback with every sent message, before its receiver is woken"""
+        with self._lock:
+            self._observers.append(callback)
+
+    def remove_observer(self, callback: Callable[[AgentMessage], None]):
+        with self._lock:
+            if callback in self._observers:
+                self._observers.remove(callback)
+
+    @property
+    def messages(self) -> List[AgentMessage]:
+        """Snapshot of all pending messages, oldest first per receiver"""
+        with self._lock:
+            return self._pending_messages()
+
+    def send_message(self, message: AgentMessage, block: Optional[bool] = None, timeout: Optional[float] = None):
+        """Send message between agents"""
+        if block is None:
+            block = self.full_policy == "block"
+        if timeout is None:
+            timeout = self.send_timeout
+        stamp_outgoing(message)
+
+        with self._lock:
+            if self.max_size and self._depth(message.receiver) >= self.max_size:
+                if not block:
+                    self._stats["rejected"] += 1
+                    raise QueueFullError(f"Queue for {message.receiver} is full ({self.max_size} messages)")
+
+                self._stats["blocked"] += 1
+                started = time.monotonic()
+                has_room = self._wait_for_room(message.receiver, timeout)
+                self._stats["blocked_seconds"] += time.monotonic() - started
+                if not has_room:
+                    self._stats["rejected"] += 1
+                    raise QueueFullError(f"Timed out after {timeout}s waiting for room in {message.receiver} queue")
+
+            self._append(message)
+            self._stats["sent"] += 1
+            depth = self._depth(message.receiver)
+            if depth > self._peak_depth.get(message.receiver, 0):
+                self._peak_depth[message.receiver] = depth
+            subscribers = list(self._subscribers.get(message.receiver, ()))
+            observers = list(self._observers)
+
+        self.logger.info("%s -> %s: %s", message.sender, message.receiver, message.message_type,
+                         extra=sampled("queue.send"))
+
+        for callback in observers:
+            try:
+                callback(message)
+            except Exception as e:
+                self.logger.error("Message observer failed: %s", e)
+
+        # Wake the consuming agent outside the lock so it can receive immediately
+        self._wake(message.receiver, subscribers)
+
+    def receive_message(self, agent_name: str) -> Optional[AgentMessage]:
+        """Receive message for specific agent"""
+        with self._lock:
+            message = self._pop(agent_name)
+            if message is None:
+                return None
+            self._stats["received"] += 1
+            if self.max_size:
+                self._not_full.notify_all()
+        record_dequeue(message, agent_name)
+        return message
+
+    def ack(self, message: AgentMessage):
+        """Mark a received message as fully processed.
+
+        In-memory messages are gone once received, so this is a no-op; a
+        durable queue redelivers messages that are never acknowledged.
+        """
+        pass
+
+    def close(self):
+        """Release the queue's resources; nothing to do in memory"""
+        pass
+
+    def depth(self, agent_name: Optional[str] = None) -> int:
+        """Number of pending messages for one receiver, or for all receivers"""
+        with self._lock:
+            if agent_name is not None:
+                return self._depth(agent_name)
+            return sum(self._depths().values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and throughput statistics"""
+        with self._lock:
+            return {
+                **self._stats,
+                "max_size": self.max_size,
+                "depth": self._depths(),
+                "peak_depth": dict(self._peak_depth),
+                "timestamp": datetime.now().isoformat()
+            }
+
+    def _wake(self, agent_name: str, subscribers: Optional[List[Callable[[], None]]] = None):
+        """Call agent_name's subscribers (outside the lock)"""
+        if subscribers is None:
+            with self._lock:
+                subscribers = list(self._subscribers.get(agent_name, ()))
+        for callback in subscribers:
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error("Subscriber for %s failed: %s", agent_name, e)
+
+    def _wait_for_room(self, receiver: str, timeout: Optional[float]) -> bool:
+        """Wait (holding the lock's condition) until receiver has room; False on timeout"""
+        return self._not_full.wait_for(lambda: self._depth(receiver) < self.max_size, timeout)
+
+    # Storage hooks, called with the lock held; durable backends override these
+
+    def _append(self, message: AgentMessage):
+        q = self._queues.get(message.receiver)
+        if q is None:
+            q = self._queues[message.receiver] = deque()
+        q.append(message)
+
+    def _pop(self, agent_name: str) -> Optional[AgentMessage]:
+        q = self._queues.get(agent_name)
+        return q.popleft() if q else None
+
+    def _depth(self, agent_name: str) -> int:
+        return len(self._queues.get(agent_name, ()))
+
+    def _depths(self) -> Dict[str, int]:
+        return {name: len(q) for name, q in self._queues.items()}
+
+    def _pending_messages(self) -> List[AgentMessage]:
+        return [msg for q in self._queues.values() for msg in q]
+
+
+class AsyncMessageQueue:
+    """asyncio counterpart of MessageQueue, one asyncio.Queue per receiver.
+
+    Must be created and used from a single event loop. Consumers await
+    receive_message() instead of being woken by subscriber callbacks.
+    """
+    def __init__(self, max_size: int = 0):
+        self.max_size = max_size
+        self.logger = logging.getLogger(__name__)
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._stats = {"sent": 0, "received": 0}
+
+    def _queue(self, agent_name: str) -> asyncio.Queue:
+        q = self._queues.get(agent_name)
+        if q is None:
+            q = self._queues[agent_name] = asyncio.Queue(maxsize=self.max_size)
+        return q
+
+    async def send_message(self, message: AgentMessage):
+        """Send message between agents, waiting for room if the receiver is full"""
+        stamp_outgoing(message)
+        await self._queue(message.receiver).put(message)
+        self._stats["sent"] += 1
+        self.logger.info("%s -> %s: %s", message.sender, message.receiver, message.message_type,
+                         extra=sampled("queue.send"))
+
+    async def receive_message(self, agent_name: str, timeout: Optional[float] = None) -> Optional[AgentMessage]:
+        """Wait for the next message for agent_name, or None after timeout"""
+        try:
+            message = await asyncio.wait_for(self._queue(agent_name).get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._stats["received"] += 1
+        record_dequeue(message, agent_name)
+        return message
+
+    def receive_nowait(self, agent_name: str) -> Optional[AgentMessage]:
+        """Receive a pending message for agent_name without waiting"""
+        try:
+            message = self._queue(agent_name).get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+        self._stats["received"] += 1
+        record_dequeue(message, agent_name)
+        return message
+
+    def ack(self, message: AgentMessage):
+        """No-op, as for the in-memory MessageQueue"""
+        pass
+
+    def depth(self, agent_name: Optional[str] = None) -> int:
+        """Number of pending messages for one receiver, or for all receivers"""
+        if agent_name is not None:
+            return self._queue(agent_name).qsize()
+        return sum(q.qsize() for q in self._queues.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and throughput statistics"""
+        return {
+            **self._stats,
+            "max_size": self.max_size,
+            "depth": {name: q.qsize() for name, q in self._queues.items()},
+            "timestamp": datetime.now().isoformat()
+        }
+
+
+def create_message_queue(settings) -> MessageQueue:
+    """Build the MessageQueue backend selected by settings.QUEUE_BACKEND"""
+    options = {
+        "max_size": settings.QUEUE_MAX_SIZE,
+        "full_policy": settings.QUEUE_FULL_POLICY,
+        "send_timeout": settings.QUEUE_SEND_TIMEOUT
+    }
+    if settings.QUEUE_BACKEND == "sqlite":
+        from durable_queue import DurableMessageQueue
+        return DurableMessageQueue(
+            settings.QUEUE_PATH,
+            visibility_timeout=settings.QUEUE_VISIBILITY_TIMEOUT,
+            commit_interval=settings.QUEUE_COMMIT_INTERVAL,
+            max_deliveries=settings.QUEUE_MAX_DELIVERIES,
+            recover=settings.QUEUE_RECOVER_ON_START,
+            poll_interval=settings.QUEUE_POLL_INTERVAL,
+            prefetch=settings.QUEUE_PREFETCH,
+            **options
+        )
+    if settings.QUEUE_BACKEND != "memory":
+        raise ValueError(f"Unknown QUEUE_BACKEND: {settings.QUEUE_BACKEND}")
+    return MessageQueue(**options)
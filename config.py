@@ -1,22 +1,143 @@
-import os
-from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
-
-load_dotenv()
-
-class Config(BaseSettings):
-    # API Configuration
-    GROQ_API_KEY: str = os.getenv("GROQ_API_KEY", "")
-    MODEL: str = os.getenv("MODEL", "gpt-4")
-    
-    # Agent Configuration
-    MAX_RETRIES: int = int(os.getenv("MAX_RETRIES", "3"))
-    REQUEST_TIMEOUT: int = int(os.getenv("REQUEST_TIMEOUT", "30"))
-    
-    # Logging Configuration
-    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
-    
-    class Config:
-        env_file = ".env"
-
+import os
+from dotenv import load_dotenv
+from pydantic_settings import BaseSettings
+
+load_dotenv()
+
+class Config(BaseSettings):
+    # API Configuration
+    GROQ_API_KEY: str = os.getenv("GROQ_API_KEY", "")
+    MODEL: str = os.getenv("MODEL", "gpt-4")
+    
+    # Agent Configuration
+    MAX_RETRIES: int = int(os.getenv("MAX_RETRIES", "3"))
+    REQUEST_TIMEOUT: int = int(os.getenv("REQUEST_TIMEOUT", "30"))
+    PIPELINE_TIMEOUT: float = float(os.getenv("PIPELINE_TIMEOUT", "60"))
+    
+    # Outbound Call Resilience (search, MCP tools and LLM calls)
+    RATE_LIMIT_PER_SECOND: float = float(os.getenv("RATE_LIMIT_PER_SECOND", "5"))  # 0 = unlimited
+    RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", "10"))
+    RETRY_BASE_DELAY: float = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+    RETRY_MAX_DELAY: float = float(os.getenv("RETRY_MAX_DELAY", "10"))
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # 0 = disabled
+    CIRCUIT_RESET_TIMEOUT: float = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+    MAX_ABANDONED_CALLS: int = int(os.getenv("MAX_ABANDONED_CALLS", "64"))  # timed-out calls still running, 0 = no cap
+    # Per-upstream overrides of the settings above and MAX_RETRIES / REQUEST_TIMEOUT, e.g. "RATE_LIMIT_PER_SECOND=1,MAX_RETRIES=5"
+    SEARCH_RESILIENCE: str = os.getenv("SEARCH_RESILIENCE", "")
+    LLM_RESILIENCE: str = os.getenv("LLM_RESILIENCE", "")
+    MCP_RESILIENCE: str = os.getenv("MCP_RESILIENCE", "")
+    
+    # Batch Pipeline Configuration (workers per stage in process_topics)
+    RESEARCH_WORKERS: int = int(os.getenv("RESEARCH_WORKERS", "4"))
+    ANALYSIS_WORKERS: int = int(os.getenv("ANALYSIS_WORKERS", "2"))
+    SUMMARY_WORKERS: int = int(os.getenv("SUMMARY_WORKERS", "2"))
+    
+    # Message Queue Configuration
+    QUEUE_MAX_SIZE: int = int(os.getenv("QUEUE_MAX_SIZE", "0"))  # per receiver, 0 = unbounded
+    QUEUE_FULL_POLICY: str = os.getenv("QUEUE_FULL_POLICY", "block")  # "block" or "reject"
+    QUEUE_SEND_TIMEOUT: float = float(os.getenv("QUEUE_SEND_TIMEOUT", "30"))
+    QUEUE_BACKEND: str = os.getenv("QUEUE_BACKEND", "memory")  # "memory" or "sqlite" (durable, at-least-once)
+    QUEUE_PATH: str = os.getenv("QUEUE_PATH", ".cache/message_queue.sqlite3")
+    QUEUE_VISIBILITY_TIMEOUT: float = float(os.getenv("QUEUE_VISIBILITY_TIMEOUT", "300"))  # redeliver unacked after
+    QUEUE_COMMIT_INTERVAL: float = float(os.getenv("QUEUE_COMMIT_INTERVAL", "0.005"))  # 0 = commit every write
+    QUEUE_MAX_DELIVERIES: int = int(os.getenv("QUEUE_MAX_DELIVERIES", "5"))  # then dead-letter, 0 = no limit
+    QUEUE_RECOVER_ON_START: bool = os.getenv("QUEUE_RECOVER_ON_START", "true").lower() == "true"
+    QUEUE_POLL_INTERVAL: float = float(os.getenv("QUEUE_POLL_INTERVAL", "0.05"))  # pick up other processes' messages
+    QUEUE_PREFETCH: int = int(os.getenv("QUEUE_PREFETCH", "32"))  # messages claimed per receive transaction
+    
+    # Blob Store Configuration (large message payloads are passed by reference)
+    BLOB_STORE: str = os.getenv("BLOB_STORE", "auto")  # "auto" (file with the sqlite queue), "memory", "file" or "off"
+    BLOB_STORE_PATH: str = os.getenv("BLOB_STORE_PATH", ".cache/blobs")
+    BLOB_MIN_CHARS: int = int(os.getenv("BLOB_MIN_CHARS", "32768"))  # smaller payloads stay inline
+    BLOB_TTL: float = float(os.getenv("BLOB_TTL", "86400"))  # file blobs unused this long are pruned, 0 = never
+    
+    # Stage Worker Processes (0 = run the stage in the orchestrator process; needs QUEUE_BACKEND=sqlite)
+    ANALYSIS_PROCESSES: int = int(os.getenv("ANALYSIS_PROCESSES", "0"))
+    SUMMARY_PROCESSES: int = int(os.getenv("SUMMARY_PROCESSES", "0"))
+    WORKER_MAX_RESTARTS: int = int(os.getenv("WORKER_MAX_RESTARTS", "5"))  # per worker slot
+    WORKER_SHUTDOWN_TIMEOUT: float = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "30"))  # then workers are killed
+    
+    # Research Fan-out Configuration (1 query = classic LLM-driven research)
+    RESEARCH_FANOUT_QUERIES: int = int(os.getenv("RESEARCH_FANOUT_QUERIES", "1"))
+    RESEARCH_FANOUT_WORKERS: int = int(os.getenv("RESEARCH_FANOUT_WORKERS", "4"))
+    RESEARCH_RESULTS_PER_QUERY: int = int(os.getenv("RESEARCH_RESULTS_PER_QUERY", "5"))
+    RESEARCH_MAX_SOURCES: int = int(os.getenv("RESEARCH_MAX_SOURCES", "12"))
+    RESEARCH_PIPELINED: bool = os.getenv("RESEARCH_PIPELINED", "false").lower() == "true"  # analyze sources as searches finish
+    RESEARCH_PARTIAL_SOURCES: int = int(os.getenv("RESEARCH_PARTIAL_SOURCES", "4"))  # sources per partial research message
+    
+    # Analysis Chunking Configuration (map-reduce over research data larger than one chunk)
+    ANALYSIS_CHUNK_TOKENS: int = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "3000"))
+    ANALYSIS_MAP_WORKERS: int = int(os.getenv("ANALYSIS_MAP_WORKERS", "4"))
+    SUMMARY_DIGEST_TOKENS: int = int(os.getenv("SUMMARY_DIGEST_TOKENS", "750"))  # research digest passed to summary
+    
+    # Offline Analysis and Summary Configuration (TF-IDF keyphrases and TextRank in text_analysis.py)
+    ANALYSIS_MODE: str = os.getenv("ANALYSIS_MODE", "llm")  # "llm" (engine as fallback), "fast" (no LLM) or "auto"
+    ANALYSIS_FAST_ABOVE_TOKENS: int = int(os.getenv("ANALYSIS_FAST_ABOVE_TOKENS", "0"))  # auto: larger data skips the LLM
+    ANALYSIS_TOP_THEMES: int = int(os.getenv("ANALYSIS_TOP_THEMES", "10"))
+    ANALYSIS_SOURCE_THEMES: int = int(os.getenv("ANALYSIS_SOURCE_THEMES", "3"))  # themes listed per source
+    ANALYSIS_BACKGROUND_CORPUS: str = os.getenv("ANALYSIS_BACKGROUND_CORPUS", "")  # blank-line separated documents
+    SUMMARY_MODE: str = os.getenv("SUMMARY_MODE", "llm")  # "llm" (extractive as fallback), "fast" (no LLM) or "auto"
+    SUMMARY_FAST_SENTENCES: int = int(os.getenv("SUMMARY_FAST_SENTENCES", "5"))  # key findings in extractive summaries
+    
+    # Near-Duplicate Source Detection (SimHash between research and analysis, see dedup.py)
+    DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "false").lower() == "true"  # changes what the analysis sees
+    DEDUP_SIMILARITY: float = float(os.getenv("DEDUP_SIMILARITY", "0.85"))  # share of the 64 fingerprint bits that must match
+    DEDUP_INDEX_SIZE: int = int(os.getenv("DEDUP_INDEX_SIZE", "10000"))  # fingerprints remembered across topics
+    DEDUP_MIN_WORDS: int = int(os.getenv("DEDUP_MIN_WORDS", "8"))  # shorter sources are never deduplicated
+    DEDUP_ACROSS_TOPICS: bool = os.getenv("DEDUP_ACROSS_TOPICS", "false").lower() == "true"  # drop, not just count
+    
+    # Topic Refresh Configuration (process_topic(..., refresh=True) re-analyzes only changed sources, see result_store.py)
+    RESULT_STORE_PATH: str = os.getenv("RESULT_STORE_PATH", ".cache/results.sqlite3")  # empty = refreshes run in full
+    RESULT_STORE_VERSIONS: int = int(os.getenv("RESULT_STORE_VERSIONS", "10"))  # versions kept per topic
+    REFRESH_GROUP_TOKENS: int = int(os.getenv("REFRESH_GROUP_TOKENS", "300"))  # sources analyzed (and reused) together
+    REFRESH_RESUMMARIZE_DELTA: float = float(os.getenv("REFRESH_RESUMMARIZE_DELTA", "0.2"))  # analysis change that triggers a new summary
+    
+    # MCP Tool Server Configuration
+    MCP_TOOL_TIMEOUT: float = float(os.getenv("MCP_TOOL_TIMEOUT", "10"))
+    MCP_MAX_WORKERS: int = int(os.getenv("MCP_MAX_WORKERS", "8"))
+    MCP_TOOL_CACHE_ENTRIES: int = int(os.getenv("MCP_TOOL_CACHE_ENTRIES", "256"))
+    
+    # Search Cache Configuration
+    SEARCH_CACHE_ENABLED: bool = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+    SEARCH_CACHE_PATH: str = os.getenv("SEARCH_CACHE_PATH", ".cache/search_cache.sqlite3")  # empty = memory only
+    SEARCH_CACHE_TTL: float = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+    SEARCH_CACHE_MEMORY_ENTRIES: int = int(os.getenv("SEARCH_CACHE_MEMORY_ENTRIES", "256"))
+    SEARCH_CACHE_MAX_ENTRIES: int = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "10000"))
+    
+    # Search Backend Configuration (local corpus search is BM25 over LOCAL_CORPUS_DIR, see local_corpus.py)
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "web")  # "web" (DuckDuckGo), "local" or "both"
+    LOCAL_CORPUS_DIR: str = os.getenv("LOCAL_CORPUS_DIR", "")  # .txt, .md and .html files; also an MCP tool when set
+    LOCAL_CORPUS_INDEX_DIR: str = os.getenv("LOCAL_CORPUS_INDEX_DIR", ".cache/local_corpus")
+    LOCAL_CORPUS_REFRESH_INTERVAL: float = float(os.getenv("LOCAL_CORPUS_REFRESH_INTERVAL", "300"))  # seconds between checks for changed files, negative = once
+    
+    # LLM Response Cache Configuration (opt-in)
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+    LLM_CACHE_MAX_BYTES: int = int(os.getenv("LLM_CACHE_MAX_BYTES", "50000000"))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+    LLM_CACHE_TTL: float = float(os.getenv("LLM_CACHE_TTL", "0"))  # 0 = no expiry
+    
+    # Server Mode Configuration (server.py / client.py)
+    SERVER_SOCKET: str = os.getenv("SERVER_SOCKET", "")  # Unix socket path, empty = TCP on SERVER_HOST:SERVER_PORT
+    SERVER_HOST: str = os.getenv("SERVER_HOST", "127.0.0.1")
+    SERVER_PORT: int = int(os.getenv("SERVER_PORT", "8765"))
+    SERVER_MAX_CONCURRENT: int = int(os.getenv("SERVER_MAX_CONCURRENT", "4"))
+    SERVER_MAX_PENDING: int = int(os.getenv("SERVER_MAX_PENDING", "16"))
+    
+    # Metrics and Tracing Configuration
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    TRACE_HISTORY: int = int(os.getenv("TRACE_HISTORY", "100"))  # finished traces kept for the JSON snapshot
+    TRACE_LOG: bool = os.getenv("TRACE_LOG", "true").lower() == "true"  # log a span breakdown per topic
+    
+    # Logging Configuration
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # "text" or "json" (one object per line)
+    LOG_FILE: str = os.getenv("LOG_FILE", "enhanced_agent_system.log")  # empty = stdout only
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records awaiting the writer; more are dropped
+    LOG_MAX_MESSAGE_CHARS: int = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))  # 0 = no cap
+    LOG_SAMPLE_RATE: int = int(os.getenv("LOG_SAMPLE_RATE", "100"))  # keep 1 in N hot-path records
+    
+    class Config:
+        env_file = ".env"
+
 config = Config()
\ No newline at end of file
@@ -0,0 +1,251 @@
+"""
+Near-duplicate detection for research sources.
+
+Search results often include syndicated or mirrored copies of one article
+with different titles, URLs and boilerplate, which URL and exact content
+hashing (sources.merge_ranked) can't catch. Each source block of the
+research text gets a 64-bit SimHash of its word 3-grams. Two sources whose
+fingerprints differ in at most max_distance bits are near-duplicates, and
+the analysis stage then analyzes only one copy:
+
+- within a topic, the copies are merged into the first: the longest body
+  is kept and the other labels are listed under it
+- across topics, a source already analyzed for another topic is only
+  counted, unless drop_across_topics is set. Every indexed fingerprint
+  within max_distance is considered, so a closer copy from this topic's
+  earlier runs doesn't hide one from another topic
+- across the batches of one pipelined research stream, a copy of a source
+  sent in an earlier batch (recorded in the stream's stream_sources) is
+  dropped, since that batch's analysis already covers it
+
+Fingerprints are kept in a bounded ring buffer (the oldest are evicted
+first). Each text's sources are compared with each other and with the whole
+index in one vectorized Hamming distance computation. The search is exact:
+banded LSH lookups would need max_distance + 1 bands, too narrow at this
+threshold to prune much.
+"""
+import hashlib
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chunking import estimate_tokens
+from metrics import inc
+from text_analysis import split_sources
+
+BITS = 64
+
+_WORD = re.compile(r"\w+")
+# Source block fields that differ between mirrors of the same article
+_FIELD_LINE = re.compile(r"^\s*(?:Source \d+:?|Title:.*|URL:.*)\s*$", re.MULTILINE)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+# Set bits of every 16-bit value, for popcounts of XORed fingerprints
+_POPCOUNT_16 = np.unpackbits(np.arange(1 << 16, dtype=">u2").view(np.uint8)).reshape(-1, 16).sum(axis=1,
+                                                                                         dtype=np.uint8)
+_PRIMES = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9))
+
+
+def _word_hashes(words: List[str]) -> np.ndarray:
+    """Stable 64-bit hash per word (hashed once per distinct word)"""
+    distinct = {word: int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+                for word in dict.fromkeys(words)}
+    return np.fromiter(map(distinct.__getitem__, words), dtype=np.uint64, count=len(words))
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, so every input bit affects every output bit"""
+    values = (values ^ (values >> np.uint64(30))) * _MIX_1
+    values = (values ^ (values >> np.uint64(27))) * _MIX_2
+    return values ^ (values >> np.uint64(31))
+
+
+def simhash(text: str, shingle: int = 3) -> Optional[int]:
+    """64-bit SimHash of text's word shingles, or None when it has fewer words than one shingle"""
+    return simhashes([text], shingle)[0]
+
+
+def simhashes(texts: List[str], shingle: int = 3) -> List[Optional[int]]:
+    """simhash() of every text, computed in one pass over all their shingles"""
+    tokenized = [_WORD.findall(text.lower()) for text in texts]
+    counts = [max(0, len(words) - shingle + 1) for words in tokenized]
+    if not any(counts):
+        return [None] * len(texts)
+    words = [word for words in tokenized for word in words]
+    hashes = _word_hashes(words)
+    # Shingle i of a text starts at word i of that text; starts that would cross into the next text are skipped
+    offsets = np.cumsum([0] + [len(words) for words in tokenized[:-1]])
+    starts = np.concatenate([offset + np.arange(count) for offset, count in zip(offsets, counts)]).astype(np.int64)
+    with np.errstate(over="ignore"):
+        shingles = np.zeros(len(starts), dtype=np.uint64)
+        for position in range(shingle):
+            shingles ^= hashes[starts + position] * _PRIMES[position % len(_PRIMES)]
+        shingles = _mix(shingles)
+    # Each bit of a fingerprint is the majority vote of that bit over the text's shingles
+    bits = np.unpackbits(shingles.astype("<u8").view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    nonempty = [i for i, count in enumerate(counts) if count]
+    sizes = np.array([counts[i] for i in nonempty], dtype=np.int64)
+    ones = np.add.reduceat(bits, np.cumsum(sizes) - sizes, axis=0, dtype=np.int64)
+    majority = np.packbits(ones * 2 > sizes[:, None], axis=1, bitorder="little")
+    fingerprints = majority.view("<u8").ravel()
+    result: List[Optional[int]] = [None] * len(texts)
+    for i, fingerprint in zip(nonempty, fingerprints.tolist()):
+        result[i] = fingerprint
+    return result
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Bitwise Hamming distances between every fingerprint in a and every one in b, shape (len(a), len(b))"""
+    xor = np.ascontiguousarray(a[:, None] ^ b[None, :])
+    return _POPCOUNT_16[xor.view(np.uint16)].reshape(len(a), len(b), 4).sum(axis=2, dtype=np.uint8)
+
+
+@dataclass
+class _Entry:
+    topic: str
+    label: str
+
+
+class SourceDeduplicator:
+    """Bounded SimHash index that removes near-duplicate sources from research text"""
+
+    def __init__(self, similarity: float = 0.85, max_entries: int = 10000, min_words: int = 8,
+                 drop_across_topics: bool = False):
+        self.max_distance = max(0, min(BITS - 1, int(BITS * (1.0 - similarity))))
+        self.max_entries = max(1, max_entries)
+        self.min_words = min_words
+        self.drop_across_topics = drop_across_topics
+        self._fingerprints = np.zeros(self.max_entries, dtype=np.uint64)
+        self._entries: List[Optional[_Entry]] = [None] * self.max_entries
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stats = {"sources": 0, "merged": 0, "cross_topic": 0, "dropped_across_topics": 0,
+                       "tokens_saved": 0, "evicted": 0}
+
+    @classmethod
+    def from_config(cls, settings) -> "SourceDeduplicator":
+        return cls(similarity=settings.DEDUP_SIMILARITY, max_entries=settings.DEDUP_INDEX_SIZE,
+                   min_words=settings.DEDUP_MIN_WORDS, drop_across_topics=settings.DEDUP_ACROSS_TOPICS)
+
+    def dedup(self, topic: str, research_text: str, stream_sources: Optional[List[Tuple[int, str]]] = None) -> str:
+        """research_text with near-duplicate source blocks merged (and, if enabled, earlier topics' dropped).
+
+        stream_sources holds (fingerprint, label) for the sources kept from the
+        stream's previous batches; copies of those are dropped, and this
+        text's kept sources are appended to it.
+        """
+        sources = split_sources(research_text)
+        bodies = [_FIELD_LINE.sub("", block) for _, block in sources]
+        fingerprints = [fingerprint if len(body.split()) >= self.min_words else None
+                        for body, fingerprint in zip(bodies, simhashes(bodies))]
+        queries = [i for i, fingerprint in enumerate(fingerprints) if fingerprint is not None]
+        query_fingerprints = np.array([fingerprints[i] for i in queries], dtype=np.uint64)
+
+        kept: List[List[Any]] = []  # [label, block, merged labels] in output order
+        with self._lock:
+            self._stats["sources"] += len(sources)
+            to_index = []
+            if queries:
+                among_sources = hamming(query_fingerprints, query_fingerprints) <= self.max_distance
+                to_index_matrix = hamming(query_fingerprints, self._fingerprints[:self._size])
+                indexed_matches = (to_index_matrix <= self.max_distance).any(axis=1)
+                if stream_sources:
+                    sent = np.array([fingerprint for fingerprint, _ in stream_sources], dtype=np.uint64)
+                    sent_matches = hamming(query_fingerprints, sent) <= self.max_distance
+            first_copies = np.zeros(len(queries), dtype=bool)
+            kept_at: Dict[int, int] = {}  # query number of a first copy -> its index in kept
+            changed = False
+            query_of = {source: number for number, source in enumerate(queries)}
+            for i, (label, block) in enumerate(sources):
+                number = query_of.get(i)
+                if number is None:
+                    kept.append([label, block, []])
+                    continue
+
+                # A mirror of a source sent in an earlier batch, whose analysis already covers it
+                copies = np.flatnonzero(sent_matches[number]) if stream_sources else []
+                if len(copies):
+                    kept.append([label, f"{label}: near-duplicate of {stream_sources[int(copies[0])][1]}, "
+                                        f"analyzed with an earlier batch", []])
+                    self._saved(block, "topic")
+                    self._stats["merged"] += 1
+                    changed = True
+                    continue
+
+                # A mirror of a source earlier in this text: keep one copy, the more complete one
+                earlier = np.flatnonzero(among_sources[number] & first_copies)
+                if len(earlier):
+                    target = kept[kept_at[int(earlier[0])]]
+                    smaller = min(block, target[1], key=len)
+                    if len(block) > len(target[1]):
+                        target[2].append(target[0])
+                        target[0], target[1] = label, block
+                    else:
+                        target[2].append(label)
+                    self._saved(smaller, "topic")
+                    self._stats["merged"] += 1
+                    changed = True
+                    continue
+
+                matches = self._matches(to_index_matrix[number]) if indexed_matches[number] else []
+                match = next((entry for entry in matches if entry.topic != topic), None)
+                if match is not None:
+                    self._stats["cross_topic"] += 1
+                    inc("dedup_cross_topic_total")
+                    if self.drop_across_topics:
+                        kept.append([label, f"{label}: near-duplicate of a source already analyzed for "
+                                            f"'{match.topic}' ({match.label})", []])
+                        self._saved(block, "run")
+                        self._stats["dropped_across_topics"] += 1
+                        changed = True
+                        continue
+                first_copies[number] = True
+                kept_at[number] = len(kept)
+                kept.append([label, block, []])
+                # A match for this same topic is this source from an earlier run, already indexed
+                if not any(entry.topic == topic for entry in matches):
+                    to_index.append((fingerprints[i], _Entry(topic, label)))
+            for fingerprint, entry in to_index:
+                self._add(fingerprint, entry)
+            if stream_sources is not None:
+                stream_sources.extend((fingerprints[queries[number]], kept[position][0])
+                                      for number, position in kept_at.items())
+
+        if not changed:
+            return research_text
+        return "\n\n".join(
+            block if not merged else f"{block}\nAlso published as: {', '.join(merged)}"
+            for _, block, merged in kept
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "entries": self._size, "max_distance": self.max_distance}
+
+    def clear(self):
+        with self._lock:
+            self._entries = [None] * self.max_entries
+            self._size = self._next = 0
+
+    def _saved(self, block: str, scope: str):
+        tokens = estimate_tokens(block)
+        self._stats["tokens_saved"] += tokens
+        inc("dedup_sources_removed_total", scope=scope)
+        inc("dedup_tokens_saved_total", tokens, scope=scope)
+
+    def _matches(self, distances: np.ndarray) -> List[_Entry]:
+        """Indexed entries within max_distance, closest first"""
+        slots = np.flatnonzero(distances <= self.max_distance)
+        return [self._entries[slot] for slot in slots[np.argsort(distances[slots], kind="stable")]]
+
+    def _add(self, fingerprint: int, entry: _Entry):
+        if self._entries[self._next] is not None:
+            self._stats["evicted"] += 1
+        self._fingerprints[self._next] = fingerprint
+        self._entries[self._next] = entry
+        self._next = (self._next + 1) % self.max_entries
+        self._size = max(self._size, self._next if self._next else self.max_entries)
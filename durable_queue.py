@@ -0,0 +1,333 @@
+"""
+SQLite-backed MessageQueue.
+
+Every message is written to a WAL-mode SQLite table before its receiver is
+woken, so a crash or restart mid-pipeline leaves the research and analysis
+payloads on disk instead of losing them (and the model calls that produced
+them). Delivery is at-least-once:
+
+- receive_message() claims a row for visibility_timeout seconds
+- ack() deletes the row once the message has been handled
+- a claim that is never acknowledged (the worker hung or died) expires and
+  the message is delivered again; after max_deliveries attempts it is moved
+  to the dead_letters table instead
+- claims left behind by a previous process are released on start, or by
+  release_claims() when a known consumer process dies
+
+Several processes can share one queue file (see workers.py): each polls
+every poll_interval for messages sent by the others and wakes its local
+subscribers.
+
+Sends, claims and acks are grouped into one transaction per
+commit_interval. receive_message() claims up to prefetch of a receiver's
+messages in one statement and hands them out from memory; their visibility
+timeout runs from the claim, and one held past it is dropped rather than
+handled, since another consumer may have claimed it again.
+
+A claim commits the batch before a message is handed out only if that
+message's send is still uncommitted, so nothing a handler is working on can
+be lost. A claim of a message that was already on disk rides along with the
+next commit; losing it in a crash just means a repeat delivery, as with acks.
+A crash can only lose sends from the last commit_interval that no handler
+had picked up yet. A lone send-receive-ack round trip therefore still pays
+one commit, while bursts share one commit per prefetch batch.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from communication import AgentMessage, MessageQueue
+from metrics import inc
+
+# Per-delivery metadata added by receive_message(), never persisted
+DELIVERY_KEYS = ("delivery_id", "delivery_attempt")
+
+
+def _encode(value: Any) -> Any:
+    """JSON fallback: handles such as BlobRef serialize through to_dict(), anything else as str"""
+    to_dict = getattr(value, "to_dict", None)
+    return to_dict() if callable(to_dict) else str(value)
+
+
+class DurableMessageQueue(MessageQueue):
+    """MessageQueue persisted in SQLite with acks, visibility timeouts and batched commits"""
+
+    def __init__(self, path: str, visibility_timeout: float = 300.0, commit_interval: float = 0.005,
+                 max_deliveries: int = 5, recover: bool = True, poll_interval: float = 0.05,
+                 consumer_id: Optional[str] = None, prefetch: int = 32, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.commit_interval = max(0.0, commit_interval)
+        self.max_deliveries = max_deliveries
+        self.poll_interval = max(0.001, poll_interval)
+        self.prefetch = max(1, prefetch)
+        # Recorded on every claim so a supervisor can release a dead consumer's messages
+        self.consumer_id = consumer_id or str(os.getpid())
+        self._stats.update({"acked": 0, "redelivered": 0, "dead_lettered": 0, "commits": 0})
+        self._batch_started: Optional[float] = None
+        # Ready (unclaimed or expired) messages per receiver, mirrored from the table
+        self._ready: Dict[str, int] = {}
+        # Claimed but not yet handed out: (id, body, attempts, claimed_until) per receiver
+        self._prefetched: Dict[str, Deque[Tuple[int, str, int, float]]] = {}
+        # Messages sent in the open transaction
+        self._uncommitted: set = set()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode: transactions are opened and committed explicitly in batches
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, receiver TEXT NOT NULL, body TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, claimed_until REAL NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, "
+            "claimed_by TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(messages)")}
+        if "claimed_by" not in columns:
+            # Queue files created before claims recorded their consumer
+            self._conn.execute("ALTER TABLE messages ADD COLUMN claimed_by TEXT")
+        # Claims walk a receiver's rows oldest first; in-flight rows are few, so skipping them is cheap
+        self._conn.execute("CREATE INDEX IF NOT EXISTS messages_receiver ON messages (receiver, id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "id INTEGER PRIMARY KEY, receiver TEXT NOT NULL, body TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL, failed_at REAL NOT NULL)"
+        )
+
+        with self._lock:
+            if recover:
+                released = self._conn.execute(
+                    "UPDATE messages SET claimed_until = 0, claimed_by = NULL WHERE claimed_until > 0"
+                ).rowcount
+                if released:
+                    self.logger.info("Released %s unacknowledged message(s) from a previous run", released)
+            self._refresh_ready()
+            if self._ready:
+                self.logger.info("Recovered %s pending message(s) from %s", sum(self._ready.values()), path)
+
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="durable-queue-flusher", daemon=True)
+        self._flusher.start()
+
+    def ack(self, message: AgentMessage):
+        """Delete a handled message so it is never delivered again"""
+        delivery_id = message.metadata.get("delivery_id")
+        if delivery_id is None:
+            return
+        with self._lock:
+            self._begin()
+            deleted = self._conn.execute("DELETE FROM messages WHERE id = ?", (delivery_id,)).rowcount
+            if deleted:
+                self._stats["acked"] += 1
+            self._maybe_commit()
+
+    def release_claims(self, consumer_id: str) -> int:
+        """Make messages claimed by a dead consumer visible again, returning how many"""
+        with self._lock:
+            self._begin()
+            released = self._conn.execute(
+                "UPDATE messages SET claimed_until = 0, claimed_by = NULL WHERE claimed_by = ? AND claimed_until > 0",
+                (consumer_id,)
+            ).rowcount
+            self._commit()
+            self._refresh_ready()
+        if released:
+            self.logger.warning("Released %s message(s) claimed by consumer %s", released, consumer_id)
+            for receiver in self._depths():
+                self._wake(receiver)
+        return released
+
+    def flush(self):
+        """Commit any batched writes now"""
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        """Release prefetched messages, commit outstanding writes and stop the flusher thread"""
+        self._closed.set()
+        self._flusher.join(timeout=5)
+        with self._lock:
+            held = [row[0] for rows in self._prefetched.values() for row in rows]
+            if held:
+                # Never handed out, so this claim doesn't count as a delivery attempt
+                self._begin()
+                self._conn.executemany(
+                    "UPDATE messages SET claimed_until = 0, claimed_by = NULL, attempts = attempts - 1 WHERE id = ?",
+                    [(delivery_id,) for delivery_id in held]
+                )
+                self._prefetched.clear()
+            self._commit()
+            self._conn.close()
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Messages that exceeded max_deliveries, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, receiver, body, attempts, failed_at FROM dead_letters ORDER BY failed_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [{"id": row[0], "receiver": row[1], "message": json.loads(row[2]), "attempts": row[3],
+                 "failed_at": row[4]} for row in rows]
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        with self._lock:
+            in_flight = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE claimed_until > ?", (time.time(),)
+            ).fetchone()[0]
+            dead = self._conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+            prefetched = sum(len(rows) for rows in self._prefetched.values())
+        stats["durable"] = {"path": self.path, "consumer_id": self.consumer_id, "in_flight": in_flight,
+                            "prefetched": prefetched, "dead_letters": dead,
+                            "commit_interval": self.commit_interval,
+                            "visibility_timeout": self.visibility_timeout}
+        return stats
+
+    def _wait_for_room(self, receiver: str, timeout: Optional[float]) -> bool:
+        # Commit first so the writes blocking this sender don't sit in the batch while it waits
+        self._commit()
+        return super()._wait_for_room(receiver, timeout)
+
+    # Storage hooks (called with the lock held)
+
+    def _append(self, message: AgentMessage):
+        metadata = {key: value for key, value in message.metadata.items() if key not in DELIVERY_KEYS}
+        body = json.dumps({**message.model_dump(), "metadata": metadata}, default=_encode)
+        self._begin()
+        cursor = self._conn.execute(
+            "INSERT INTO messages (receiver, body, enqueued_at) VALUES (?, ?, ?)",
+            (message.receiver, body, time.time())
+        )
+        self._uncommitted.add(cursor.lastrowid)
+        self._ready[message.receiver] = self._ready.get(message.receiver, 0) + 1
+        self._maybe_commit()
+
+    def _pop(self, agent_name: str) -> Optional[AgentMessage]:
+        prefetched = self._prefetched.setdefault(agent_name, deque())
+        while True:
+            if not prefetched:
+                if not self._ready.get(agent_name) or not self._claim(agent_name, prefetched):
+                    return None
+                # Everything claimed may have been dead-lettered
+                continue
+            delivery_id, body, attempts, claimed_until = prefetched.popleft()
+            if claimed_until <= time.time():
+                continue
+            if attempts > 1:
+                self._stats["redelivered"] += 1
+                inc("queue_redeliveries_total", receiver=agent_name)
+            message = AgentMessage(**json.loads(body))
+            message.metadata["delivery_id"] = delivery_id
+            message.metadata["delivery_attempt"] = attempts
+            return message
+
+    def _claim(self, agent_name: str, prefetched: Deque) -> bool:
+        """Claim up to prefetch of agent_name's ready messages into prefetched; False if there were none"""
+        self._begin()
+        try:
+            now = time.time()
+            claimed_until = now + self.visibility_timeout
+            rows = sorted(self._conn.execute(
+                "UPDATE messages SET claimed_until = ?, claimed_by = ?, attempts = attempts + 1 "
+                "WHERE id IN (SELECT id FROM messages WHERE receiver = ? AND claimed_until <= ? ORDER BY id LIMIT ?) "
+                "RETURNING id, body, attempts",
+                (claimed_until, self.consumer_id, agent_name, now, self.prefetch)
+            ).fetchall())
+            # A short batch means nothing else is ready
+            self._ready[agent_name] = self._ready.get(agent_name, 0) - len(rows) if len(rows) == self.prefetch else 0
+            for delivery_id, body, attempts in rows:
+                if self.max_deliveries and attempts > self.max_deliveries:
+                    self._dead_letter(delivery_id, agent_name, body, attempts - 1)
+                else:
+                    prefetched.append((delivery_id, body, attempts, claimed_until))
+            # Whatever a handler starts work on is on disk first, so a crash
+            # mid-handler can't lose the message
+            if any(row[0] in self._uncommitted for row in rows):
+                self._commit()
+            return bool(rows)
+        finally:
+            self._maybe_commit()
+
+    def _depth(self, agent_name: str) -> int:
+        return self._ready.get(agent_name, 0) + len(self._prefetched.get(agent_name, ()))
+
+    def _depths(self) -> Dict[str, int]:
+        depths = dict(self._ready)
+        for receiver, rows in self._prefetched.items():
+            if rows:
+                depths[receiver] = depths.get(receiver, 0) + len(rows)
+        return depths
+
+    def _pending_messages(self) -> List[AgentMessage]:
+        rows = self._conn.execute(
+            "SELECT body FROM messages WHERE claimed_until <= ? ORDER BY receiver, id", (time.time(),)
+        ).fetchall()
+        held = [(row[1],) for prefetched in self._prefetched.values() for row in prefetched]
+        return [AgentMessage(**json.loads(body)) for (body,) in held + rows]
+
+    def _dead_letter(self, delivery_id: int, receiver: str, body: str, attempts: int):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO dead_letters (id, receiver, body, attempts, failed_at) VALUES (?, ?, ?, ?, ?)",
+            (delivery_id, receiver, body, attempts, time.time())
+        )
+        self._conn.execute("DELETE FROM messages WHERE id = ?", (delivery_id,))
+        self._stats["dead_lettered"] += 1
+        inc("queue_dead_letters_total", receiver=receiver)
+        self.logger.error("Message %s for %s dead-lettered after %s deliveries", delivery_id, receiver, attempts)
+
+    # Transactions
+
+    def _begin(self):
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._batch_started = time.monotonic()
+
+    def _maybe_commit(self):
+        if self._batch_started is None:
+            return
+        if not self.commit_interval or time.monotonic() - self._batch_started >= self.commit_interval:
+            self._commit()
+
+    def _commit(self):
+        if self._conn.in_transaction:
+            self._conn.commit()
+            self._stats["commits"] += 1
+            self._batch_started = None
+            self._uncommitted.clear()
+
+    def _refresh_ready(self):
+        rows = self._conn.execute(
+            "SELECT receiver, COUNT(*) FROM messages WHERE claimed_until <= ? GROUP BY receiver", (time.time(),)
+        ).fetchall()
+        self._ready = dict(rows)
+
+    def _flush_loop(self):
+        """Commit idle batches and wake subscribers for messages that became visible.
+
+        Those are messages sent by other processes and messages whose claims
+        expired without an ack.
+        """
+        interval = min(self.commit_interval or self.poll_interval, self.poll_interval)
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._closed.wait(interval):
+            arrived: List[str] = []
+            with self._lock:
+                if self._batch_started is not None and time.monotonic() - self._batch_started >= self.commit_interval:
+                    self._commit()
+                if time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + self.poll_interval
+                    before = dict(self._ready)
+                    self._refresh_ready()
+                    arrived = [name for name, count in self._ready.items() if count > before.get(name, 0)]
+                    if self.max_size and any(self._ready.get(name, 0) < count for name, count in before.items()):
+                        self._not_full.notify_all()
+            for receiver in arrived:
+                self._wake(receiver)
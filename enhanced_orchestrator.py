@@ -1,124 +1,583 @@
-import logging
-from research_agent import ResearchAgent
-from mcp_research_agent import MCPResearchAgent
-from analysis_agent import AnalysisAgent
-from summary_agent import SummaryAgent
-from communication import MessageQueue
-from config import config
-import time
-import sys
-
-class EnhancedResearchOrchestrator:
-    """
-    Enhanced orchestrator that demonstrates ALL THREE integration requirements:
-    1. Agent Framework: CrewAI
-    2. Communication Protocol: Message Queue  
-    3. MCP: Model Context Protocol for external tools
-    """
-    
-    def __init__(self, use_mcp: bool = True):
-        self.config = config
-        self.message_queue = MessageQueue()
-        self.use_mcp = use_mcp
-        
-        # Validate configuration
-        if not self.config.GROQ_API_KEY:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-        
-        # Setup logging
-        self._setup_logging()
-        self.logger = logging.getLogger(__name__)
-        
-        # Initialize agents with chosen configuration
-        if self.use_mcp:
-            self.research_agent = MCPResearchAgent(self.message_queue)
-            self.logger.info("Using MCP-Enhanced Research Agent")
-        else:
-            self.research_agent = ResearchAgent(self.message_queue)
-            self.logger.info("Using Standard Research Agent")
-            
-        self.analysis_agent = AnalysisAgent(self.message_queue)
-        self.summary_agent = SummaryAgent(self.message_queue)
-        
-        self.logger.info("Enhanced Multi-Agent System Initialized")
-        self.logger.info(f"Integration Methods: CrewAI + Message Queue + {'MCP' if use_mcp else 'Basic Tools'}")
-    
-    def _setup_logging(self):
-        logging.basicConfig(
-            level=getattr(logging, self.config.LOG_LEVEL),
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.StreamHandler(sys.stdout),
-                logging.FileHandler('enhanced_agent_system.log')
-            ]
-        )
-    
-    def demonstrate_integration_methods(self):
-        """Demonstrate all three integration methods in use"""
-        integration_info = """
-        INTEGRATION METHODS DEMONSTRATED:
-        
-        1. AGENT FRAMEWORK (CrewAI):
-           - Using CrewAI Agent class for all agents
-           - Agent roles, goals, and backstories defined
-           - Built-in task execution and delegation
-        
-        2. COMMUNICATION PROTOCOL (Message Queue):
-           - Custom MessageQueue class for inter-agent communication
-           - Structured AgentMessage format
-           - Async message passing with logging
-        
-        3. MCP (Model Context Protocol):
-           - MCPToolServer for external tool integration
-           - Standardized tool execution interface
-           - External resource access via MCP
-        """
-        self.logger.info(integration_info)
-        return integration_info
-    
-    def process_topic(self, topic: str) -> str:
-        """Orchestrate research pipeline using all integration methods"""
-        self.logger.info(f"Starting enhanced pipeline for: '{topic}'")
-        
-        # Demonstrate integration methods
-        self.demonstrate_integration_methods()
-        
-        try:
-            # Start the research agent (uses MCP if enabled)
-            self.research_agent.execute(topic)
-            
-            # Process the message chain (Communication Protocol)
-            max_wait_time = 60
-            start_time = time.time()
-            
-            while time.time() - start_time < max_wait_time:
-                # Agent Framework handles internal processing
-                self.analysis_agent.process_messages()
-                self.summary_agent.process_messages()
-                
-                if topic in self.summary_agent.final_results:
-                    result = self.summary_agent.final_results.pop(topic)
-                    
-                    # Add integration method info to result
-                    enhanced_result = f"""
-{result}
-
----
-INTEGRATION METHODS USED:
-• Agent Framework: CrewAI
-• Communication: Message Queue Protocol  
-• External Tools: {'MCP (Model Context Protocol)' if self.use_mcp else 'Basic Tools'}
-"""
-                    self.logger.info("Enhanced pipeline completed successfully")
-                    return enhanced_result
-                
-                time.sleep(1)
-            
-            timeout_msg = f"Pipeline timeout after {max_wait_time} seconds"
-            self.logger.error(timeout_msg)
-            return f"ERROR: {timeout_msg}"
-            
-        except Exception as e:
-            error_msg = f"Enhanced orchestrator failed: {str(e)}"
-            self.logger.error(error_msg)
-            return f"ERROR: {error_msg}"
\ No newline at end of file
+import logging
+from analysis_agent import AnalysisAgent
+from summary_agent import SummaryAgent
+from communication import AsyncMessageQueue, create_message_queue
+from blob_store import get_blob_store, release_refs
+from caching import ResponseCache
+from logging_setup import get_logging_stats, setup_logging
+from resilience import get_metrics
+import metrics
+from config import config
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+import asyncio
+import math
+import queue
+import threading
+import time
+import uuid
+
+class EnhancedResearchOrchestrator:
+    """
+    Enhanced orchestrator that demonstrates ALL THREE integration requirements:
+    1. Agent Framework: CrewAI
+    2. Communication Protocol: Message Queue  
+    3. MCP: Model Context Protocol for external tools
+    """
+    
+    def __init__(self, use_mcp: bool = True, worker_initializer: Optional[Callable] = None):
+        self.config = config
+        # In-memory by default; QUEUE_BACKEND=sqlite persists in-flight messages
+        self.message_queue = create_message_queue(self.config)
+        self.use_mcp = use_mcp
+        self._integration_logged = False
+        
+        # Validate configuration
+        if not self.config.GROQ_API_KEY:
+            raise ValueError("OPENAI_API_KEY environment variable is required")
+        
+        # Setup logging
+        self._setup_logging()
+        self.logger = logging.getLogger(__name__)
+        
+        # Initialize agents with chosen configuration. Only the research agent
+        # in use is imported; the standard one pulls in the web search stack.
+        if self.use_mcp:
+            from mcp_research_agent import MCPResearchAgent
+            self.research_agent = MCPResearchAgent(self.message_queue)
+            self.logger.info("Using MCP-Enhanced Research Agent")
+        else:
+            from research_agent import ResearchAgent
+            self.research_agent = ResearchAgent(self.message_queue)
+            self.logger.info("Using Standard Research Agent")
+            
+        # One LLM response cache shared by the analysis and summary stages
+        self.response_cache = ResponseCache.from_config(self.config) if self.config.LLM_CACHE_ENABLED else None
+        self.analysis_agent = AnalysisAgent(self.message_queue, response_cache=self.response_cache)
+        self.summary_agent = SummaryAgent(self.message_queue, response_cache=self.response_cache)
+        
+        # Message delivery wakes the consuming agent directly (no polling).
+        # Every stage runs off the caller's thread, on its default pool or,
+        # during process_topics(), on the batch's own worker pools.
+        self._default_pools = {
+            stage: ThreadPoolExecutor(max_workers=count, thread_name_prefix=f"{stage}_stage")
+            for stage, count in self._stage_concurrency(None).items()
+        }
+        self._stage_pools: Dict[str, ThreadPoolExecutor] = {}
+        self._stage_lock = threading.Lock()
+        self._batch_lock = threading.Lock()
+        # Stages with ANALYSIS_PROCESSES / SUMMARY_PROCESSES set run in worker processes instead
+        self.stage_workers = None
+        processes = {"analysis": self.config.ANALYSIS_PROCESSES, "summary": self.config.SUMMARY_PROCESSES}
+        if not processes["analysis"]:
+            self.message_queue.subscribe(self.analysis_agent.agent_name, lambda: self._dispatch("analysis", self.analysis_agent))
+        if not processes["summary"]:
+            self.message_queue.subscribe(self.summary_agent.agent_name, lambda: self._dispatch("summary", self.summary_agent))
+        
+        # Streamed requests receive stage events as their messages are sent, by trace id
+        self._stream_sinks: Dict[str, queue.Queue] = {}
+        self.ttfb_samples = deque(maxlen=1000)
+        self.message_queue.add_observer(self._observe_message)
+        
+        if any(processes.values()):
+            self._start_stage_workers(processes, worker_initializer)
+        
+        # Messages left by a previous run of a durable queue are handled in the background
+        if self.message_queue.depth():
+            threading.Thread(target=self.resume_pending, name="queue-recovery", daemon=True).start()
+        
+        # asyncio pipeline state, created on first use inside a running event loop
+        self.async_queue: Optional[AsyncMessageQueue] = None
+        self._async_loop = None
+        self._async_limits: Dict[str, asyncio.Semaphore] = {}
+        # Stage limits of the aprocess_topics() batch each running request belongs to, by trace id
+        self._request_limits: Dict[str, Dict[str, asyncio.Semaphore]] = {}
+        self._async_tasks = set()
+        
+        self.logger.info("Enhanced Multi-Agent System Initialized")
+        self.logger.info("Integration Methods: CrewAI + Message Queue + %s", 'MCP' if use_mcp else 'Basic Tools')
+    
+    def _start_stage_workers(self, processes: Dict[str, int], initializer: Optional[Callable]):
+        if self.config.QUEUE_BACKEND != "sqlite":
+            raise ValueError("ANALYSIS_PROCESSES / SUMMARY_PROCESSES need QUEUE_BACKEND=sqlite")
+        from workers import RESULTS_RECEIVER, StageWorkerPool
+        self.message_queue.subscribe(RESULTS_RECEIVER, self._collect_results)
+        self.stage_workers = StageWorkerPool(
+            self.message_queue, processes, initializer=initializer,
+            max_restarts=self.config.WORKER_MAX_RESTARTS,
+            shutdown_timeout=self.config.WORKER_SHUTDOWN_TIMEOUT
+        )
+        self.stage_workers.start()
+    
+    def _collect_results(self):
+        """Complete topics whose summaries were produced by summary worker processes"""
+        from workers import RESULTS_RECEIVER
+        while True:
+            message = self.message_queue.receive_message(RESULTS_RECEIVER)
+            if message is None:
+                return
+            topic, summary = message.content["topic"], message.content["summary"]
+            sink = self.summary_agent._stream_sink(message.content.get("trace_id"))
+            if sink is not None:
+                # Worker processes can't stream tokens here; the summary arrives whole
+                sink.put({"event": "token", "topic": topic, "text": summary})
+                sink.put({"event": "summary_done", "topic": topic})
+            else:
+                self.summary_agent._complete(message.content.get("trace_id"), topic, summary)
+            self.message_queue.ack(message)
+    
+    def shutdown(self, timeout: Optional[float] = None):
+        """Stop stage worker processes (finishing the messages in hand) and flush the queue"""
+        if self.stage_workers is not None:
+            self.stage_workers.stop(timeout)
+            self.stage_workers = None
+        for pool in self._default_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.message_queue.close()
+    
+    def _setup_logging(self):
+        # Console and file output are written by a background thread (see logging_setup)
+        setup_logging(self.config)
+    
+    def demonstrate_integration_methods(self):
+        """Demonstrate all three integration methods in use"""
+        integration_info = """
+        INTEGRATION METHODS DEMONSTRATED:
+        
+        1. AGENT FRAMEWORK (CrewAI):
+           - Using CrewAI Agent class for all agents
+           - Agent roles, goals, and backstories defined
+           - Built-in task execution and delegation
+        
+        2. COMMUNICATION PROTOCOL (Message Queue):
+           - Custom MessageQueue class for inter-agent communication
+           - Structured AgentMessage format
+           - Async message passing with logging
+        
+        3. MCP (Model Context Protocol):
+           - MCPToolServer for external tool integration
+           - Standardized tool execution interface
+           - External resource access via MCP
+        """
+        # The banner is the same every time; log it in full once per orchestrator
+        if not self._integration_logged:
+            self._integration_logged = True
+            self.logger.info(integration_info)
+        else:
+            self.logger.debug(integration_info)
+        return integration_info
+    
+    def process_topic(self, topic: str, timeout: Optional[float] = None, refresh: bool = False) -> str:
+        """Orchestrate research pipeline using all integration methods
+        
+        With refresh=True, sources, analyses and the summary stored for the
+        topic's previous version are reused where they are still current
+        (see result_store).
+        """
+        self.logger.info("Starting enhanced pipeline for: '%s'", topic)
+        max_wait_time = self.config.PIPELINE_TIMEOUT if timeout is None else timeout
+        
+        # Demonstrate integration methods
+        self.demonstrate_integration_methods()
+        
+        try:
+            # Register interest before starting so a fast pipeline can't be missed; the
+            # request's own trace id keeps it apart from other requests for the same topic
+            request_id = uuid.uuid4().hex[:16]
+            result_future = self.summary_agent.result_future(request_id)
+            
+            # Start the research agent (uses MCP if enabled) on its pool; the message
+            # chain runs as each message is delivered (Communication Protocol), and
+            # this thread only waits for the summary, up to the deadline
+            self._default_pools["research"].submit(self.research_agent.execute, topic, refresh=refresh,
+                                                   trace_id=request_id)
+            
+            try:
+                result = result_future.result(timeout=max_wait_time)
+            except FutureTimeoutError:
+                timeout_msg = f"Pipeline timeout after {max_wait_time} seconds"
+                self.logger.error(timeout_msg)
+                return f"ERROR: {timeout_msg}"
+            finally:
+                self.summary_agent.release_result(request_id)
+            
+            self.logger.info("Enhanced pipeline completed successfully")
+            self._log_cache_stats()
+            return self._format_result(result)
+            
+        except Exception as e:
+            error_msg = f"Enhanced orchestrator failed: {str(e)}"
+            self.logger.error(error_msg)
+            return f"ERROR: {error_msg}"
+    
+    def process_topics(self, topics: List[str], concurrency: Union[int, Dict[str, int], None] = None,
+                       order: str = "input", timeout: Optional[float] = None,
+                       refresh: bool = False) -> Dict[str, str]:
+        """Run many topics through the pipeline with a worker pool per stage.
+        
+        concurrency is either one limit for every stage or a dict with
+        "research", "analysis" and "summary" keys. Results are keyed by topic,
+        in input order or, with order="completion", in the order they finished.
+        refresh is passed on as in process_topic.
+        """
+        if order not in ("input", "completion"):
+            raise ValueError(f"Unknown result order: {order}")
+        topics = list(dict.fromkeys(topics))
+        if not topics:
+            return {}
+        
+        workers = self._stage_concurrency(concurrency)
+        if timeout is None:
+            # Topics are researched in waves of workers["research"]
+            timeout = self.config.PIPELINE_TIMEOUT * math.ceil(len(topics) / workers["research"])
+        
+        self.logger.info("Starting batch of %s topics with stage workers: %s", len(topics), workers)
+        self.demonstrate_integration_methods()
+        
+        with self._batch_lock:
+            pools = {
+                stage: ThreadPoolExecutor(max_workers=count, thread_name_prefix=f"{stage}_stage")
+                for stage, count in workers.items()
+            }
+            with self._stage_lock:
+                self._stage_pools = {stage: pools[stage] for stage in ("analysis", "summary")}
+            
+            request_ids = {topic: uuid.uuid4().hex[:16] for topic in topics}
+            futures = {self.summary_agent.result_future(request_ids[topic]): topic for topic in topics}
+            completed: Dict[str, str] = {}
+            try:
+                for topic in topics:
+                    pools["research"].submit(self.research_agent.execute, topic, refresh=refresh,
+                                             trace_id=request_ids[topic])
+                
+                try:
+                    for future in as_completed(futures, timeout=timeout):
+                        topic = futures[future]
+                        completed[topic] = self._format_result(future.result())
+                except FutureTimeoutError:
+                    self.logger.error("Batch timeout after %s seconds, %s topics unfinished",
+                                      timeout, len(topics) - len(completed))
+            finally:
+                with self._stage_lock:
+                    self._stage_pools = {}
+                for pool in pools.values():
+                    pool.shutdown(wait=False, cancel_futures=True)
+                for request_id in request_ids.values():
+                    self.summary_agent.release_result(request_id)
+        
+        for topic in topics:
+            if topic not in completed:
+                completed[topic] = f"ERROR: Pipeline timeout after {timeout} seconds"
+        
+        self.logger.info("Batch completed: %s topics", len(topics))
+        self._log_cache_stats()
+        if order == "input":
+            return {topic: completed[topic] for topic in topics}
+        return completed
+    
+    async def aprocess_topic(self, topic: str, timeout: Optional[float] = None, refresh: bool = False) -> str:
+        """Async variant of process_topic; many topics can share one event loop"""
+        return await self._aprocess_topic(topic, timeout, refresh)
+    
+    async def _aprocess_topic(self, topic: str, timeout: Optional[float], refresh: bool,
+                              limits: Optional[Dict[str, asyncio.Semaphore]] = None) -> str:
+        """aprocess_topic with every stage of the request held to limits (the shared defaults if None)"""
+        self.logger.info("Starting async pipeline for: '%s'", topic)
+        max_wait_time = self.config.PIPELINE_TIMEOUT if timeout is None else timeout
+        self._ensure_async_pipeline()
+        
+        try:
+            request_id = uuid.uuid4().hex[:16]
+            result_future = asyncio.wrap_future(self.summary_agent.result_future(request_id))
+            start_time = time.time()
+            if limits is None:
+                limits = self._async_limits
+            else:
+                self._request_limits[request_id] = limits
+            
+            try:
+                async with limits["research"]:
+                    await asyncio.wait_for(self.research_agent.aexecute(topic, refresh=refresh, trace_id=request_id),
+                                           max_wait_time)
+                remaining = max(0.0, max_wait_time - (time.time() - start_time))
+                # asyncio.wait leaves the shared future alone on timeout, unlike wait_for
+                done, _ = await asyncio.wait({result_future}, timeout=remaining)
+            finally:
+                if not result_future.done():
+                    result_future.cancel()
+                self.summary_agent.release_result(request_id)
+                self._request_limits.pop(request_id, None)
+            
+            if not done:
+                timeout_msg = f"Pipeline timeout after {max_wait_time} seconds"
+                self.logger.error(timeout_msg)
+                return f"ERROR: {timeout_msg}"
+            
+            self.logger.info("Async pipeline completed successfully")
+            return self._format_result(result_future.result())
+            
+        except asyncio.TimeoutError:
+            timeout_msg = f"Pipeline timeout after {max_wait_time} seconds"
+            self.logger.error(timeout_msg)
+            return f"ERROR: {timeout_msg}"
+        except Exception as e:
+            error_msg = f"Enhanced orchestrator failed: {str(e)}"
+            self.logger.error(error_msg)
+            return f"ERROR: {error_msg}"
+    
+    async def aprocess_topics(self, topics: List[str], concurrency: Union[int, Dict[str, int], None] = None,
+                              order: str = "input", timeout: Optional[float] = None,
+                              refresh: bool = False) -> Dict[str, str]:
+        """Async variant of process_topics; stage limits are semaphores instead of thread pools"""
+        if order not in ("input", "completion"):
+            raise ValueError(f"Unknown result order: {order}")
+        topics = list(dict.fromkeys(topics))
+        if not topics:
+            return {}
+        
+        workers = self._stage_concurrency(concurrency)
+        self._ensure_async_pipeline()
+        # This batch's own limits; other requests on the loop keep theirs
+        limits = {stage: asyncio.Semaphore(count) for stage, count in workers.items()}
+        self.logger.info("Starting async batch of %s topics with stage limits: %s", len(topics), workers)
+        
+        tasks = {
+            asyncio.ensure_future(self._aprocess_topic(topic, timeout, refresh, limits)): topic
+            for topic in topics
+        }
+        completed: Dict[str, str] = {}
+        # Collect results in the order the topics finish
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                completed[tasks[task]] = task.result()
+        
+        self.logger.info("Async batch completed: %s topics", len(topics))
+        self._log_cache_stats()
+        if order == "input":
+            return {topic: completed[topic] for topic in topics}
+        return completed
+    
+    def _ensure_async_pipeline(self):
+        """Bind the async queue and stage consumers to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_loop is loop:
+            return
+        
+        self._async_loop = loop
+        self.async_queue = AsyncMessageQueue(max_size=self.config.QUEUE_MAX_SIZE)
+        for agent in (self.research_agent, self.analysis_agent, self.summary_agent):
+            agent.async_queue = self.async_queue
+        self._async_limits = {
+            stage: asyncio.Semaphore(count) for stage, count in self._stage_concurrency(None).items()
+        }
+        self._async_tasks = {
+            loop.create_task(self._aconsume("analysis", self.analysis_agent)),
+            loop.create_task(self._aconsume("summary", self.summary_agent))
+        }
+    
+    async def _aconsume(self, stage: str, agent):
+        """Feed an agent from the async queue, running up to the stage limit concurrently"""
+        while True:
+            message = await self.async_queue.receive_message(agent.agent_name)
+            limit = self._request_limits.get(self._trace_id(message), self._async_limits)[stage]
+            await limit.acquire()
+            task = asyncio.ensure_future(agent._ahandle_message(message))
+            task.add_done_callback(lambda _, limit=limit: limit.release())
+            task.add_done_callback(lambda _, content=message.content: release_refs(content))
+            self._async_tasks.add(task)
+            task.add_done_callback(self._async_tasks.discard)
+    
+    def process_topic_stream(self, topic: str, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Run the pipeline for topic, yielding events as they happen.
+        
+        Yields {"event": "research_done"} and {"event": "analysis_done"} as the
+        stages finish (preceded by {"event": "research_partial"} for each batch
+        of pipelined research), then {"event": "token", "text": ...} chunks straight
+        from the summary model, and finally {"event": "done"} with the
+        time-to-first-byte (first summary token) and total elapsed seconds.
+        A failure yields {"event": "error"} instead of "done".
+        """
+        max_wait_time = self.config.PIPELINE_TIMEOUT if timeout is None else timeout
+        self.logger.info("Starting streaming pipeline for: '%s'", topic)
+        
+        # Each request gets its own trace id, so concurrent streams of the same topic stay apart
+        stream_id = uuid.uuid4().hex[:16]
+        sink = queue.Queue()
+        self._stream_sinks[stream_id] = sink
+        self.summary_agent.open_stream(stream_id, sink)
+        started = time.perf_counter()
+        ttfb = None
+        
+        # The pipeline runs on its own thread so events can be yielded as they arrive
+        threading.Thread(target=self._run_stream_pipeline, args=(topic, stream_id, sink), daemon=True,
+                         name=f"stream:{topic[:32]}").start()
+        try:
+            while True:
+                remaining = max_wait_time - (time.perf_counter() - started)
+                try:
+                    event = sink.get(timeout=max(0.0, remaining))
+                except queue.Empty:
+                    self.logger.error("Streaming pipeline timeout after %s seconds", max_wait_time)
+                    yield {"event": "error", "topic": topic, "error": f"Pipeline timeout after {max_wait_time} seconds"}
+                    return
+                
+                if event["event"] == "token" and ttfb is None:
+                    ttfb = time.perf_counter() - started
+                    self.ttfb_samples.append(ttfb)
+                    self.logger.info("Time to first summary token for '%s': %.3fs", topic, ttfb)
+                
+                if event["event"] == "summary_done":
+                    yield {"event": "done", "topic": topic, "ttfb": ttfb,
+                           "elapsed": time.perf_counter() - started}
+                    return
+                yield event
+                if event["event"] == "error":
+                    return
+        finally:
+            self._stream_sinks.pop(stream_id, None)
+            self.summary_agent.close_stream(stream_id)
+    
+    async def aprocess_topic_stream(self, topic: str, timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Async iterator variant of process_topic_stream"""
+        events = self.process_topic_stream(topic, timeout=timeout)
+        sentinel = object()
+        try:
+            while True:
+                event = await asyncio.to_thread(next, events, sentinel)
+                if event is sentinel:
+                    return
+                yield event
+        finally:
+            try:
+                events.close()
+            except ValueError:
+                # Still running on a worker thread; it stops at its own timeout
+                pass
+    
+    def _run_stream_pipeline(self, topic: str, stream_id: str, sink: queue.Queue):
+        try:
+            self.research_agent.execute(topic, trace_id=stream_id)
+        except Exception as e:
+            sink.put({"event": "error", "topic": topic, "error": f"Enhanced orchestrator failed: {str(e)}"})
+    
+    def _observe_message(self, message):
+        """Turn pipeline messages for streamed topics into stage events"""
+        if not self._stream_sinks or not isinstance(message.content, dict):
+            return
+        sink = self._stream_sinks.get(self._trace_id(message))
+        if sink is None:
+            return
+        topic = message.content.get("topic")
+        if message.message_type == "research_partial":
+            sink.put({"event": "research_partial", "topic": topic, "part": message.metadata["pipeline"]["part"]})
+        elif message.message_type == "research_data":
+            sink.put({"event": "research_done", "topic": topic, "sender": message.sender})
+        elif message.message_type == "analysis":
+            sink.put({"event": "analysis_done", "topic": topic, "sender": message.sender})
+    
+    def _trace_id(self, message) -> Optional[str]:
+        """Trace id of a pipeline message; partial research messages carry only the id"""
+        trace = message.metadata.get("trace")
+        if trace:
+            return trace["id"]
+        return message.metadata.get("pipeline", {}).get("trace_id")
+    
+    def _stage_concurrency(self, concurrency: Union[int, Dict[str, int], None]) -> Dict[str, int]:
+        """Resolve the per-stage worker counts for a batch"""
+        workers = {
+            "research": self.config.RESEARCH_WORKERS,
+            "analysis": self.config.ANALYSIS_WORKERS,
+            "summary": self.config.SUMMARY_WORKERS
+        }
+        if isinstance(concurrency, int):
+            workers = {stage: concurrency for stage in workers}
+        elif concurrency:
+            unknown = set(concurrency) - set(workers)
+            if unknown:
+                raise ValueError(f"Unknown pipeline stages: {sorted(unknown)}")
+            workers.update(concurrency)
+        if any(count < 1 for count in workers.values()):
+            raise ValueError(f"Stage concurrency must be at least 1: {workers}")
+        return workers
+    
+    def _dispatch(self, stage: str, agent, drain: bool = False):
+        """Hand a newly delivered message (or, with drain, all pending ones) to its agent on the stage pool"""
+        with self._stage_lock:
+            pool = self._stage_pools.get(stage) or self._default_pools[stage]
+        try:
+            pool.submit(agent.process_messages if drain else agent.process_next_message)
+        except RuntimeError:
+            # Shut down: the message stays queued (a durable queue keeps it for the next run)
+            self.logger.debug("Not dispatching to the %s stage after shutdown", stage)
+    
+    def resume_pending(self) -> int:
+        """Handle messages already waiting in the queue, e.g. recovered after a restart"""
+        pending = self.message_queue.depth()
+        if pending:
+            self.logger.info("Resuming %s pending message(s)", pending)
+            workers = self.stage_workers.workers if self.stage_workers is not None else {}
+            for stage, agent in (("analysis", self.analysis_agent), ("summary", self.summary_agent)):
+                if stage not in workers:
+                    self._dispatch(stage, agent, drain=True)
+        return pending
+    
+    def get_cache_stats(self) -> Dict[str, Dict]:
+        """Hit rates and savings for the search and LLM response caches and the source deduplicator"""
+        stats = {}
+        # The MCP research agent has neither a cache nor a search backend
+        search_cache = (getattr(self.research_agent, "search_cache", None)
+                        or getattr(getattr(self.research_agent, "search_backend", None), "search_cache", None))
+        if search_cache is not None:
+            stats["search"] = search_cache.get_stats()
+        if self.response_cache is not None:
+            stats["llm"] = self.response_cache.get_stats()
+        if self.analysis_agent.deduplicator is not None:
+            stats["dedup"] = self.analysis_agent.deduplicator.get_stats()
+        return stats
+    
+    def export_metrics(self, format: str = "json") -> Union[str, Dict[str, Any]]:
+        """Pipeline metrics as Prometheus text ("prometheus") or a JSON-serializable snapshot ("json")
+        
+        The snapshot adds queue, cache, blob store and per-upstream resilience statistics
+        and the most recent finished traces to the metric series.
+        """
+        if format not in ("json", "prometheus"):
+            raise ValueError(f"Unknown metrics format: {format}")
+        # Queue depth is sampled at export time rather than updated on every send and receive
+        queue_stats = self.message_queue.get_stats()
+        for receiver, depth in queue_stats["depth"].items():
+            metrics.set_gauge("queue_depth", depth, receiver=receiver)
+            metrics.set_gauge("queue_peak_depth", queue_stats["peak_depth"].get(receiver, depth), receiver=receiver)
+        
+        if format == "prometheus":
+            return metrics.to_prometheus()
+        blob_store = get_blob_store()
+        return {
+            **metrics.snapshot(),
+            "queue": queue_stats,
+            "caches": self.get_cache_stats(),
+            "blobs": blob_store.get_stats() if blob_store is not None else None,
+            "logging": get_logging_stats(),
+            "resilience": get_metrics()
+        }
+    
+    def _log_cache_stats(self):
+        if self.response_cache is not None:
+            llm = self.response_cache.get_stats()
+            self.logger.info("LLM cache: %s hits, %s misses (%.0f%% hit rate), %.1fs latency saved",
+                             llm['hits'], llm['misses'], llm['hit_rate'] * 100, llm['latency_saved'])
+    
+    def _format_result(self, result: str) -> str:
+        """Add integration method info to result"""
+        return f"""
+{result}
+
+---
+INTEGRATION METHODS USED:
+• Agent Framework: CrewAI
+• Communication: Message Queue Protocol  
+• External Tools: {'MCP (Model Context Protocol)' if self.use_mcp else 'Basic Tools'}
+"""
@@ -0,0 +1,476 @@
+"""
+Local-corpus search: BM25 over a directory of text, Markdown and HTML files.
+
+Research can run over internal documents with no web access. The index is
+built into LOCAL_CORPUS_INDEX_DIR as a generation directory of flat NumPy
+arrays, which are memory-mapped rather than read at query time, so opening
+even a large index costs only its document list:
+
+- terms.npy: the vocabulary, sorted, searched with np.searchsorted
+- offsets.npy: where each term's postings start
+- doc_ids.npy / tfs.npy: postings (uint32 document ids, uint16 term counts)
+- doc_lengths.npy: tokens per document
+- docs.json: path, size, mtime and title of every document
+
+update() re-reads only files that are new or whose size or mtime changed.
+Postings of unchanged files are carried over from the current generation,
+and the new generation replaces it atomically (through the CURRENT file),
+so searches never see a half-written index.
+
+Build or refresh an index ahead of time with:
+
+    python local_corpus.py build ./docs
+    python local_corpus.py search ./docs "retention policy"
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import inc
+
+FORMAT_VERSION = 1
+EXTENSIONS = (".txt", ".text", ".md", ".markdown", ".html", ".htm")
+# Longer tokens (hashes, base64, minified code) are not indexed; they would widen every vocabulary entry
+MAX_TERM_CHARS = 40
+MAX_TF = np.iinfo(np.uint16).max
+
+_WORD = re.compile(r"\w+")
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _WORD.findall(text.lower()) if len(token) <= MAX_TERM_CHARS]
+
+
+class _HTMLText(HTMLParser):
+    """Visible text and title of an HTML page, with block elements as paragraph breaks"""
+    _SKIP = {"script", "style", "noscript", "template", "svg", "head"}
+    _BLOCK = {"p", "div", "br", "li", "tr", "pre", "blockquote", "section", "article", "header", "footer",
+              "table", "ul", "ol", "hr", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.title_parts: List[str] = []
+        self._skip = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag in self._SKIP:
+            self._skip += 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n\n")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in self._SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag in self._BLOCK:
+            self.parts.append("\n\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title_parts.append(data)
+        elif not self._skip:
+            self.parts.append(data)
+
+
+def read_document(path: str) -> Tuple[str, str]:
+    """(title, text) of a corpus file; HTML is reduced to its visible text"""
+    with open(path, "rb") as f:
+        raw = f.read().decode("utf-8", errors="replace")
+    title = ""
+    if path.lower().endswith((".html", ".htm")):
+        parser = _HTMLText()
+        parser.feed(raw)
+        parser.close()
+        title = " ".join("".join(parser.title_parts).split())
+        text = "".join(parser.parts)
+    else:
+        text = raw
+        if path.lower().endswith((".md", ".markdown")):
+            heading = _HEADING.search(text)
+            title = heading.group(1) if heading else ""
+    if not title:
+        first_line = next((line.strip() for line in text.splitlines() if line.strip()), "")
+        title = first_line if len(first_line) <= 100 else Path(path).stem
+    return title, text
+
+
+@dataclass
+class _Generation:
+    """One immutable, memory-mapped version of the index"""
+    name: str
+    corpus: str
+    docs: List[Dict[str, Any]]
+    terms: np.ndarray
+    offsets: np.ndarray
+    doc_ids: np.ndarray
+    tfs: np.ndarray
+    doc_lengths: np.ndarray
+    avg_length: float
+    _norms: Optional[np.ndarray] = field(default=None, repr=False)
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        key = term.encode("utf-8")
+        position = int(np.searchsorted(self.terms, key))
+        if position == len(self.terms) or self.terms[position] != key:
+            return self.doc_ids[:0], self.tfs[:0]
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    def norms(self, k1: float, b: float) -> np.ndarray:
+        """BM25 length normalization k1 * (1 - b + b * length / avg_length) per document"""
+        if self._norms is None:
+            lengths = np.asarray(self.doc_lengths, dtype=np.float32)
+            self._norms = k1 * (1.0 - b + b * lengths / max(self.avg_length, 1.0))
+        return self._norms
+
+
+class LocalCorpusIndex:
+    """On-disk BM25 inverted index over the text, Markdown and HTML files under corpus_dir"""
+
+    def __init__(self, corpus_dir: str, index_dir: str, k1: float = 1.2, b: float = 0.75,
+                 snippet_chars: int = 500):
+        self.corpus_dir = os.path.abspath(corpus_dir)
+        self.index_dir = os.path.abspath(index_dir)
+        self.k1 = k1
+        self.b = b
+        self.snippet_chars = snippet_chars
+        self.logger = logging.getLogger(__name__)
+        self._generation: Optional[_Generation] = None
+        self._loaded = False
+        self._update_lock = threading.Lock()
+        self.last_update: Dict[str, Any] = {}
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        """Top documents for query by BM25, as search results with a best-matching passage as the body"""
+        generation = self._current()
+        if generation is None or not generation.docs:
+            return []
+        count = len(generation.docs)
+        scores = np.zeros(count, dtype=np.float32)
+        weights: Dict[str, float] = {}
+        norms = generation.norms(self.k1, self.b)
+        for term in dict.fromkeys(tokenize(query)):
+            doc_ids, tfs = generation.postings(term)
+            if not len(doc_ids):
+                continue
+            idf = float(np.log(1.0 + (count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5)))
+            weights[term] = idf
+            tfs = np.asarray(tfs, dtype=np.float32)
+            # Each document appears once in a term's postings, so the fancy-indexed add is exact
+            scores[doc_ids] += idf * tfs * (self.k1 + 1.0) / (tfs + norms[doc_ids])
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > max_results:
+            matched = matched[np.argpartition(-scores[matched], max_results - 1)[:max_results]]
+        ranked = matched[np.argsort(-scores[matched], kind="stable")]
+
+        results = []
+        for doc_id in ranked.tolist():
+            doc = generation.docs[doc_id]
+            path = os.path.join(generation.corpus, doc["path"])
+            results.append({"title": doc["title"], "href": Path(path).as_uri(),
+                            "body": self._snippet(path, weights)})
+        return results
+
+    def update(self) -> Dict[str, Any]:
+        """Index new and changed files, drop deleted ones, and switch to the new generation"""
+        with self._update_lock:
+            started = time.perf_counter()
+            files = self._scan()
+            current = self._current()
+            old_docs = current.docs if current is not None and current.corpus == self.corpus_dir else []
+            keep = [doc_id for doc_id, doc in enumerate(old_docs)
+                    if files.get(doc["path"]) == (doc["mtime_ns"], doc["size"])]
+            kept_paths = {old_docs[doc_id]["path"] for doc_id in keep}
+            old_paths = {doc["path"] for doc in old_docs}
+            changed = sorted(path for path in files if path not in kept_paths)
+            stats = {"added": sum(path not in old_paths for path in changed),
+                     "modified": sum(path in old_paths for path in changed),
+                     "removed": len(old_paths - set(files)), "unchanged": len(keep)}
+
+            if changed or len(keep) != len(old_docs) or current is None:
+                self._write(self._build(current if old_docs else None, keep, changed, files))
+            stats["seconds"] = round(time.perf_counter() - started, 3)
+            self.last_update = stats
+            if changed or stats["removed"]:
+                inc("local_corpus_files_indexed_total", len(changed))
+                self.logger.info("Local corpus index updated: %s", stats)
+            return stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        generation = self._current()
+        if generation is None:
+            return {"documents": 0, "corpus": self.corpus_dir, "index": self.index_dir}
+        return {"documents": len(generation.docs), "terms": len(generation.terms),
+                "postings": len(generation.doc_ids), "generation": generation.name,
+                "corpus": self.corpus_dir, "index": self.index_dir, "last_update": self.last_update}
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """Relative path -> (mtime_ns, size) of every indexable file, skipping hidden directories"""
+        files = {}
+        for root, dirs, names in os.walk(self.corpus_dir):
+            dirs[:] = [name for name in dirs if not name.startswith(".")
+                       and os.path.join(root, name) != self.index_dir]
+            for name in names:
+                if not name.lower().endswith(EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[os.path.relpath(path, self.corpus_dir).replace(os.sep, "/")] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _build(self, current: Optional[_Generation], keep: List[int], changed: List[str],
+               files: Dict[str, Tuple[int, int]]) -> Dict[str, Any]:
+        """Arrays of the next generation: kept documents' postings plus the changed files, re-tokenized"""
+        docs = [current.docs[doc_id] for doc_id in keep] if current is not None else []
+        lengths = [doc["length"] for doc in docs]
+        new_terms: List[str] = []
+        new_tfs: List[int] = []
+        new_doc_ids: List[int] = []
+        for path in changed:
+            try:
+                title, text = read_document(os.path.join(self.corpus_dir, path))
+            except OSError as e:
+                self.logger.warning("Skipping unreadable corpus file %s: %s", path, e)
+                continue
+            tokens = tokenize(text)
+            counts = Counter(tokens)
+            new_doc_ids.extend([len(docs)] * len(counts))
+            new_terms.extend(counts)
+            new_tfs.extend(counts.values())
+            mtime_ns, size = files[path]
+            docs.append({"path": path, "mtime_ns": mtime_ns, "size": size, "title": title, "length": len(tokens)})
+            lengths.append(len(tokens))
+
+        vocabulary = set(new_terms)
+        term_ids, doc_ids, tfs = [], [], []
+        if current is not None and keep:
+            old_terms = [term.decode("utf-8") for term in current.terms.tolist()]
+            vocabulary.update(old_terms)
+        vocabulary = sorted(vocabulary)
+        ids = {term: term_id for term_id, term in enumerate(vocabulary)}
+
+        if current is not None and keep:
+            # Renumber kept documents 0..len(keep)-1 in their old order and drop the others' postings
+            kept = np.zeros(len(current.docs), dtype=bool)
+            kept[keep] = True
+            renumber = np.cumsum(kept) - 1
+            old_doc_ids = np.asarray(current.doc_ids)
+            selected = kept[old_doc_ids]
+            old_term_ids = np.repeat(np.arange(len(old_terms)), np.diff(current.offsets))
+            remap = np.fromiter(map(ids.__getitem__, old_terms), dtype=np.int64, count=len(old_terms))
+            term_ids.append(remap[old_term_ids[selected]])
+            doc_ids.append(renumber[old_doc_ids[selected]])
+            tfs.append(np.asarray(current.tfs)[selected])
+        term_ids.append(np.fromiter(map(ids.__getitem__, new_terms), dtype=np.int64, count=len(new_terms)))
+        doc_ids.append(np.array(new_doc_ids, dtype=np.int64))
+        tfs.append(np.minimum(np.array(new_tfs, dtype=np.int64), MAX_TF))
+
+        term_ids, doc_ids, tfs = np.concatenate(term_ids), np.concatenate(doc_ids), np.concatenate(tfs)
+        order = np.lexsort((doc_ids, term_ids))
+        frequencies = np.bincount(term_ids, minlength=len(vocabulary))
+        # Terms whose every document was removed leave the vocabulary
+        used = np.flatnonzero(frequencies)
+        return {
+            "docs": docs,
+            "terms": np.array([vocabulary[term_id].encode("utf-8") for term_id in used.tolist()], dtype=np.bytes_),
+            "offsets": np.concatenate([[0], np.cumsum(frequencies[used])]).astype(np.int64),
+            "doc_ids": doc_ids[order].astype(np.uint32),
+            "tfs": tfs[order].astype(np.uint16),
+            "doc_lengths": np.array(lengths, dtype=np.uint32)
+        }
+
+    def _write(self, arrays: Dict[str, Any]):
+        """Write a new generation next to the current one and switch CURRENT to it"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        current = self._current()
+        number = int(current.name.split("-")[1]) + 1 if current is not None else 1
+        name = f"gen-{number:06d}"
+        staging = os.path.join(self.index_dir, f"{name}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        docs = arrays.pop("docs")
+        for key, array in arrays.items():
+            np.save(os.path.join(staging, f"{key}.npy"), array)
+        lengths = arrays["doc_lengths"]
+        meta = {"format": FORMAT_VERSION, "corpus": self.corpus_dir,
+                "avg_length": float(lengths.mean()) if len(lengths) else 0.0, "docs": docs}
+        with open(os.path.join(staging, "docs.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(staging, os.path.join(self.index_dir, name))
+        pointer = os.path.join(self.index_dir, "CURRENT.tmp")
+        with open(pointer, "w") as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(self.index_dir, "CURRENT"))
+
+        self._generation = self._open(name)
+        # Open generations stay readable through their mappings after their files are removed
+        for entry in os.listdir(self.index_dir):
+            if entry.startswith("gen-") and entry != name:
+                shutil.rmtree(os.path.join(self.index_dir, entry), ignore_errors=True)
+
+    def _current(self) -> Optional[_Generation]:
+        if not self._loaded:
+            self._loaded = True
+            try:
+                with open(os.path.join(self.index_dir, "CURRENT")) as f:
+                    self._generation = self._open(f.read().strip())
+            except (OSError, ValueError, KeyError) as e:
+                if not isinstance(e, FileNotFoundError):
+                    self.logger.warning("Ignoring unreadable local corpus index in %s: %s", self.index_dir, e)
+                self._generation = None
+        return self._generation
+
+    def _open(self, name: str) -> _Generation:
+        path = os.path.join(self.index_dir, name)
+        with open(os.path.join(path, "docs.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"index format {meta.get('format')} is not {FORMAT_VERSION}")
+
+        def load(key):
+            # Empty arrays can't be memory-mapped
+            return np.load(os.path.join(path, f"{key}.npy"), mmap_mode="r" if meta["docs"] else None)
+
+        return _Generation(name=name, corpus=meta["corpus"], docs=meta["docs"], terms=load("terms"),
+                           offsets=load("offsets"), doc_ids=load("doc_ids"), tfs=load("tfs"),
+                           doc_lengths=load("doc_lengths"), avg_length=meta["avg_length"])
+
+    def _snippet(self, path: str, weights: Dict[str, float]) -> str:
+        """The paragraph of a document that best covers the query terms"""
+        try:
+            _, text = read_document(path)
+        except OSError:
+            return ""
+        paragraphs = [paragraph for paragraph in _PARAGRAPH_BREAK.split(text) if paragraph.strip()]
+        if not paragraphs:
+            return ""
+
+        def coverage(paragraph):
+            tokens = tokenize(paragraph)
+            # Ties go to the longer paragraph, so a heading loses to the text under it
+            return sum(weights.get(term, 0.0) for term in set(tokens)), min(len(tokens), 50)
+
+        best = max(paragraphs, key=coverage)
+        return " ".join(best.split())[:self.snippet_chars]
+
+
+class LocalCorpusSearchBackend:
+    """Search backend over a LocalCorpusIndex that picks up changed files every refresh_interval seconds.
+
+    The index is brought up to date in the background on creation; the
+    first search waits for that, later refreshes never block a search.
+    A negative refresh_interval checks for changes only once.
+    """
+
+    # Results change whenever the corpus does, and a local search is cheaper than a cache lookup
+    cacheable = False
+
+    def __init__(self, index: LocalCorpusIndex, refresh_interval: float = 300.0):
+        self.index = index
+        self.refresh_interval = refresh_interval
+        self.logger = logging.getLogger(__name__)
+        self._checked: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self._refresh_in_background()
+
+    @classmethod
+    def from_config(cls, settings) -> "LocalCorpusSearchBackend":
+        if not settings.LOCAL_CORPUS_DIR:
+            raise ValueError("LOCAL_CORPUS_DIR must be set to search a local corpus")
+        index = LocalCorpusIndex(settings.LOCAL_CORPUS_DIR, settings.LOCAL_CORPUS_INDEX_DIR)
+        return cls(index, refresh_interval=settings.LOCAL_CORPUS_REFRESH_INTERVAL)
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        if self._checked is None:
+            self.refresh(force=False)
+        elif self._due():
+            self._refresh_in_background()
+        return self.index.search(query, max_results=max_results)
+
+    def refresh(self, force: bool = True) -> Optional[Dict[str, Any]]:
+        """Re-index changed files now (unless force is False and it isn't due)"""
+        with self._refresh_lock:
+            if not force and not self._due():
+                return None
+            stats = self.index.update()
+            self._checked = time.monotonic()
+            return stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.index.get_stats()
+
+    def _due(self) -> bool:
+        if self._checked is None:
+            return True
+        return self.refresh_interval >= 0 and time.monotonic() - self._checked >= self.refresh_interval
+
+    def _refresh_in_background(self):
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="local-corpus-indexer", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh(force=False)
+        except Exception as e:
+            self.logger.error("Local corpus indexing failed: %s", e)
+        finally:
+            with self._state_lock:
+                self._refreshing = False
+
+
+def main():
+    from config import config
+
+    parser = argparse.ArgumentParser(description="Build or query the local corpus BM25 index")
+    parser.add_argument("command", choices=("build", "search"))
+    parser.add_argument("corpus_dir", nargs="?", default=config.LOCAL_CORPUS_DIR)
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--index-dir", default=config.LOCAL_CORPUS_INDEX_DIR)
+    parser.add_argument("--max-results", type=int, default=5)
+    args = parser.parse_args()
+    if not args.corpus_dir:
+        parser.error("corpus_dir is required when LOCAL_CORPUS_DIR is not set")
+
+    index = LocalCorpusIndex(args.corpus_dir, args.index_dir)
+    if args.command == "build":
+        print(json.dumps(index.update()))
+        print(json.dumps({key: value for key, value in index.get_stats().items() if key != "last_update"}))
+        return
+    started = time.perf_counter()
+    results = index.search(args.query, max_results=args.max_results)
+    print(json.dumps({"results": len(results), "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}))
+    for result in results:
+        print(json.dumps({**result, "body": result["body"][:300]}))
+
+
+if __name__ == "__main__":
+    main()
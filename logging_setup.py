@@ -0,0 +1,210 @@
+"""
+Non-blocking logging pipeline.
+
+setup_logging() puts a QueueHandler on the root logger and moves the
+console and file handlers onto a QueueListener thread. Agents and stage
+workers only append records to an in-memory queue. They never wait on
+stdout or disk, and when the queue is full records are dropped and
+counted rather than blocking.
+
+- Messages are formatted on the listener thread, so %-style calls cost
+  almost nothing for records that are dropped or filtered
+- Formatted messages are capped at LOG_MAX_MESSAGE_CHARS; capped() bounds
+  large values such as tool parameters before they are even formatted
+- Hot-path records logged with extra=sampled("key") keep only one in
+  LOG_SAMPLE_RATE per key
+- LOG_FORMAT=json writes one JSON object per line, with the active trace id
+  and topic attached to every record
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import reprlib
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from metrics import current_trace, inc
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+PROCESS_TEXT_FORMAT = '%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came from extra= and is emitted as a JSON field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_capped_repr = reprlib.Repr()
+_capped_repr.maxstring = 200
+_capped_repr.maxother = 200
+_capped_repr.maxdict = 10
+_capped_repr.maxlist = 10
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+_setup_lock = threading.Lock()
+
+
+class capped:
+    """Log argument rendered with bounded length and depth, only if the record is emitted"""
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        return _capped_repr.repr(self.value)
+
+    __repr__ = __str__
+
+
+def sampled(key: str) -> Dict[str, str]:
+    """extra= mapping that subjects a hot-path record to per-key sampling"""
+    return {"sample_key": key}
+
+
+class SamplingFilter(logging.Filter):
+    """Keep the first and then every rate-th record for each sample_key; others pass untouched"""
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample_key", None)
+        if key is None or self.rate == 1 or record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % self.rate == 0
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the logging thread and defers formatting to the listener"""
+
+    def __init__(self, log_queue: queue.Queue, max_size: int = 0):
+        super().__init__(log_queue)
+        # Enforced here rather than by the queue, so the listener's stop sentinel always fits
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process, so the record needn't be flattened for pickling;
+        # only the context that lives in this thread is captured now
+        trace = current_trace()
+        if trace is not None:
+            record.trace_id = trace.trace_id
+            record.topic = trace.topic
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.max_size and self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            inc("log_records_dropped_total")
+            return
+        self.queue.put_nowait(record)
+
+
+class CappedFormatter(logging.Formatter):
+    """Text formatter that truncates long messages"""
+
+    def __init__(self, fmt: str, max_chars: int):
+        super().__init__(fmt)
+        self.max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _truncate(record.message, self.max_chars)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with the message, trace context and any extra= fields"""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _truncate(record.getMessage(), self.max_chars),
+            "process": record.processName,
+            "thread": record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sample_key":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = _truncate(self.formatException(record.exc_info), self.max_chars * 4)
+        return json.dumps(entry, default=str)
+
+
+def _truncate(text: str, limit: int) -> str:
+    if limit and len(text) > limit:
+        return f"{text[:limit]}... [{len(text) - limit} more chars]"
+    return text
+
+
+def setup_logging(settings, log_file: Optional[str] = None, process_name: bool = False) -> bool:
+    """Route the root logger through a background writer thread.
+
+    Does nothing if the root logger already has handlers (as with
+    logging.basicConfig), so applications keep their own configuration.
+    Returns True if this call installed the pipeline.
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        root = logging.getLogger()
+        if root.handlers:
+            return False
+
+        max_chars = settings.LOG_MAX_MESSAGE_CHARS
+        if settings.LOG_FORMAT == "json":
+            formatter = JsonFormatter(max_chars)
+        elif settings.LOG_FORMAT == "text":
+            formatter = CappedFormatter(PROCESS_TEXT_FORMAT if process_name else TEXT_FORMAT, max_chars)
+        else:
+            raise ValueError(f"Unknown LOG_FORMAT: {settings.LOG_FORMAT}")
+
+        handlers = [logging.StreamHandler(sys.stdout)]
+        log_file = settings.LOG_FILE if log_file is None else log_file
+        if log_file:
+            handlers.append(logging.FileHandler(log_file))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        _queue_handler = NonBlockingQueueHandler(queue.Queue(), max(0, settings.LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE))
+        root.addHandler(_queue_handler)
+        root.setLevel(getattr(logging, settings.LOG_LEVEL))
+
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return True
+
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    with _setup_lock:
+        if _queue_handler is not None:
+            logging.getLogger().removeHandler(_queue_handler)
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    handler = _queue_handler
+    if handler is None:
+        return {"enabled": False}
+    return {"enabled": True, "queued": handler.queue.qsize(), "dropped": handler.dropped}
@@ -1,100 +1,155 @@
-from crewai import Agent
-from mcp_tools import MCPToolServer
-from communication import AgentMessage, MessageQueue
-from config import config
-import logging
-from datetime import datetime
-
-class MCPResearchAgent:
-    """Research Agent enhanced with MCP tools"""
-    
-    def __init__(self, message_queue: MessageQueue):
-        self.message_queue = message_queue
-        self.agent_name = "mcp_research_agent"
-        self.logger = logging.getLogger(__name__)
-        self.mcp_server = MCPToolServer()
-        
-        # Initialize MCP tools
-        self.mcp_tools_available = False
-        self._init_mcp_tools()
-        
-        self.agent = Agent(
-            role="MCP-Enhanced Research Specialist",
-            goal="Use MCP tools to gather comprehensive information from external resources",
-            backstory="""You are an expert researcher with access to MCP tools for 
-            enhanced web search, data analysis, and fact verification.""",
-            allow_delegation=False,
-            verbose=True,
-            model=config.MODEL
-        )
-    
-    def _init_mcp_tools(self):
-        """Initialize MCP tools"""
-        try:
-            self.mcp_tools_available = self.mcp_server.start_server()
-            if self.mcp_tools_available:
-                self.logger.info("MCP tools initialized successfully")
-            else:
-                self.logger.warning("MCP tools not available, falling back to basic search")
-        except Exception as e:
-            self.logger.error(f"MCP tools initialization failed: {e}")
-    
-    def execute(self, topic: str):
-        """Execute research using MCP tools"""
-        try:
-            self.logger.info(f"MCP Research Agent starting work on: {topic}")
-            
-            if self.mcp_tools_available:
-                # Use MCP tools for enhanced research
-                search_results = self.mcp_server.execute_tool(
-                    "web_search", 
-                    {"query": f"latest developments in {topic}"}
-                )
-                
-                analysis_results = self.mcp_server.execute_tool(
-                    "data_analysis",
-                    {"data": f"Research data about {topic}"}
-                )
-                
-                research_result = f"""
-                MCP-ENHANCED RESEARCH:
-                {search_results}
-                
-                MCP ANALYSIS:
-                {analysis_results}
-                """
-            else:
-                # Fallback to basic research
-                research_result = f"Basic research results for: {topic}"
-            
-            # Send message to analysis agent
-            message = AgentMessage(
-                sender=self.agent_name,
-                receiver="analysis_agent",
-                content={
-                    "topic": topic,
-                    "research_data": research_result,
-                    "status": "success",
-                    "mcp_enhanced": self.mcp_tools_available
-                },
-                message_type="research_data",
-                timestamp=datetime.now().isoformat(),
-                metadata={"mcp_tools_used": self.mcp_tools_available}
-            )
-            self.message_queue.send_message(message)
-            self.logger.info("MCP Research completed and sent to analysis agent")
-            
-        except Exception as e:
-            self.logger.error(f"MCP Research agent failed: {str(e)}")
-            error_message = AgentMessage(
-                sender=self.agent_name,
-                receiver="summary_agent",
-                content={
-                    "topic": topic,
-                    "error": f"MCP Research failed: {str(e)}",
-                    "status": "error"
-                },
-                message_type="error",
-                timestamp=datetime.now().isoformat()
-            )
-            self.message_queue.send_message(error_message)
\ No newline at end of file
+from mcp_tools import MCPToolServer
+from blob_store import store_large
+from communication import AgentMessage, MessageQueue, AsyncMessageQueue
+from config import config
+from metrics import traced_stage
+from typing import Optional
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+class MCPResearchAgent:
+    """Research Agent enhanced with MCP tools"""
+    
+    def __init__(self, message_queue: MessageQueue, async_queue: Optional[AsyncMessageQueue] = None):
+        self.message_queue = message_queue
+        self.async_queue = async_queue
+        self.agent_name = "mcp_research_agent"
+        self.logger = logging.getLogger(__name__)
+        self.mcp_server = MCPToolServer()
+        
+        # Initialize MCP tools
+        self.mcp_tools_available = False
+        self._init_mcp_tools()
+        
+        # crewai is imported and the CrewAI agent built on first use
+        self._agent = None
+        self._agent_lock = threading.Lock()
+    
+    @property
+    def agent(self):
+        """CrewAI agent, constructed on first access"""
+        if self._agent is None:
+            with self._agent_lock:
+                if self._agent is None:
+                    self._agent = self._build_agent()
+        return self._agent
+    
+    @agent.setter
+    def agent(self, agent):
+        self._agent = agent
+    
+    def _build_agent(self):
+        from crewai import Agent
+        return Agent(
+            role="MCP-Enhanced Research Specialist",
+            goal="Use MCP tools to gather comprehensive information from external resources",
+            backstory="""You are an expert researcher with access to MCP tools for 
+            enhanced web search, data analysis, and fact verification.""",
+            allow_delegation=False,
+            verbose=True,
+            model=config.MODEL
+        )
+    
+    def _init_mcp_tools(self):
+        """Initialize MCP tools"""
+        try:
+            self.mcp_tools_available = self.mcp_server.start_server()
+            if self.mcp_tools_available:
+                self.logger.info("MCP tools initialized successfully")
+            else:
+                self.logger.warning("MCP tools not available, falling back to basic search")
+        except Exception as e:
+            self.logger.error("MCP tools initialization failed: %s", e)
+    
+    @traced_stage("research")
+    def execute(self, topic: str, refresh: bool = False):
+        """Execute research using MCP tools"""
+        try:
+            self.logger.debug("MCP Research Agent starting work on: %s", topic)
+            
+            research_result = self._research(topic)
+            
+            # Send message to analysis agent
+            self.message_queue.send_message(self._research_message(topic, research_result, refresh))
+            self.logger.debug("MCP Research completed and sent to analysis agent")
+            
+        except Exception as e:
+            self.logger.error("MCP Research agent failed: %s", e)
+            self.message_queue.send_message(self._error_message(topic, e))
+    
+    @traced_stage("research")
+    async def aexecute(self, topic: str, refresh: bool = False):
+        """Async variant of execute that sends through the async message queue"""
+        try:
+            self.logger.debug("MCP Research Agent starting work on: %s", topic)
+            
+            # MCP tool calls are blocking, keep them off the event loop
+            research_result = await asyncio.to_thread(self._research, topic)
+            
+            await self.async_queue.send_message(self._research_message(topic, research_result, refresh))
+            self.logger.debug("MCP Research completed and sent to analysis agent")
+            
+        except Exception as e:
+            self.logger.error("MCP Research agent failed: %s", e)
+            await self.async_queue.send_message(self._error_message(topic, e))
+    
+    def _research(self, topic: str) -> str:
+        """Gather research for topic with MCP tools, or a basic placeholder without them"""
+        if self.mcp_tools_available:
+            # Use MCP tools for enhanced research; the calls are independent so run them together
+            calls = [
+                ("web_search", {"query": f"latest developments in {topic}"}),
+                ("data_analysis", {"data": f"Research data about {topic}"})
+            ]
+            if "local_search" in self.mcp_server.tools:
+                calls.append(("local_search", {"query": topic}))
+            search, analysis, *local = self.mcp_server.execute_tools(calls)
+            if all(call["status"] != "ok" for call in (search, analysis, *local)):
+                raise RuntimeError("MCP tools failed: " + "; ".join(call["result"] for call in (search, analysis, *local)))
+            search_results = search["result"]
+            analysis_results = analysis["result"]
+            
+            research = f"""
+            MCP-ENHANCED RESEARCH:
+            {search_results}
+            
+            MCP ANALYSIS:
+            {analysis_results}
+            """
+            if local and local[0]["status"] == "ok":
+                # Left unindented so its Source blocks split like any other research text
+                research += f"\nLOCAL DOCUMENTS:\n{local[0]['result']}\n"
+            return research
+        # Fallback to basic research
+        return f"Basic research results for: {topic}"
+    
+    def _research_message(self, topic: str, research_result: str, refresh: bool = False) -> AgentMessage:
+        return AgentMessage(
+            sender=self.agent_name,
+            receiver="analysis_agent",
+            content={
+                "topic": topic,
+                "research_data": store_large(research_result),
+                "status": "success",
+                "mcp_enhanced": self.mcp_tools_available,
+                "refresh": refresh
+            },
+            message_type="research_data",
+            timestamp=datetime.now().isoformat(),
+            metadata={"mcp_tools_used": self.mcp_tools_available}
+        )
+    
+    def _error_message(self, topic: str, error: Exception) -> AgentMessage:
+        return AgentMessage(
+            sender=self.agent_name,
+            receiver="summary_agent",
+            content={
+                "topic": topic,
+                "error": f"MCP Research failed: {str(error)}",
+                "status": "error"
+            },
+            message_type="error",
+            timestamp=datetime.now().isoformat()
+        )
@@ -1,69 +1,181 @@
-import logging
-from typing import List, Dict
-
-class MCPToolServer:
-    """MCP Server for providing external tools to agents"""
-    
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        self.available_tools = []
-    
-    def start_server(self):
-        """Start MCP server with available tools"""
-        try:
-            self.logger.info("MCP Tool Server starting...")
-            self.available_tools = [
-                "web_search",
-                "data_analysis", 
-                "content_summarization",
-                "fact_verification"
-            ]
-            self.logger.info(f"MCP Server started with tools: {self.available_tools}")
-            return True
-        except Exception as e:
-            self.logger.error(f"MCP Server failed to start: {e}")
-            return False
-    
-    def get_tools(self) -> List[str]:
-        """Get available MCP tools"""
-        return self.available_tools
-    
-    def execute_tool(self, tool_name: str, parameters: Dict) -> str:
-        """Execute MCP tool"""
-        try:
-            self.logger.info(f"Executing MCP tool: {tool_name} with params: {parameters}")
-            
-            if tool_name == "web_search":
-                return self._mock_web_search(parameters)
-            elif tool_name == "data_analysis":
-                return self._mock_data_analysis(parameters)
-            elif tool_name == "content_summarization":
-                return self._mock_summarization(parameters)
-            elif tool_name == "fact_verification":
-                return self._mock_fact_verification(parameters)
-            else:
-                return f"Tool {tool_name} not found"
-                
-        except Exception as e:
-            self.logger.error(f"MCP tool execution failed: {e}")
-            return f"Tool execution error: {str(e)}"
-    
-    def _mock_web_search(self, params: Dict) -> str:
-        """Mock web search via MCP"""
-        query = params.get("query", "")
-        return f"MCP Web Search Results for '{query}': Found relevant information about the topic from multiple sources."
-    
-    def _mock_data_analysis(self, params: Dict) -> str:
-        """Mock data analysis via MCP"""
-        data = params.get("data", "")
-        return f"MCP Data Analysis: Analyzed research data and identified key patterns and trends."
-    
-    def _mock_summarization(self, params: Dict) -> str:
-        """Mock content summarization via MCP"""
-        content = params.get("content", "")
-        return f"MCP Summary: Extracted main points and structured the information effectively."
-    
-    def _mock_fact_verification(self, params: Dict) -> str:
-        """Mock fact verification via MCP"""
-        claim = params.get("claim", "")
-        return f"MCP Fact Check: Verified information reliability for: '{claim}'"
\ No newline at end of file
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from caching import LRUCache
+from logging_setup import capped
+from config import config
+from resilience import get_policy
+from sources import format_sources
+from metrics import in_context, span
+
+@dataclass
+class MCPTool:
+    """A registered MCP tool and its execution limits"""
+    name: str
+    func: Callable[[Dict], str]
+    description: str = ""
+    timeout: Optional[float] = None  # seconds per call, None = policy default
+    max_concurrency: int = 0  # 0 = unlimited
+    cacheable: bool = False
+    semaphore: Optional[threading.BoundedSemaphore] = field(default=None, repr=False)
+    
+    def __post_init__(self):
+        if self.max_concurrency > 0:
+            self.semaphore = threading.BoundedSemaphore(self.max_concurrency)
+
+class MCPToolServer:
+    """MCP Server for providing external tools to agents"""
+    
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.available_tools = []
+        self.tools: Dict[str, MCPTool] = {}
+        self.policy = get_policy("mcp")
+        self._cache = LRUCache(max_entries=config.MCP_TOOL_CACHE_ENTRIES, ttl=config.SEARCH_CACHE_TTL)
+        self._executor = ThreadPoolExecutor(max_workers=config.MCP_MAX_WORKERS, thread_name_prefix="mcp_tool")
+        # BM25 search over LOCAL_CORPUS_DIR, registered as local_search when configured
+        self.local_corpus = None
+    
+    def register_tool(self, name: str, func: Callable[[Dict], str], description: str = "",
+                      timeout: Optional[float] = None, max_concurrency: int = 0, cacheable: bool = False):
+        """Register a tool; func takes the parameters dict and returns a string"""
+        self.tools[name] = MCPTool(name, func, description, timeout, max_concurrency, cacheable)
+        self.available_tools = list(self.tools)
+    
+    def start_server(self):
+        """Start MCP server with available tools"""
+        try:
+            self.logger.info("MCP Tool Server starting...")
+            timeout = config.MCP_TOOL_TIMEOUT
+            self.register_tool("web_search", self._mock_web_search, "Search the web",
+                               timeout=timeout, max_concurrency=4, cacheable=True)
+            self.register_tool("data_analysis", self._mock_data_analysis, "Analyze research data",
+                               timeout=timeout, max_concurrency=4)
+            self.register_tool("content_summarization", self._mock_summarization, "Summarize content",
+                               timeout=timeout, max_concurrency=4)
+            self.register_tool("fact_verification", self._mock_fact_verification, "Verify a claim",
+                               timeout=timeout, max_concurrency=4, cacheable=True)
+            if config.LOCAL_CORPUS_DIR:
+                from local_corpus import LocalCorpusSearchBackend
+                self.local_corpus = LocalCorpusSearchBackend.from_config(config)
+                # Not cacheable: results change as the corpus is re-indexed
+                self.register_tool("local_search", self._local_search, "Search the local document corpus",
+                                   timeout=timeout)
+            self.logger.info("MCP Server started with tools: %s", self.available_tools)
+            return True
+        except Exception as e:
+            self.logger.error("MCP Server failed to start: %s", e)
+            return False
+    
+    def get_tools(self) -> List[str]:
+        """Get available MCP tools"""
+        return self.available_tools
+    
+    def execute_tool(self, tool_name: str, parameters: Dict) -> str:
+        """Execute MCP tool"""
+        try:
+            self.logger.debug("Executing MCP tool: %s with params: %s", tool_name, capped(parameters))
+            
+            tool = self.tools.get(tool_name)
+            if tool is None:
+                return f"Tool {tool_name} not found"
+            
+            cache_key = self._cache_key(tool_name, parameters) if tool.cacheable else None
+            if cache_key is not None:
+                cached = self._cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            
+            if tool.semaphore is not None:
+                tool.semaphore.acquire()
+            try:
+                # Rate limited, timed out, retried and circuit broken like every outbound call
+                with span(f"tool.{tool_name}"):
+                    result = self.policy.call_within(tool.timeout or self.policy.timeout, tool.func, parameters)
+            finally:
+                if tool.semaphore is not None:
+                    tool.semaphore.release()
+            
+            if cache_key is not None:
+                self._cache.set(cache_key, result)
+            return result
+        
+        except Exception as e:
+            self.logger.error("MCP tool execution failed: %s", e)
+            return f"Tool execution error: {str(e)}"
+    
+    def execute_tools(self, calls: List[Tuple[str, Dict]], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Run independent tool calls concurrently.
+        
+        Returns one dict per call, in call order, with "tool", "status"
+        ("ok", "error" or "timeout"), "result" and "elapsed". A call that
+        exceeds its tool's timeout (or the batch timeout) is reported as a
+        timeout while the other results are still returned.
+        """
+        started = time.monotonic()
+        # in_context keeps each call's span on the caller's trace
+        run = in_context(self._timed_execute_tool)
+        futures = [self._executor.submit(run, name, parameters) for name, parameters in calls]
+        
+        results = []
+        for (name, _), future in zip(calls, futures):
+            tool = self.tools.get(name)
+            budget = timeout or (tool.timeout if tool and tool.timeout else self.policy.timeout)
+            remaining = None if budget is None else max(0.0, budget - (time.monotonic() - started))
+            try:
+                result, elapsed = future.result(timeout=remaining)
+                status = "error" if result.startswith(("Tool execution error", f"Tool {name} not found")) else "ok"
+            except FutureTimeoutError:
+                self.logger.warning("MCP tool %s timed out after %ss", name, budget)
+                result, elapsed = f"Tool {name} timed out after {budget}s", time.monotonic() - started
+                status = "timeout"
+            results.append({
+                "tool": name,
+                "status": status,
+                "result": result,
+                "elapsed": elapsed
+            })
+        return results
+    
+    def _timed_execute_tool(self, tool_name: str, parameters: Dict) -> Tuple[str, float]:
+        started = time.monotonic()
+        result = self.execute_tool(tool_name, parameters)
+        return result, time.monotonic() - started
+    
+    def _cache_key(self, tool_name: str, parameters: Dict) -> Optional[str]:
+        try:
+            return json.dumps([tool_name, parameters], sort_keys=True)
+        except TypeError:
+            return None
+    
+    def _mock_web_search(self, params: Dict) -> str:
+        """Mock web search via MCP"""
+        query = params.get("query", "")
+        return f"MCP Web Search Results for '{query}': Found relevant information about the topic from multiple sources."
+    
+    def _local_search(self, params: Dict) -> str:
+        """BM25 search over the local corpus"""
+        query = params.get("query", "")
+        results = self.local_corpus.search(query, max_results=int(params.get("max_results", 5)))
+        if not results:
+            return f"No local documents found for '{query}'"
+        return format_sources(results)
+    
+    def _mock_data_analysis(self, params: Dict) -> str:
+        """Mock data analysis via MCP"""
+        data = params.get("data", "")
+        return f"MCP Data Analysis: Analyzed research data and identified key patterns and trends."
+    
+    def _mock_summarization(self, params: Dict) -> str:
+        """Mock content summarization via MCP"""
+        content = params.get("content", "")
+        return f"MCP Summary: Extracted main points and structured the information effectively."
+    
+    def _mock_fact_verification(self, params: Dict) -> str:
+        """Mock fact verification via MCP"""
+        claim = params.get("claim", "")
+        return f"MCP Fact Check: Verified information reliability for: '{claim}'"
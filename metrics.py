@@ -0,0 +1,342 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import config
+
+# Upper bounds in seconds, from queue hand-offs to slow model calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (the largest bucket for +Inf)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (self.buckets[-1],), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms keyed by name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, Any]) -> LabelKey:
+        if len(labels) < 2:
+            # Most series have one label; skip the sort on the hot path
+            return tuple((name, str(value)) for name, value in labels.items())
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable view of every series"""
+        def labelled(key: LabelKey) -> Dict[str, str]:
+            return dict(key)
+
+        with self._lock:
+            return {
+                "counters": {name: [{"labels": labelled(key), "value": value} for key, value in series.items()]
+                             for name, series in self._counters.items()},
+                "gauges": {name: [{"labels": labelled(key), "value": value} for key, value in series.items()]
+                           for name, series in self._gauges.items()},
+                "histograms": {
+                    name: [{
+                        "labels": labelled(key), "count": h.count, "sum": h.sum,
+                        "p50": h.quantile(0.5), "p90": h.quantile(0.9), "p99": h.quantile(0.99)
+                    } for key, h in series.items()]
+                    for name, series in self._histograms.items()
+                }
+            }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        def labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = key + extra
+            if not pairs:
+                return ""
+            escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+            return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{labels(key)} {value}" for key, value in series.items())
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{labels(key)} {value}" for key, value in series.items())
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip(h.buckets, h.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{labels(key, (('le', repr(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{labels(key, (('le', '+Inf'),))} {h.count}")
+                    lines.append(f"{name}_sum{labels(key)} {h.sum}")
+                    lines.append(f"{name}_count{labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def inc(name: str, amount: float = 1, **labels):
+    if config.METRICS_ENABLED:
+        registry.inc(name, amount, **labels)
+
+
+def set_gauge(name: str, value: float, **labels):
+    if config.METRICS_ENABLED:
+        registry.set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    if config.METRICS_ENABLED:
+        registry.observe(name, value, **labels)
+
+
+class Trace:
+    """Correlation id and timing spans for one topic's trip through the pipeline.
+
+    Travels between agents in AgentMessage.metadata["trace"]; each stage
+    adds its spans and passes the trace on with its outgoing message.
+    """
+
+    def __init__(self, topic: Optional[str] = None, trace_id: Optional[str] = None,
+                 started: Optional[float] = None, spans: Optional[List[Dict[str, Any]]] = None):
+        self.topic = topic
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = started or time.time()
+        self.spans = list(spans or [])
+        self.stage: Optional[str] = None
+        self._stage_started = 0.0
+        self._stage_wall = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_message(cls, message) -> "Trace":
+        data = message.metadata.get("trace")
+        topic = message.content.get("topic") if isinstance(message.content, dict) else None
+        if not data:
+            return cls(topic)
+        return cls(data.get("topic", topic), data["id"], data["started"], data["spans"])
+
+    def add_span(self, name: str, started: float, duration: float, **attributes):
+        span = {"name": name, "start": started, "duration": duration, **attributes}
+        with self._lock:
+            self.spans.append(span)
+
+    def begin_stage(self, stage: str):
+        self.stage = stage
+        self._stage_started = time.perf_counter()
+        self._stage_wall = time.time()
+
+    def end_stage(self):
+        """Record the current stage's span; later calls for the same stage are no-ops"""
+        if self.stage is None:
+            return
+        duration = time.perf_counter() - self._stage_started
+        self.add_span(self.stage, self._stage_wall, duration)
+        observe("stage_seconds", duration, stage=self.stage)
+        self.stage = None
+
+    def to_metadata(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        return {"id": self.trace_id, "topic": self.topic, "started": self.started, "spans": spans}
+
+    def describe(self) -> str:
+        with self._lock:
+            spans = list(self.spans)
+        return " ".join(f"{span['name']}={span['duration']:.3f}s" for span in spans)
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+# Finished traces, newest last, for the JSON snapshot
+_recent_traces: deque = deque(maxlen=max(1, config.TRACE_HISTORY))
+_recent_lock = threading.Lock()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name: str, message=None, topic: Optional[str] = None, trace_id: Optional[str] = None):
+    """Activate the trace carried by message (or a new one, optionally with a given id) while a stage handles it"""
+    trace = Trace.from_message(message) if message is not None else Trace(topic, trace_id)
+    trace.begin_stage(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.end_stage()
+        _current_trace.reset(token)
+
+
+def traced_stage(name: str):
+    """Decorator running a handler inside stage(); the first argument is a message or a topic.
+
+    A topic starts a new trace; callers that need to follow it through the
+    pipeline can pass trace_id=... to choose its id.
+    """
+    def decorator(func: Callable):
+        def scope(arg, trace_id):
+            if hasattr(arg, "metadata"):
+                return stage(name, message=arg)
+            return stage(name, topic=str(arg), trace_id=trace_id)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, arg, *args, trace_id: Optional[str] = None, **kwargs):
+                with scope(arg, trace_id):
+                    return await func(self, arg, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, arg, *args, trace_id: Optional[str] = None, **kwargs):
+            with scope(arg, trace_id):
+                return func(self, arg, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block, recording it in span_seconds and on the active trace"""
+    wall = time.time()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        observe("span_seconds", duration, span=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, wall, duration, **attributes)
+
+
+def in_context(func: Callable) -> Callable:
+    """Wrap func to run in a copy of the caller's context, so thread pool work joins the active trace"""
+    parent = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        return parent.copy().run(func, *args, **kwargs)
+    return run
+
+
+def stamp_outgoing(message):
+    """Attach the active trace and the enqueue time to a message being sent"""
+    trace = _current_trace.get()
+    if trace is not None and "trace" not in message.metadata:
+        # The sending stage ends when it hands its result on
+        trace.end_stage()
+        message.metadata["trace"] = trace.to_metadata()
+    message.metadata["enqueued_at"] = time.time()
+
+
+def record_dequeue(message, receiver: str):
+    """Turn the time a message spent queued into a queue_wait span and histogram sample"""
+    enqueued_at = message.metadata.pop("enqueued_at", None)
+    if enqueued_at is None:
+        return
+    wait = max(0.0, time.time() - enqueued_at)
+    observe("queue_wait_seconds", wait, receiver=receiver)
+    data = message.metadata.get("trace")
+    if data is not None:
+        data["spans"].append({"name": f"queue_wait.{receiver}", "start": enqueued_at, "duration": wait})
+
+
+def finish_trace(status: str = "success"):
+    """Close the active trace at the end of the pipeline and record it"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    trace.end_stage()
+    duration = time.time() - trace.started
+    observe("pipeline_seconds", duration)
+    inc("pipeline_topics_total", status=status)
+    record = {**trace.to_metadata(), "status": status, "duration": duration}
+    with _recent_lock:
+        _recent_traces.append(record)
+    if config.TRACE_LOG and logger.isEnabledFor(logging.INFO):
+        logger.info("Trace %s '%s' %s in %.3fs: %s", trace.trace_id, trace.topic, status, duration, trace.describe())
+
+
+def recent_traces(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    with _recent_lock:
+        traces = list(_recent_traces)
+    return traces[-limit:] if limit else traces
+
+
+def snapshot() -> Dict[str, Any]:
+    """Every metric plus the most recent finished traces"""
+    return {**registry.snapshot(), "traces": recent_traces(), "timestamp": time.time()}
+
+
+def to_prometheus() -> str:
+    return registry.to_prometheus()
@@ -1,96 +1,327 @@
-from crewai import Agent
-from duckduckgo_search import DDGS
-from langchain.tools import Tool
-from communication import AgentMessage, MessageQueue
-from config import config
-import logging
-from datetime import datetime
-import time
-
-class ResearchAgent:
-    def __init__(self, message_queue: MessageQueue):
-        self.message_queue = message_queue
-        self.agent_name = "research_agent"
-        self.logger = logging.getLogger(__name__)
-        
-        self.search_tool = Tool(
-            name="WebSearch",
-            func=self._search_web_with_retry,
-            description="Search the web for current information"
-        )
-        
-        self.agent = Agent(
-            role="Research Specialist",
-            goal="Find comprehensive and accurate information about any topic",
-            backstory="You are an expert researcher who can find information about anything.",
-            tools=[self.search_tool],
-            allow_delegation=False,
-            verbose=True,
-            model=config.MODEL
-        )
-    
-    def _search_web_with_retry(self, query: str) -> str:
-        """Search with retry logic and error handling"""
-        for attempt in range(config.MAX_RETRIES):
-            try:
-                self.logger.info(f"Search attempt {attempt + 1} for: {query}")
-                with DDGS() as ddgs:
-                    results = list(ddgs.text(query, max_results=5))
-                
-                if results:
-                    self.logger.info(f"Search successful, found {len(results)} results")
-                    formatted_results = "\n\n".join([
-                        f"Source {i+1}:\nTitle: {r['title']}\nURL: {r['href']}\nContent: {r['body'][:200]}..."
-                        for i, r in enumerate(results)
-                    ])
-                    return formatted_results
-                else:
-                    self.logger.warning(f"No results found on attempt {attempt + 1}")
-                    
-            except Exception as e:
-                self.logger.error(f"Search failed on attempt {attempt + 1}: {str(e)}")
-                if attempt < config.MAX_RETRIES - 1:
-                    time.sleep(2)  # Wait before retry
-                    continue
-            
-        error_msg = f"All {config.MAX_RETRIES} search attempts failed for: {query}"
-        self.logger.error(error_msg)
-        return error_msg
-    
-    def execute(self, topic: str):
-        """Execute research and send results to analysis agent"""
-        try:
-            self.logger.info(f"Research Agent starting work on: {topic}")
-            
-            prompt = f"Research this topic and gather comprehensive information: {topic}"
-            research_result = self.agent.execute_task(prompt)
-            
-            # Send message to analysis agent
-            message = AgentMessage(
-                sender=self.agent_name,
-                receiver="analysis_agent",
-                content={
-                    "topic": topic,
-                    "research_data": research_result,
-                    "status": "success"
-                },
-                message_type="research_data",
-                timestamp=datetime.now().isoformat()
-            )
-            self.message_queue.send_message(message)
-            self.logger.info("Research completed and sent to analysis agent")
-            
-        except Exception as e:
-            self.logger.error(f"Research agent failed: {str(e)}")
-            error_message = AgentMessage(
-                sender=self.agent_name,
-                receiver="summary_agent",
-                content={
-                    "topic": topic,
-                    "error": f"Research failed: {str(e)}",
-                    "status": "error"
-                },
-                message_type="error",
-                timestamp=datetime.now().isoformat()
-            )
-            self.message_queue.send_message(error_message)
\ No newline at end of file
+from communication import AgentMessage, MessageQueue, AsyncMessageQueue
+from blob_store import store_large
+from caching import SearchCache
+from search_backends import build_search_backend
+from sources import canonical_url, content_hash, format_sources, merge_ranked
+from resilience import get_policy
+from metrics import current_trace, in_context, span, traced_stage
+from config import config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import logging
+import threading
+import uuid
+from datetime import datetime
+
+class ResearchAgent:
+    def __init__(self, message_queue: MessageQueue, async_queue: Optional[AsyncMessageQueue] = None,
+                 search_backend=None, search_cache: Optional[SearchCache] = None,
+                 fanout_queries: Optional[int] = None):
+        self.message_queue = message_queue
+        self.async_queue = async_queue
+        self.agent_name = "research_agent"
+        self.logger = logging.getLogger(__name__)
+        
+        # Pluggable search backend (anything with search(query, max_results)); SEARCH_BACKEND picks the default
+        self.search_backend = search_backend or build_search_backend(config)
+        # Backends with cacheable = False (the local corpus) are always searched directly;
+        # SEARCH_BACKEND=both caches its web results inside the merged backend
+        if search_cache is None and config.SEARCH_CACHE_ENABLED and getattr(self.search_backend, "cacheable", True):
+            search_cache = SearchCache.from_config(config)
+        self.search_cache = search_cache
+        
+        # With more than one query per topic, research fans out over query
+        # variants in parallel and skips the LLM research step
+        self.fanout_queries = config.RESEARCH_FANOUT_QUERIES if fanout_queries is None else fanout_queries
+        
+        # Shared rate limiting, timeouts, backoff and circuit breaking per upstream
+        self.search_policy = get_policy("search")
+        self.llm_policy = get_policy("llm")
+        
+        # crewai and langchain are imported and the CrewAI agent built on first use
+        self._agent = None
+        self._agent_lock = threading.Lock()
+    
+    @property
+    def agent(self):
+        """CrewAI agent, constructed on first access"""
+        if self._agent is None:
+            with self._agent_lock:
+                if self._agent is None:
+                    self._agent = self._build_agent()
+        return self._agent
+    
+    @agent.setter
+    def agent(self, agent):
+        self._agent = agent
+    
+    def _build_agent(self):
+        from langchain.tools import Tool
+        self.search_tool = Tool(
+            name="WebSearch",
+            func=self._search_web_with_retry,
+            description="Search the web for current information"
+        )
+        
+        from crewai import Agent
+        return Agent(
+            role="Research Specialist",
+            goal="Find comprehensive and accurate information about any topic",
+            backstory="You are an expert researcher who can find information about anything.",
+            tools=[self.search_tool],
+            allow_delegation=False,
+            verbose=True,
+            model=config.MODEL
+        )
+    
+    def _search_web_with_retry(self, query: str) -> str:
+        """Search with retry logic and error handling"""
+        results = self._search(query, max_results=5)
+        if results:
+            return self._format_results(results)
+        
+        error_msg = f"All {config.MAX_RETRIES} search attempts failed for: {query}"
+        self.logger.error(error_msg)
+        return error_msg
+    
+    def _search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        """Cached search through the configured backend; empty list if every attempt fails"""
+        if self.search_cache is not None:
+            cached = self.search_cache.get(query, max_results)
+            if cached is not None:
+                self.logger.debug("Search cache hit for: %s", query)
+                return cached
+        
+        try:
+            self.logger.debug("Searching for: %s", query)
+            with span("search"):
+                results = self.search_policy.call(self.search_backend.search, query, max_results=max_results)
+        except Exception as e:
+            self.logger.error("Search failed for %s: %s", query, e)
+            return []
+        
+        if not results:
+            self.logger.warning("No results found for: %s", query)
+            return []
+        
+        self.logger.debug("Search successful, found %s results", len(results))
+        if self.search_cache is not None:
+            self.search_cache.set(query, max_results, results)
+        return results
+    
+    def _expand_queries(self, topic: str, count: int) -> List[str]:
+        """Query variants covering subtopics, recent coverage and alternative phrasing"""
+        year = datetime.now().year
+        variants = [
+            topic,
+            f"latest developments in {topic}",
+            f"{topic} {year}",
+            f"{topic} applications and use cases",
+            f"{topic} challenges and risks",
+            f"{topic} research overview",
+            f"{topic} recent news",
+            f"future of {topic}",
+        ]
+        return list(dict.fromkeys(variants))[:max(1, count)]
+    
+    def _gather_sources(self, topic: str) -> List[Dict[str, str]]:
+        """Run every query variant in parallel and merge the hits into one ranked, deduplicated list"""
+        queries = self._expand_queries(topic, self.fanout_queries)
+        workers = max(1, min(len(queries), config.RESEARCH_FANOUT_WORKERS))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="research_fanout") as pool:
+            # in_context keeps the search spans on this topic's trace
+            result_lists = list(pool.map(
+                in_context(lambda query: self._search(query, max_results=config.RESEARCH_RESULTS_PER_QUERY)), queries
+            ))
+        
+        sources = merge_ranked(result_lists, max_results=config.RESEARCH_MAX_SOURCES)
+        total_hits = sum(len(results) for results in result_lists)
+        self.logger.info("Fan-out research ran %s queries: %s hits, %s unique sources", len(queries), total_hits, len(sources))
+        return sources
+    
+    def _fanout_research(self, topic: str) -> str:
+        sources = self._gather_sources(topic)
+        if not sources:
+            raise RuntimeError(f"No search results for any query about: {topic}")
+        return self._format_results(sources)
+    
+    def _format_results(self, results: List[Dict[str, str]]) -> str:
+        return format_sources(results)
+    
+    def _pipelined(self, refresh: bool) -> bool:
+        """Whether this topic's sources are streamed to analysis in batches.
+        
+        Refreshes need the complete source list up front, and partial analyses
+        are held in the analysis agent's memory, which rules out analysis
+        worker processes.
+        """
+        return config.RESEARCH_PIPELINED and self.fanout_queries > 1 and not refresh and not config.ANALYSIS_PROCESSES
+    
+    def _stream_research(self, topic: str, pipeline: Dict[str, Any], send: Callable[[AgentMessage], None]) -> str:
+        """Fan-out research that sends each batch of new sources to analysis as soon as its searches finish.
+        
+        Sources are kept in the order they arrive rather than rank-fused, so
+        the Source labels of the partial messages match the final research
+        text, and research ends as soon as RESEARCH_MAX_SOURCES are in.
+        pipeline["parts"] counts the batches sent.
+        """
+        queries = self._expand_queries(topic, self.fanout_queries)
+        workers = max(1, min(len(queries), config.RESEARCH_FANOUT_WORKERS))
+        limit = config.RESEARCH_MAX_SOURCES
+        sources: List[Dict[str, str]] = []
+        batch: List[Dict[str, str]] = []
+        seen = set()  # canonical URLs and content hashes of the sources kept so far
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="research_fanout")
+        try:
+            search = in_context(lambda query: self._search(query, max_results=config.RESEARCH_RESULTS_PER_QUERY))
+            futures = [pool.submit(search, query) for query in queries]
+            for done, future in enumerate(as_completed(futures), 1):
+                for result in future.result():
+                    if limit and len(sources) + len(batch) >= limit:
+                        break
+                    keys = {canonical_url(result["href"]) if result.get("href") else None,
+                            content_hash(result["body"]) if result.get("body", "").strip() else None} - {None}
+                    if keys & seen:
+                        continue
+                    seen |= keys
+                    batch.append(result)
+                full = bool(limit) and len(sources) + len(batch) >= limit
+                if batch and (len(batch) >= config.RESEARCH_PARTIAL_SOURCES or full or done == len(futures)):
+                    pipeline["parts"] += 1
+                    send(self._partial_message(topic, format_sources(batch, start=len(sources) + 1), pipeline))
+                    sources.extend(batch)
+                    batch = []
+                if full:
+                    break
+        finally:
+            # Searches still running could only add sources beyond the limit; they finish in the background
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        if not sources:
+            raise RuntimeError(f"No search results for any query about: {topic}")
+        self.logger.info("Pipelined research ran %s queries: %s sources in %s parts", len(queries), len(sources),
+                         pipeline["parts"])
+        return self._format_results(sources)
+    
+    @traced_stage("research")
+    def execute(self, topic: str, refresh: bool = False):
+        """Execute research and send results to analysis agent.
+        
+        A refresh always gathers sources directly, so they can be compared with the topic's stored ones.
+        """
+        pipeline = None
+        try:
+            self.logger.debug("Research Agent starting work on: %s", topic)
+            
+            if self._pipelined(refresh):
+                pipeline = self._new_pipeline()
+                research_result = self._stream_research(topic, pipeline, self.message_queue.send_message)
+            elif self.fanout_queries > 1 or refresh:
+                research_result = self._fanout_research(topic)
+            else:
+                with span("research.llm"):
+                    research_result = self.llm_policy.call(self.agent.execute_task, self._research_prompt(topic))
+            
+            # Send message to analysis agent
+            self.message_queue.send_message(self._research_message(topic, research_result, refresh, pipeline))
+            self.logger.debug("Research completed and sent to analysis agent")
+            
+        except Exception as e:
+            self.logger.error("Research agent failed: %s", e)
+            self.message_queue.send_message(self._error_message(topic, e, pipeline))
+    
+    @traced_stage("research")
+    async def aexecute(self, topic: str, refresh: bool = False):
+        """Async variant of execute that sends through the async message queue"""
+        pipeline = None
+        try:
+            self.logger.debug("Research Agent starting work on: %s", topic)
+            
+            # CrewAI task execution is blocking, keep it off the event loop
+            if self._pipelined(refresh):
+                pipeline = self._new_pipeline()
+                loop = asyncio.get_running_loop()
+                
+                def send(message: AgentMessage):
+                    asyncio.run_coroutine_threadsafe(self.async_queue.send_message(message), loop).result()
+                
+                research_result = await asyncio.to_thread(self._stream_research, topic, pipeline, send)
+            elif self.fanout_queries > 1 or refresh:
+                research_result = await asyncio.to_thread(self._fanout_research, topic)
+            else:
+                with span("research.llm"):
+                    research_result = await asyncio.to_thread(
+                        self.llm_policy.call, self.agent.execute_task, self._research_prompt(topic)
+                    )
+            
+            await self.async_queue.send_message(self._research_message(topic, research_result, refresh, pipeline))
+            self.logger.debug("Research completed and sent to analysis agent")
+            
+        except Exception as e:
+            self.logger.error("Research agent failed: %s", e)
+            await self.async_queue.send_message(self._error_message(topic, e, pipeline))
+    
+    def _research_prompt(self, topic: str) -> str:
+        return f"Research this topic and gather comprehensive information: {topic}"
+    
+    def _new_pipeline(self) -> Dict[str, Any]:
+        """Stream metadata shared by a topic's partial messages and the message that completes it"""
+        return {"stream": uuid.uuid4().hex[:16], "parts": 0}
+    
+    def _partial_message(self, topic: str, research_text: str, pipeline: Dict[str, Any]) -> AgentMessage:
+        trace = current_trace()
+        return AgentMessage(
+            sender=self.agent_name,
+            receiver="analysis_agent",
+            content={
+                "topic": topic,
+                "research_data": store_large(research_text),
+                "status": "success"
+            },
+            message_type="research_partial",
+            timestamp=datetime.now().isoformat(),
+            # The trace travels with the final message; a partial doesn't end the research stage,
+            # so it only carries the trace id (which streamed requests are observed by)
+            metadata={"trace": None,
+                      "pipeline": {"stream": pipeline["stream"], "part": pipeline["parts"], "final": False,
+                                   "trace_id": trace.trace_id if trace is not None else None}}
+        )
+    
+    def _research_message(self, topic: str, research_result, refresh: bool = False,
+                          pipeline: Optional[Dict[str, Any]] = None) -> AgentMessage:
+        message = AgentMessage(
+            sender=self.agent_name,
+            receiver="analysis_agent",
+            content={
+                "topic": topic,
+                # Large research text travels as a blob store handle
+                "research_data": store_large(research_result),
+                "status": "success",
+                "refresh": refresh
+            },
+            message_type="research_data",
+            timestamp=datetime.now().isoformat()
+        )
+        if pipeline is not None:
+            # Closes the stream: analysis merges the analyses of all pipeline["parts"] partial messages
+            message.metadata["pipeline"] = {**pipeline, "final": True}
+        return message
+    
+    def _error_message(self, topic: str, error: Exception, pipeline: Optional[Dict[str, Any]] = None) -> AgentMessage:
+        # Once partials are out, the error goes through analysis so it can drop their analyses
+        streamed = pipeline is not None and pipeline["parts"] > 0
+        message = AgentMessage(
+            sender=self.agent_name,
+            receiver="analysis_agent" if streamed else "summary_agent",
+            content={
+                "topic": topic,
+                "error": f"Research failed: {str(error)}",
+                "status": "error"
+            },
+            message_type="error",
+            timestamp=datetime.now().isoformat()
+        )
+        if streamed:
+            message.metadata["pipeline"] = {**pipeline, "final": True}
+        return message
@@ -0,0 +1,473 @@
+import asyncio
+import logging
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from config import config
+from metrics import inc, observe, set_gauge
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while its circuit breaker is open"""
+    pass
+
+
+class CallTimeoutError(TimeoutError):
+    """Raised when an outbound call exceeds its timeout"""
+    pass
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a rate limiter cannot grant a token within the caller's timeout"""
+    pass
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter, shared by every caller of one upstream"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "throttled": 0, "rejected": 0, "wait_seconds": 0.0}
+
+    def _reserve(self, tokens: float, timeout: Optional[float]) -> float:
+        """Take tokens now (possibly going into debt) and return how long to wait for them"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                self._stats["rejected"] += 1
+                raise RateLimitExceeded(f"Rate limit wait of {wait:.2f}s exceeds timeout of {timeout}s")
+            self._tokens -= tokens
+            self._stats["acquired"] += 1
+            if wait:
+                self._stats["throttled"] += 1
+                self._stats["wait_seconds"] += wait
+        if wait:
+            observe("rate_limit_wait_seconds", wait)
+        return wait
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None):
+        if self.rate <= 0:
+            return
+        wait = self._reserve(tokens, timeout)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: float = 1, timeout: Optional[float] = None):
+        if self.rate <= 0:
+            return
+        wait = self._reserve(tokens, timeout)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "rate": self.rate, "burst": self.burst}
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, so concurrent workers don't retry in lockstep"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after the given (0-based) failed attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures, then lets one trial call through"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.logger = logging.getLogger(__name__)
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._outcomes = 0  # record_success and record_failure calls, to tell if a trial got a result
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "short_circuited": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError unless a call may go through right now; True if it is the half-open trial"""
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return False
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._stats["short_circuited"] += 1
+        inc("circuit_short_circuits_total", upstream=self.name)
+        raise CircuitOpenError(f"Circuit for {self.name} is open")
+
+    @contextmanager
+    def attempt(self):
+        """before_call for the attempt run inside the block.
+
+        A trial that leaves the block without recording an outcome (cancelled,
+        interrupted, or a stream closed early) is released so the next call
+        can be the trial.
+        """
+        trial = self.before_call()
+        with self._lock:
+            outcomes = self._outcomes
+        try:
+            yield
+        finally:
+            if trial:
+                with self._lock:
+                    if self._outcomes == outcomes and self._state == self.HALF_OPEN:
+                        self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                self.logger.info("Circuit for %s closed", self.name)
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+            self._outcomes += 1
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            self._outcomes += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._stats["opened"] += 1
+                    self.logger.warning("Circuit for %s opened after %s failures", self.name, self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "state": self._current_state(), "consecutive_failures": self._failures}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Default retry predicate: timeouts, connection and server errors, but not caller mistakes.
+
+    Bad arguments and bugs (TypeError, ValueError, KeyError, ...) and HTTP
+    4xx responses other than 408 and 429 fail the same way on every attempt.
+    """
+    if isinstance(error, (CircuitOpenError, RateLimitExceeded, TypeError, ValueError, KeyError,
+                          AttributeError, NotImplementedError)):
+        return False
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+        return False
+    return True
+
+
+# Threads of timed-out calls that are still running; Python can't stop them
+_abandoned = {"running": 0}
+_abandoned_lock = threading.Lock()
+
+
+def abandoned_calls() -> int:
+    """Timed-out calls whose threads are still running"""
+    with _abandoned_lock:
+        return _abandoned["running"]
+
+
+class _CallThread:
+    """Daemon thread for one timed call, counted while it runs on after its caller gave up"""
+
+    def __init__(self, target: Callable):
+        limit = config.MAX_ABANDONED_CALLS
+        with _abandoned_lock:
+            if limit and _abandoned["running"] >= limit:
+                # The upstream is hanging; another thread would just join the pile-up
+                raise CallTimeoutError(f"{limit} timed-out calls are still running")
+        self._done = False
+        self._abandoned = False
+        self.thread = threading.Thread(target=self._run, args=(target,), daemon=True)
+        self.thread.start()
+
+    def _run(self, target: Callable):
+        try:
+            target()
+        finally:
+            with _abandoned_lock:
+                self._done = True
+                if self._abandoned:
+                    _abandoned["running"] -= 1
+                    set_gauge("abandoned_calls", _abandoned["running"])
+
+    def abandon(self) -> bool:
+        """Stop waiting for the thread, returning False if it had already finished"""
+        with _abandoned_lock:
+            if self._done:
+                return False
+            self._abandoned = True
+            _abandoned["running"] += 1
+            set_gauge("abandoned_calls", _abandoned["running"])
+        inc("abandoned_calls_total")
+        return True
+
+
+def call_with_timeout(func: Callable, timeout: Optional[float], *args, **kwargs):
+    """Run func, raising CallTimeoutError if it doesn't return within timeout seconds.
+
+    The call runs on a daemon thread; Python can't interrupt it, so a timed
+    out call is abandoned rather than cancelled. While MAX_ABANDONED_CALLS
+    of those are still running, new calls fail straight away.
+    """
+    if not timeout:
+        return func(*args, **kwargs)
+
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = func(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    worker = _CallThread(target)
+    worker.thread.join(timeout)
+    if worker.abandon():
+        raise CallTimeoutError(f"Call exceeded timeout of {timeout}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+
+def iterate_with_timeout(func: Callable, timeout: Optional[float], *args, **kwargs) -> Iterator:
+    """Iterate over func(*args, **kwargs), raising CallTimeoutError if any item takes longer than timeout seconds.
+
+    Like call_with_timeout, the iteration runs on a daemon thread that is
+    abandoned, not cancelled, when the caller gives up on it, and counts
+    towards MAX_ABANDONED_CALLS until it ends.
+    """
+    if not timeout:
+        yield from func(*args, **kwargs)
+        return
+
+    items = queue.Queue()
+    finished = object()
+    abandoned = threading.Event()
+
+    def target():
+        try:
+            for item in func(*args, **kwargs):
+                if abandoned.is_set():
+                    return
+                items.put((item, None))
+        except BaseException as e:
+            items.put((finished, e))
+            return
+        items.put((finished, None))
+
+    worker = _CallThread(target)
+    try:
+        while True:
+            try:
+                item, error = items.get(timeout=timeout)
+            except queue.Empty:
+                raise CallTimeoutError(f"No result within timeout of {timeout}s")
+            if item is finished:
+                worker = None
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        abandoned.set()
+        if worker is not None:
+            worker.abandon()
+
+
+class ResiliencePolicy:
+    """Rate limiting, per-call timeout, retry with backoff and circuit breaking for one upstream"""
+
+    def __init__(self, name: str, rate_limiter: TokenBucket, retry: RetryPolicy,
+                 breaker: CircuitBreaker, timeout: Optional[float],
+                 retryable: Callable[[Exception], bool] = is_retryable):
+        self.name = name
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.breaker = breaker
+        self.timeout = timeout
+        self.retryable = retryable
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "successes": 0, "failures": 0, "retries": 0, "timeouts": 0, "not_retryable": 0}
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Call func through the policy, re-raising the last error once retries are exhausted"""
+        return self.call_within(self.timeout, func, *args, **kwargs)
+
+    def call_within(self, timeout: Optional[float], func: Callable, *args, **kwargs):
+        """Like call, with a per-attempt timeout that overrides the policy default"""
+        self._count("calls")
+        for attempt in range(self.retry.max_attempts):
+            with self.breaker.attempt():
+                self.rate_limiter.acquire()
+                try:
+                    result = call_with_timeout(func, timeout, *args, **kwargs)
+                except Exception as e:
+                    if not self._record_failure(e, attempt):
+                        raise
+                    time.sleep(self.retry.delay(attempt))
+                    continue
+                self._record_success()
+                return result
+
+    def stream(self, func: Callable, *args, **kwargs) -> Iterator:
+        """Iterate over func(*args, **kwargs) through the policy, with the timeout applied to each item.
+
+        An attempt that fails before its first item is retried; a later failure
+        is raised, since items already handed out can't be taken back.
+        """
+        self._count("calls")
+        for attempt in range(self.retry.max_attempts):
+            with self.breaker.attempt():
+                self.rate_limiter.acquire()
+                produced = False
+                try:
+                    for item in iterate_with_timeout(func, self.timeout, *args, **kwargs):
+                        produced = True
+                        yield item
+                except Exception as e:
+                    if not self._record_failure(e, attempt, retry=not produced):
+                        raise
+                    time.sleep(self.retry.delay(attempt))
+                    continue
+                self._record_success()
+                return
+
+    async def acall(self, func: Callable, *args, **kwargs):
+        """Async variant of call for coroutine functions"""
+        self._count("calls")
+        for attempt in range(self.retry.max_attempts):
+            with self.breaker.attempt():
+                await self.rate_limiter.aacquire()
+                try:
+                    if self.timeout:
+                        result = await asyncio.wait_for(func(*args, **kwargs), self.timeout)
+                    else:
+                        result = await func(*args, **kwargs)
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        e = CallTimeoutError(f"Call exceeded timeout of {self.timeout}s")
+                    if not self._record_failure(e, attempt):
+                        raise e
+                    await asyncio.sleep(self.retry.delay(attempt))
+                    continue
+                self._record_success()
+                return result
+
+    def _record_success(self):
+        self.breaker.record_success()
+        self._count("successes")
+
+    def _record_failure(self, error: Exception, attempt: int, retry: bool = True) -> bool:
+        """Record a failed attempt and return True if it should be retried"""
+        self.breaker.record_failure()
+        if isinstance(error, CallTimeoutError):
+            self._count("timeouts")
+        if not self.retryable(error):
+            retry = False
+            self._count("not_retryable")
+        if retry and attempt + 1 < self.retry.max_attempts:
+            self._count("retries")
+            self.logger.warning("%s call failed on attempt %s: %s", self.name, attempt + 1, error)
+            return True
+        self._count("failures")
+        self.logger.error("%s call failed after %s attempts: %s", self.name, attempt + 1, error)
+        return False
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+        inc("upstream_events_total", upstream=self.name, event=name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["rate_limiter"] = self.rate_limiter.get_stats()
+        stats["circuit"] = self.breaker.get_stats()
+        return stats
+
+
+_policies: Dict[str, ResiliencePolicy] = {}
+_policies_lock = threading.Lock()
+
+
+# Shared settings an upstream can override in SEARCH_RESILIENCE, LLM_RESILIENCE or MCP_RESILIENCE
+POLICY_SETTINGS = ("RATE_LIMIT_PER_SECOND", "RATE_LIMIT_BURST", "MAX_RETRIES", "RETRY_BASE_DELAY",
+                   "RETRY_MAX_DELAY", "CIRCUIT_FAILURE_THRESHOLD", "CIRCUIT_RESET_TIMEOUT", "REQUEST_TIMEOUT")
+
+
+def policy_settings(name: str, settings=config) -> Dict[str, Any]:
+    """The shared resilience settings with the upstream's "KEY=value,..." overrides applied"""
+    values = {key: getattr(settings, key) for key in POLICY_SETTINGS}
+    overrides = getattr(settings, f"{name.upper()}_RESILIENCE", "")
+    for item in filter(None, (part.strip() for part in overrides.split(","))):
+        key, _, value = (part.strip() for part in item.partition("="))
+        key = key.upper()
+        if key not in values or not value:
+            raise ValueError(f"Invalid {name.upper()}_RESILIENCE setting: {item!r}")
+        values[key] = type(values[key])(value)
+    return values
+
+
+def get_policy(name: str) -> ResiliencePolicy:
+    """Shared policy for an upstream ("search", "llm", "mcp"), created from config on first use"""
+    with _policies_lock:
+        policy = _policies.get(name)
+        if policy is None:
+            settings = policy_settings(name)
+            policy = _policies[name] = ResiliencePolicy(
+                name,
+                rate_limiter=TokenBucket(settings["RATE_LIMIT_PER_SECOND"], settings["RATE_LIMIT_BURST"]),
+                retry=RetryPolicy(settings["MAX_RETRIES"], settings["RETRY_BASE_DELAY"], settings["RETRY_MAX_DELAY"]),
+                breaker=CircuitBreaker(name, settings["CIRCUIT_FAILURE_THRESHOLD"], settings["CIRCUIT_RESET_TIMEOUT"]),
+                timeout=settings["REQUEST_TIMEOUT"] or None
+            )
+        return policy
+
+
+def get_metrics() -> Dict[str, Dict[str, Any]]:
+    """Metrics for every policy created so far"""
+    with _policies_lock:
+        policies = dict(_policies)
+    return {name: policy.get_stats() for name, policy in policies.items()}
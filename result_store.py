@@ -0,0 +1,244 @@
+"""
+Versioned per-topic research results, for incremental topic refreshes.
+
+process_topic(topic, refresh=True) (and process_topics) re-runs a topic
+against its last stored version instead of from scratch:
+
+- research fetches sources directly (no LLM research step)
+- each source block is identified by a hash of its content; sources are
+  analyzed in groups of about REFRESH_GROUP_TOKENS, and each group's
+  partial analysis is stored with the hashes it covers
+- a partial analysis whose sources are all still present and unchanged is
+  reused; only the remaining sources are analyzed, and the partials are
+  merged by the usual reduce step (not at all if nothing changed)
+- the previous summary is reused unless the analysis moved by at least
+  REFRESH_RESUMMARIZE_DELTA (1 - cosine similarity of the content words of
+  the analysis the summary was written from and the new one)
+
+Every refresh is stored as a new version with its sources, partial
+analyses, analysis, summary and change counts; the last
+RESULT_STORE_VERSIONS versions of each topic are kept.
+"""
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from chunking import estimate_tokens
+from config import config
+from sources import content_hash
+from text_analysis import STOPWORDS, split_sources
+
+# "Source N:" numbering shifts whenever search results are reordered, so it isn't part of a source's identity
+_LABEL_LINE = re.compile(r"^\s*Source \d+:\s*$", re.MULTILINE)
+_URL_LINE = re.compile(r"^\s*URL:\s*(\S+)", re.MULTILINE)
+_WORD = re.compile(r"\w+")
+# Words of an analysis kept to compare it with later ones
+BASIS_TERMS = 100
+
+
+@dataclass
+class TopicVersion:
+    topic: str
+    version: int
+    created_at: float
+    sources: List[Dict[str, Any]]
+    partials: List[Dict[str, Any]]
+    analysis: Any
+    summary: Any
+    stats: Dict[str, Any]
+
+
+@dataclass
+class RefreshPlan:
+    """What a refresh can reuse from the previous version and which sources it must analyze"""
+    previous: Optional[TopicVersion]
+    sources: List[Dict[str, Any]]
+    reused: List[Dict[str, Any]]
+    groups: List[Dict[str, Any]]
+    counts: Dict[str, int]
+    # Reused plus newly analyzed partials, filled in by the analysis
+    partials: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def unchanged(self) -> bool:
+        """True when the previous analysis still covers exactly the current sources"""
+        if self.previous is None or self.groups or not self.previous.stats.get("complete"):
+            return False
+        return {source["hash"] for source in self.previous.sources} == {source["hash"] for source in self.sources}
+
+    def add_results(self, results: List[Any], failed) -> bool:
+        """Record the analyses of groups (in order); returns False if any failed"""
+        self.partials = list(self.reused)
+        for group, result in zip(self.groups, results):
+            if not failed(result):
+                self.partials.append({"sources": group["sources"], "analysis": str(result)})
+        return len(self.partials) == len(self.reused) + len(self.groups)
+
+
+def plan_refresh(previous: Optional[TopicVersion], research_text: str, group_tokens: int) -> RefreshPlan:
+    """Compare research text with the previous version's sources and group the ones to analyze"""
+    sources = []
+    blocks: Dict[str, str] = {}
+    for label, block in split_sources(research_text):
+        digest = content_hash(_LABEL_LINE.sub("", block, count=1))
+        if digest in blocks:
+            continue
+        blocks[digest] = block
+        url = _URL_LINE.search(block)
+        sources.append({"label": label, "hash": digest, "url": url.group(1) if url else "",
+                        "tokens": estimate_tokens(block)})
+
+    reused = [partial for partial in (previous.partials if previous else [])
+              if all(digest in blocks for digest in partial["sources"])]
+    covered = {digest for partial in reused for digest in partial["sources"]}
+    groups: List[Dict[str, Any]] = []
+    for source in sources:
+        if source["hash"] in covered:
+            continue
+        if not groups or groups[-1]["tokens"] + source["tokens"] > group_tokens:
+            groups.append({"sources": [], "blocks": [], "tokens": 0})
+        groups[-1]["sources"].append(source["hash"])
+        groups[-1]["blocks"].append(blocks[source["hash"]])
+        groups[-1]["tokens"] += source["tokens"]
+    for group in groups:
+        group["text"] = "\n\n".join(group.pop("blocks"))
+
+    previous_hashes = {source["hash"] for source in previous.sources} if previous else set()
+    previous_urls = {source["url"] for source in previous.sources if source["url"]} if previous else set()
+    new = [source for source in sources if source["hash"] not in previous_hashes]
+    changed = sum(1 for source in new if source["url"] and source["url"] in previous_urls)
+    counts = {"sources": len(sources), "unchanged": len(sources) - len(new), "added": len(new) - changed,
+              "changed": changed, "removed": len(previous_hashes - set(blocks)) - changed,
+              "reused_partials": len(reused), "analyzed_sources": sum(len(group["sources"]) for group in groups)}
+    return RefreshPlan(previous, sources, reused, groups, counts)
+
+
+def analysis_basis(analysis: Any) -> Dict[str, int]:
+    """Counts of the most frequent content words of an analysis (text or offline-engine dict)"""
+    if isinstance(analysis, dict):
+        analysis = json.dumps({key: value for key, value in analysis.items() if key not in ("status", "data_length")})
+    words = Counter(word for word in _WORD.findall(str(analysis).lower())
+                    if len(word) > 2 and word not in STOPWORDS and not word.isdigit())
+    return dict(words.most_common(BASIS_TERMS))
+
+
+def analysis_delta(basis: Dict[str, int], other: Dict[str, int]) -> float:
+    """1 - cosine similarity of two analysis bases: 0 for the same content, 1 for nothing in common"""
+    dot = sum(count * other.get(word, 0) for word, count in basis.items())
+    norm = math.sqrt(sum(count * count for count in basis.values())) * math.sqrt(sum(count * count for count in other.values()))
+    return 1.0 - dot / norm if norm else 1.0
+
+
+class ResultStore:
+    """SQLite store of topic versions, shared safely by the orchestrator and stage worker processes"""
+
+    def __init__(self, path: str, max_versions: int = 10):
+        self.path = path
+        self.max_versions = max_versions
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS topic_versions ("
+            "topic TEXT NOT NULL, version INTEGER NOT NULL, created_at REAL NOT NULL, "
+            "sources TEXT NOT NULL, partials TEXT NOT NULL, analysis TEXT, summary TEXT, stats TEXT NOT NULL, "
+            "PRIMARY KEY (topic, version))"
+        )
+
+    @classmethod
+    def from_config(cls, settings) -> "ResultStore":
+        return cls(settings.RESULT_STORE_PATH, max_versions=settings.RESULT_STORE_VERSIONS)
+
+    def latest(self, topic: str) -> Optional[TopicVersion]:
+        return self._fetch("WHERE topic = ? ORDER BY version DESC LIMIT 1", (topic,))
+
+    def get(self, topic: str, version: int) -> Optional[TopicVersion]:
+        return self._fetch("WHERE topic = ? AND version = ?", (topic, version))
+
+    def versions(self, topic: str) -> List[Dict[str, Any]]:
+        """Version number, creation time, stats and whether a summary was stored, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, created_at, stats, summary IS NOT NULL FROM topic_versions "
+                "WHERE topic = ? ORDER BY version DESC", (topic,)
+            ).fetchall()
+        return [{"version": version, "created_at": created_at, "stats": json.loads(stats), "has_summary": bool(summary)}
+                for version, created_at, stats, summary in rows]
+
+    def add_version(self, topic: str, sources: List[Dict[str, Any]], partials: List[Dict[str, Any]],
+                    analysis: Any, stats: Dict[str, Any], summary: Any = None) -> int:
+        """Store the next version of topic, dropping versions beyond max_versions; returns its number"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._conn.execute(
+                    "SELECT COALESCE(MAX(version), 0) + 1 FROM topic_versions WHERE topic = ?", (topic,)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO topic_versions (topic, version, created_at, sources, partials, analysis, summary, stats) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (topic, version, time.time(), json.dumps(sources), json.dumps(partials), json.dumps(analysis),
+                     None if summary is None else json.dumps(summary), json.dumps(stats))
+                )
+                if self.max_versions:
+                    self._conn.execute("DELETE FROM topic_versions WHERE topic = ? AND version <= ?",
+                                       (topic, version - self.max_versions))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return version
+
+    def set_summary(self, topic: str, version: int, summary: Any):
+        with self._lock:
+            self._conn.execute("UPDATE topic_versions SET summary = ? WHERE topic = ? AND version = ?",
+                               (json.dumps(summary), topic, version))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            topics, versions = self._conn.execute(
+                "SELECT COUNT(DISTINCT topic), COUNT(*) FROM topic_versions"
+            ).fetchone()
+        return {"path": self.path, "topics": topics, "versions": versions}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _fetch(self, where: str, params: tuple) -> Optional[TopicVersion]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT topic, version, created_at, sources, partials, analysis, summary, stats "
+                f"FROM topic_versions {where}", params
+            ).fetchone()
+        if row is None:
+            return None
+        topic, version, created_at, sources, partials, analysis, summary, stats = row
+        return TopicVersion(topic, version, created_at, json.loads(sources), json.loads(partials),
+                            json.loads(analysis) if analysis is not None else None,
+                            json.loads(summary) if summary is not None else None, json.loads(stats))
+
+
+_store: Optional[ResultStore] = None
+_store_lock = threading.Lock()
+
+
+def get_result_store() -> Optional[ResultStore]:
+    """Shared result store at RESULT_STORE_PATH, or None when topic versions aren't kept"""
+    global _store
+    with _store_lock:
+        if _store is None and config.RESULT_STORE_PATH:
+            _store = ResultStore.from_config(config)
+        return _store
@@ -0,0 +1,100 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from caching import SearchCache
+from sources import merge_ranked
+
+
+class DDGSSearchBackend:
+    """DuckDuckGo search backend that reuses one DDGS session per thread.
+
+    Any object with a compatible search(query, max_results) method can be
+    passed to ResearchAgent instead, e.g. a local stand-in for tests.
+    Results are dicts with "title", "href" and "body" keys.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            from duckduckgo_search import DDGS
+            session = self._local.session = DDGS()
+        return session
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        try:
+            return list(self._session().text(query, max_results=max_results))
+        except Exception:
+            # Drop a session that may be in a bad state; the next call opens a new one
+            self._local.session = None
+            raise
+
+
+class CachedSearchBackend:
+    """Serves repeat searches of one backend from a SearchCache; empty results are not stored"""
+
+    def __init__(self, backend, search_cache: SearchCache):
+        self.backend = backend
+        self.search_cache = search_cache
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        results = self.search_cache.get(query, max_results)
+        if results is None:
+            results = self.backend.search(query, max_results=max_results)
+            if results:
+                self.search_cache.set(query, max_results, results)
+        return results
+
+
+class MergedSearchBackend:
+    """Queries several backends for each search and merges their ranked hits.
+
+    A failing backend is logged and skipped; the search only fails if every
+    backend does.
+    """
+
+    # Local corpus results must stay fresh, so the merged results are never cached;
+    # wrap a sub-backend in CachedSearchBackend to cache its own results
+    cacheable = False
+
+    def __init__(self, backends: List):
+        self.logger = logging.getLogger(__name__)
+        self.backends = backends
+
+    @property
+    def search_cache(self) -> Optional[SearchCache]:
+        """Cache of the first cached sub-backend, for statistics"""
+        return next((backend.search_cache for backend in self.backends if isinstance(backend, CachedSearchBackend)), None)
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        result_lists = []
+        errors = []
+        for backend in self.backends:
+            try:
+                result_lists.append(backend.search(query, max_results=max_results))
+            except Exception as e:
+                self.logger.warning("%s search failed for %s: %s", type(backend).__name__, query, e)
+                errors.append(e)
+        if len(errors) == len(self.backends):
+            raise errors[0]
+        return merge_ranked(result_lists, max_results=max_results)
+
+
+def build_search_backend(settings):
+    """Search backend selected by SEARCH_BACKEND"""
+    if settings.SEARCH_BACKEND == "web":
+        return DDGSSearchBackend()
+    if settings.SEARCH_BACKEND not in ("local", "both"):
+        raise ValueError(f"Unknown SEARCH_BACKEND: {settings.SEARCH_BACKEND}")
+    from local_corpus import LocalCorpusSearchBackend
+    local = LocalCorpusSearchBackend.from_config(settings)
+    if settings.SEARCH_BACKEND == "local":
+        return local
+    web = DDGSSearchBackend()
+    if settings.SEARCH_CACHE_ENABLED:
+        web = CachedSearchBackend(web, SearchCache.from_config(settings))
+    return MergedSearchBackend([web, local])
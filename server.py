@@ -0,0 +1,216 @@
+"""
+Long-running research server.
+
+Keeps one EnhancedResearchOrchestrator warm (agents, MCP tool server,
+caches and rate limiters are built once and shared by every request) and
+serves topics over a Unix socket or localhost TCP. Each connection sends
+one JSON line and receives the pipeline events back as JSON lines.
+
+    python server.py                        # SERVER_SOCKET, or SERVER_HOST:SERVER_PORT
+    python server.py --socket /tmp/research.sock
+    python client.py "Quantum computing"    # see client.py
+
+Requests:
+    {"topic": "...", "timeout": 60}   streams the process_topic_stream() events
+    {"command": "stats"}              one {"event": "stats", ...} line
+    {"command": "metrics", "format": "prometheus"}
+                                      one {"event": "metrics", "body": ...} line
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socketserver
+import statistics
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+from config import config
+from enhanced_orchestrator import EnhancedResearchOrchestrator
+from resilience import get_metrics
+
+# Upper bound on a request line; topics are short
+MAX_REQUEST_BYTES = 65536
+
+
+class ServerBusyError(Exception):
+    """Raised when every slot is busy and the pending queue is full"""
+    pass
+
+
+class ResearchService:
+    """Admission control and per-request bookkeeping in front of a shared orchestrator"""
+
+    def __init__(self, orchestrator: EnhancedResearchOrchestrator, max_concurrent: int = 4, max_pending: int = 16):
+        self.orchestrator = orchestrator
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_pending = max(0, max_pending)
+        self.logger = logging.getLogger(__name__)
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0, "active": 0, "pending": 0}
+
+    def stream(self, topic: str, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Admit a request and yield its pipeline events.
+
+        Yields {"event": "queued"} first if the request has to wait for a
+        slot. Raises ServerBusyError without queueing when the server
+        already has max_concurrent + max_pending requests.
+        """
+        with self._lock:
+            if self._stats["active"] + self._stats["pending"] >= self.max_concurrent + self.max_pending:
+                self._stats["rejected"] += 1
+                raise ServerBusyError(f"Server busy: {self.max_concurrent} running, {self.max_pending} pending")
+            self._stats["accepted"] += 1
+            self._stats["pending"] += 1
+
+        running = False
+        try:
+            if not self._slots.acquire(blocking=False):
+                yield {"event": "queued", "topic": topic}
+                self._slots.acquire()
+            try:
+                self._move("pending", "active")
+                running = True
+                outcome = "failed"
+                for event in self.orchestrator.process_topic_stream(topic, timeout):
+                    if event["event"] == "done":
+                        outcome = "completed"
+                    yield event
+                self._count(outcome)
+            finally:
+                self._slots.release()
+        finally:
+            with self._lock:
+                self._stats["active" if running else "pending"] -= 1
+
+    def _move(self, source: str, target: str):
+        with self._lock:
+            self._stats[source] -= 1
+            self._stats[target] += 1
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        ttfb = list(self.orchestrator.ttfb_samples)
+        return {
+            "server": {**stats, "max_concurrent": self.max_concurrent, "max_pending": self.max_pending},
+            "ttfb": {"samples": len(ttfb), "mean": statistics.mean(ttfb) if ttfb else None},
+            "caches": self.orchestrator.get_cache_stats(),
+            "resilience": get_metrics()
+        }
+
+
+class ResearchRequestHandler(socketserver.StreamRequestHandler):
+    """One JSON request line in, JSON event lines out"""
+
+    def handle(self):
+        service: ResearchService = self.server.service
+        line = self.rfile.readline(MAX_REQUEST_BYTES)
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            self._send({"event": "error", "error": f"Invalid request: {e}"})
+            return
+
+        if request.get("command") == "stats":
+            self._send({"event": "stats", **service.get_stats()})
+            return
+        if request.get("command") == "metrics":
+            format = request.get("format", "json")
+            try:
+                self._send({"event": "metrics", "format": format, "body": service.orchestrator.export_metrics(format)})
+            except ValueError as e:
+                self._send({"event": "error", "error": str(e)})
+            return
+
+        topic = str(request.get("topic", "")).strip()
+        if not topic:
+            self._send({"event": "error", "error": "Request has no topic"})
+            return
+        timeout = request.get("timeout")
+
+        try:
+            for event in service.stream(topic, float(timeout) if timeout is not None else None):
+                self._send(event)
+        except ServerBusyError as e:
+            self._send({"event": "error", "topic": topic, "error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            service.logger.info("Client disconnected during '%s'", topic)
+
+    def _send(self, event: Dict[str, Any]):
+        self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = False  # server_close() waits for in-flight requests
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = False
+    allow_reuse_address = True
+
+
+def create_server(service: ResearchService, socket_path: Optional[str] = None,
+                  host: str = "127.0.0.1", port: int = 8765) -> socketserver.BaseServer:
+    """Bind a threading server to a Unix socket if socket_path is given, else to host:port"""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # stale socket from a previous run
+        server = ThreadingUnixServer(socket_path, ResearchRequestHandler)
+        os.chmod(socket_path, 0o600)
+    else:
+        server = ThreadingTCPServer((host, port), ResearchRequestHandler)
+    server.service = service
+    return server
+
+
+def serve(socket_path: Optional[str] = None, host: Optional[str] = None, port: Optional[int] = None,
+          use_mcp: bool = True):
+    """Run the server until SIGINT/SIGTERM, then finish in-flight requests and exit"""
+    orchestrator = EnhancedResearchOrchestrator(use_mcp=use_mcp)
+    service = ResearchService(orchestrator, config.SERVER_MAX_CONCURRENT, config.SERVER_MAX_PENDING)
+    socket_path = config.SERVER_SOCKET if socket_path is None else socket_path
+    server = create_server(service, socket_path, host or config.SERVER_HOST, port or config.SERVER_PORT)
+    logger = logging.getLogger(__name__)
+
+    def stop(signum, frame):
+        # shutdown() blocks until serve_forever() returns, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    address = socket_path or "%s:%d" % server.server_address[:2]
+    logger.info("Research server listening on %s (%s concurrent, %s pending)",
+                address, service.max_concurrent, service.max_pending)
+    try:
+        server.serve_forever()
+    finally:
+        logger.info("Research server shutting down")
+        server.server_close()
+        orchestrator.shutdown()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve research topics from a warm orchestrator")
+    parser.add_argument("--socket", help="Unix socket path (default: SERVER_SOCKET)")
+    parser.add_argument("--host", help="TCP host when no socket is set (default: SERVER_HOST)")
+    parser.add_argument("--port", type=int, help="TCP port when no socket is set (default: SERVER_PORT)")
+    parser.add_argument("--no-mcp", action="store_true", help="Use the standard web search research agent")
+    args = parser.parse_args()
+    serve(args.socket, args.host, args.port, use_mcp=not args.no_mcp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import hashlib
+import re
+from typing import Dict, Iterable, List
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from, matched by exact name
+TRACKING_PARAMS = frozenset(("fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src"))
+# ... and by prefix
+TRACKING_PREFIXES = ("utm_",)
+
+
+def canonical_url(url: str) -> str:
+    """Normalize a URL so mirrors of the same page compare equal"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if host.endswith(":80") or host.endswith(":443"):
+        host = host.rsplit(":", 1)[0]
+    path = re.sub(r"/+", "/", parts.path).rstrip("/") or "/"
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ))
+    return urlunsplit(("", host, path, query, ""))
+
+
+def content_hash(text: str) -> str:
+    """Hash of a source body that ignores case, punctuation and whitespace"""
+    normalized = " ".join(re.findall(r"\w+", text.lower()))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def merge_ranked(result_lists: Iterable[List[Dict[str, str]]], max_results: int = 0) -> List[Dict[str, str]]:
+    """Merge ranked search result lists, dropping duplicates by canonical URL and content.
+
+    Sources are ordered by reciprocal rank fusion, so a page that ranks well
+    for several queries comes before one that appears once.
+    """
+    merged: Dict[str, Dict] = {}
+    url_index: Dict[str, str] = {}
+    hash_index: Dict[str, str] = {}
+
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            href = result.get("href", "")
+            body = result.get("body", "")
+            url = canonical_url(href) if href else None
+            body_hash = content_hash(body) if body.strip() else None
+            key = url_index.get(url) or hash_index.get(body_hash)
+            if key is None:
+                key = url or body_hash or f"result-{len(merged)}"
+                merged[key] = {"result": result, "score": 0.0, "hits": 0}
+            if url:
+                url_index.setdefault(url, key)
+            if body_hash:
+                hash_index.setdefault(body_hash, key)
+
+            entry = merged[key]
+            entry["score"] += 1.0 / (rank + 1)
+            entry["hits"] += 1
+            # Keep the most complete copy of the page
+            if len(result.get("body", "")) > len(entry["result"].get("body", "")):
+                entry["result"] = result
+
+    ranked = sorted(merged.values(), key=lambda entry: entry["score"], reverse=True)
+    if max_results:
+        ranked = ranked[:max_results]
+    return [entry["result"] for entry in ranked]
+
+
+def format_sources(results: List[Dict[str, str]], body_chars: int = 200, start: int = 1) -> str:
+    """Search results as the numbered Source blocks the analysis stage expects, numbered from start.
+
+    Web snippets are cut to body_chars; local corpus passages (file: URLs)
+    were already cut to the index's snippet length and are kept whole.
+    """
+    return "\n\n".join([
+        f"Source {i}:\nTitle: {r['title']}\nURL: {r['href']}\nContent: {_body(r, body_chars)}..."
+        for i, r in enumerate(results, start)
+    ])
+
+
+def _body(result: Dict[str, str], body_chars: int) -> str:
+    if result["href"].startswith("file:"):
+        return result["body"]
+    return result["body"][:body_chars]
@@ -1,204 +1,556 @@
-from crewai import Agent
-from src.communication import AgentMessage, MessageQueue
-from src.config import config
-import logging
-from datetime import datetime
-
-class Task:
-    def __init__(self, text, agent_name="summary_agent"):
-        self.text = text
-        self.output_json = None
-        self.output_pydantic = None 
-        self.human_input = None  
-        self.description = None 
-        self.metadata = {} 
-        self.agent = agent_name 
-        self.id = "task_" + str(id(self))
-
-    def prompt(self):
-        return self.text
-
-class SummaryAgent:
-    def __init__(self, message_queue: MessageQueue):
-        self.message_queue = message_queue
-        self.agent_name = "summary_agent"
-        self.logger = logging.getLogger(__name__)
-        self.final_results = "Summary completed successfully" 
-
-        
-        self.agent = Agent(
-            role="Research Summarizer",
-            goal="Create comprehensive and well-structured research summaries from analysis data",
-            backstory="You are an expert technical writer who can synthesize complex information into clear, actionable summaries.",
-            allow_delegation=False,
-            verbose=True,
-            model=config.MODEL
-        )
-    
-    def process_messages(self):
-        """Process incoming messages from analysis agent"""
-        while True:
-            message = self.message_queue.receive_message(self.agent_name)
-            if message:
-                self._handle_message(message)
-            else:
-                break
-    
-    def _safe_execute_task(self, task_text):
-        """Safely execute task with proper error handling"""
-        try:
-            # Create task object
-            task = Task(task_text, agent_name="summary_agent")
-            
-            # Use the agent's kickoff method instead of execute_task if available
-            if hasattr(self.agent, 'kickoff'):
-                result = self.agent.kickoff(task.prompt())
-                return result
-            else:
-                # Fallback to execute_task
-                self.agent.execute_task(task)
-                return getattr(task, "output_json", None) or getattr(task, "result", None) or "Summary generated successfully"
-        except Exception as e:
-            self.logger.error(f"Summary task execution error: {str(e)}")
-            return self._fallback_summary(task_text)
-    
-    def _fallback_summary(self, task_text):
-        """Provide a fallback summary when CrewAI fails"""
-        self.logger.info("Using fallback summary method")
-        
-        # Extract key information from task text for basic summary
-        if "Topic:" in task_text and "Analysis Data:" in task_text:
-            lines = task_text.split('\n')
-            topic = "Unknown Topic"
-            for line in lines:
-                if line.startswith("Topic:"):
-                    topic = line.replace("Topic:", "").strip()
-                    break
-            
-            return {
-                "status": "fallback_summary",
-                "topic": topic,
-                "summary": f"Research summary for {topic} - Generated using fallback method",
-                "key_findings": ["Analysis completed with basic summary due to technical constraints"],
-                "conclusion": "This summary was generated using fallback methods. Consider checking API configuration for enhanced analysis."
-            }
-        else:
-            return "Research summary generated successfully using fallback methods."
-    
-    def _handle_message(self, message: AgentMessage):
-        """Handle different types of messages"""
-        try:
-            if message.message_type == "analysis":
-                self.logger.info("Summary Agent received analysis data")
-                
-                content = message.content
-                if not isinstance(content, dict):
-                    raise ValueError("Message content is not a dictionary")
-                
-                topic = content.get("topic", "Unknown topic")
-                research_data = content.get("research_data", "")
-                analysis_data = content.get("analysis_data", "")
-                
-                # Handle different formats of analysis_data
-                if isinstance(analysis_data, dict):
-                    analysis_text = str(analysis_data)
-                elif hasattr(analysis_data, '__dict__'):
-                    analysis_text = str(analysis_data.__dict__)
-                else:
-                    analysis_text = str(analysis_data)
-                
-                # Create task text for summary generation
-                task_text = f"""
-                Create a comprehensive research summary based on the following analysis.
-                
-                TOPIC: {topic}
-                
-                RESEARCH DATA:
-                {research_data}
-                
-                ANALYSIS DATA:
-                {analysis_text}
-                
-                Please provide a well-structured summary that includes:
-                1. Key findings and insights
-                2. Main themes and patterns
-                3. Important conclusions
-                4. Potential implications or recommendations
-                
-                Format the summary in a clear, professional manner suitable for research reporting.
-                """
-                
-                # Use safe execution
-                summary_result = self._safe_execute_task(task_text)
-                
-                # Generate final output
-                final_summary = self._generate_final_output(topic, summary_result)
-                
-                self.logger.info(f"Summary generation completed for: {topic}")
-                print(final_summary)
-                
-            elif message.message_type == "error":
-                self.logger.error(f"Summary Agent received error for topic: {message.content.get('topic', 'unknown')}")
-                topic = message.content.get("topic", "Unknown topic")
-                error_msg = message.content.get("error", "Unknown error")
-                
-                error_summary = f"""
-                === RESEARCH SUMMARY ===
-                Topic: {topic}
-                
-                Status: ERROR
-                Error: {error_msg}
-                
-                The research pipeline encountered an error. Please try again.
-                Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-                """
-                print(error_summary)
-                
-        except Exception as e:
-            self.logger.error(f"Summary agent failed: {str(e)}")
-            error_summary = f"""
-            === RESEARCH SUMMARY ===
-            Topic: Unknown
-            
-            Status: ERROR
-            Error: Summary generation failed: {str(e)}
-            
-            The research pipeline encountered an error. Please try again.
-            Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-            """
-            print(error_summary)
-    
-    def _generate_final_output(self, topic, summary_result):
-        """Generate the final formatted output"""
-        if isinstance(summary_result, dict):
-            # Handle dictionary output
-            key_findings = summary_result.get('key_findings', ['No specific findings listed'])
-            conclusion = summary_result.get('conclusion', 'Analysis completed successfully.')
-            
-            final_output = f"""
-            === RESEARCH SUMMARY ===
-            Topic: {topic}
-            
-            Status: COMPLETED
-            Key Findings:
-            {chr(10).join(f'  • {finding}' for finding in key_findings)}
-            
-            Conclusion: {conclusion}
-            
-            Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-            """
-        else:
-            # Handle string output
-            final_output = f"""
-            === RESEARCH SUMMARY ===
-            Topic: {topic}
-            
-            Status: COMPLETED
-            
-            Summary:
-            {summary_result}
-            
-            Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-            """
-        
+from communication import AgentMessage, MessageQueue, AsyncMessageQueue
+from blob_store import release_refs, resolve
+from caching import ResponseCache
+from resilience import CircuitBreaker, get_policy
+from logging_setup import sampled
+from metrics import current_trace, finish_trace, inc, span, traced_stage
+from config import config
+from result_store import get_result_store
+from text_analysis import analyze_text, split_sentences, textrank
+from concurrent.futures import Future, InvalidStateError
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
+import logging
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+
+# Sections of the summary prompt built by _prepare_summary
+_PROMPT_SECTIONS = re.compile(
+    r"TOPIC:(?P<topic>.*?)\n\s*RESEARCH DATA:\n(?P<research>.*)\n\s*ANALYSIS DATA:\n(?P<analysis>.*)"
+    r"\n\s*Please provide a well-structured summary", re.DOTALL)
+
+class Task:
+    def __init__(self, text, agent_name="summary_agent"):
+        self.text = text
+        self.output_json = None
+        self.output_pydantic = None 
+        self.human_input = None  
+        self.description = None 
+        self.metadata = {} 
+        self.agent = agent_name 
+        self.id = "task_" + str(id(self))
+
+    def prompt(self):
+        return self.text
+
+class SummaryAgent:
+    def __init__(self, message_queue: MessageQueue, async_queue: Optional[AsyncMessageQueue] = None,
+                 response_cache: Optional[ResponseCache] = None):
+        self.message_queue = message_queue
+        self.async_queue = async_queue
+        self.agent_name = "summary_agent"
+        self.role = "Research Summarizer"
+        self.logger = logging.getLogger(__name__)
+        
+        # Opt-in cache of model responses for byte-identical prompts
+        if response_cache is None and config.LLM_CACHE_ENABLED:
+            response_cache = ResponseCache.from_config(config)
+        self.response_cache = response_cache
+        self.llm_policy = get_policy("llm")
+        # Callers waiting for a summary, by the trace id of their request
+        self._result_futures: Dict[str, Future] = {}
+        # When a list, summaries nobody in this process waits for are kept here as
+        # (trace id, topic, summary) for a stage worker to forward; otherwise they are dropped
+        self.unclaimed: Optional[List[Tuple[Optional[str], str, str]]] = None
+        # Requests whose output is streamed as events instead of handed to a waiting caller, by trace id
+        self._streams: Dict[str, queue.Queue] = {}
+        self._results_lock = threading.RLock()
+        
+        # crewai is imported and the CrewAI agent built on first use
+        self._agent = None
+        self._agent_lock = threading.Lock()
+    
+    @property
+    def agent(self):
+        """CrewAI agent, constructed on first access"""
+        if self._agent is None:
+            with self._agent_lock:
+                if self._agent is None:
+                    self._agent = self._build_agent()
+        return self._agent
+    
+    @agent.setter
+    def agent(self, agent):
+        self._agent = agent
+    
+    def _build_agent(self):
+        from crewai import Agent
+        return Agent(
+            role=self.role,
+            goal="Create comprehensive and well-structured research summaries from analysis data",
+            backstory="You are an expert technical writer who can synthesize complex information into clear, actionable summaries.",
+            allow_delegation=False,
+            verbose=True,
+            model=config.MODEL
+        )
+    
+    def process_messages(self):
+        """Process incoming messages from analysis agent"""
+        while self.process_next_message():
+            pass
+    
+    def process_next_message(self) -> bool:
+        """Handle a single pending message, returning False when the queue is empty"""
+        message = self.message_queue.receive_message(self.agent_name)
+        if message is None:
+            return False
+        self._handle_message(message)
+        # Handled (or failed over to an error message): a durable queue may now forget it
+        self.message_queue.ack(message)
+        release_refs(message.content)
+        return True
+    
+    async def aprocess_messages(self):
+        """Async variant of process_messages using the async message queue"""
+        while await self.aprocess_next_message():
+            pass
+    
+    async def aprocess_next_message(self) -> bool:
+        """Handle a single pending async message, returning False when none is waiting"""
+        message = self.async_queue.receive_nowait(self.agent_name)
+        if message is None:
+            return False
+        await self._ahandle_message(message)
+        release_refs(message.content)
+        return True
+    
+    def result_future(self, trace_id: str) -> Future:
+        """Future resolved with the final summary text of the request traced as trace_id"""
+        with self._results_lock:
+            future = self._result_futures.get(trace_id)
+            if future is None:
+                future = self._result_futures[trace_id] = Future()
+            return future
+    
+    def release_result(self, trace_id: str):
+        """Stop waiting for the request traced as trace_id; a summary arriving later is dropped"""
+        with self._results_lock:
+            self._result_futures.pop(trace_id, None)
+    
+    def open_stream(self, trace_id: str, sink: queue.Queue):
+        """Stream the summary of the request traced as trace_id into sink as event dicts instead of storing it"""
+        with self._results_lock:
+            self._streams[trace_id] = sink
+    
+    def close_stream(self, trace_id: str):
+        with self._results_lock:
+            self._streams.pop(trace_id, None)
+    
+    def _stream_sink(self, trace_id: Optional[str]) -> Optional[queue.Queue]:
+        with self._results_lock:
+            return self._streams.get(trace_id)
+    
+    def _complete(self, trace_id: Optional[str], topic: str, result: str):
+        """Wake the caller waiting on the request traced as trace_id with its final output"""
+        with self._results_lock:
+            future = self._result_futures.pop(trace_id, None)
+            if future is None:
+                if self.unclaimed is not None:
+                    self.unclaimed.append((trace_id, topic, result))
+                else:
+                    self.logger.debug("Dropping summary for '%s': nobody is waiting for it", topic)
+                return
+            try:
+                future.set_result(result)
+            except InvalidStateError:
+                # The waiter gave up and cancelled
+                self.logger.debug("Dropping summary for '%s': its caller gave up", topic)
+    
+    def _safe_execute_task(self, task_text, use_cache: bool = True):
+        """Safely execute task with proper error handling"""
+        reason = self._fast_summary_reason()
+        if reason is not None:
+            return self._extractive_summary(task_text, "fast_summary", reason)
+        cached = self._cached_response(task_text, use_cache)
+        if cached is not None:
+            return cached
+        try:
+            # Create task object
+            task = Task(task_text, agent_name="summary_agent")
+            started = time.perf_counter()
+            
+            # Use the agent's kickoff method instead of execute_task if available
+            if hasattr(self.agent, 'kickoff'):
+                with span("summary.llm"):
+                    result = self.llm_policy.call(self.agent.kickoff, task.prompt())
+                self._store_response(task_text, result, started, use_cache)
+                return result
+            else:
+                # Fallback to execute_task
+                with span("summary.llm"):
+                    self.llm_policy.call(self.agent.execute_task, task)
+                result = getattr(task, "output_json", None) or getattr(task, "result", None)
+                self._store_response(task_text, result, started, use_cache)
+                return result or "Summary generated successfully"
+        except Exception as e:
+            self.logger.error("Summary task execution error: %s", e)
+            return self._fallback_summary(task_text)
+    
+    async def _asafe_execute_task(self, task_text, use_cache: bool = True):
+        """Async variant of _safe_execute_task"""
+        reason = self._fast_summary_reason()
+        if reason is not None:
+            return self._extractive_summary(task_text, "fast_summary", reason)
+        if not hasattr(self.agent, 'kickoff_async'):
+            # Blocking agents run on a worker thread so the event loop stays free
+            return await asyncio.to_thread(self._safe_execute_task, task_text, use_cache)
+        cached = self._cached_response(task_text, use_cache)
+        if cached is not None:
+            return cached
+        try:
+            task = Task(task_text, agent_name="summary_agent")
+            started = time.perf_counter()
+            with span("summary.llm"):
+                result = await self.llm_policy.acall(self.agent.kickoff_async, task.prompt())
+            self._store_response(task_text, result, started, use_cache)
+            return result
+        except Exception as e:
+            self.logger.error("Summary task execution error: %s", e)
+            return self._fallback_summary(task_text)
+    
+    def _cached_response(self, prompt: str, use_cache: bool):
+        """Look up a previous model response for this exact prompt"""
+        if self.response_cache is None:
+            return None
+        if not use_cache:
+            self.response_cache.record_bypass()
+            return None
+        cached = self.response_cache.get(config.MODEL, self.role, prompt)
+        if cached is not None:
+            self.logger.info("Summary served from LLM response cache", extra=sampled("summary.cache_hit"))
+        return cached
+    
+    def _store_response(self, prompt: str, result, started: float, use_cache: bool):
+        """Cache a successful model response (never fallbacks or errors)"""
+        if self.response_cache is None or not use_cache or result is None:
+            return
+        self.response_cache.set(config.MODEL, self.role, prompt, str(result), time.perf_counter() - started)
+    
+    def _fallback_summary(self, task_text):
+        """Provide a fallback summary when CrewAI fails"""
+        self.logger.debug("Using fallback summary method")
+        inc("fallbacks_total", stage="summary")
+        return self._extractive_summary(task_text, "fallback_summary", "llm_failed")
+    
+    def _fast_summary_reason(self) -> Optional[str]:
+        """Why this summary should skip the model (per SUMMARY_MODE), or None to call it"""
+        if config.SUMMARY_MODE == "fast":
+            return "mode"
+        if config.SUMMARY_MODE == "auto" and self.llm_policy.breaker.state == CircuitBreaker.OPEN:
+            return "circuit_open"
+        return None
+    
+    def _extractive_summary(self, task_text, status: str, reason: str):
+        """Key findings and a conclusion picked from the prompt's research and analysis by TextRank"""
+        sections = _PROMPT_SECTIONS.search(task_text)
+        if sections is None:
+            topic, research_text, analysis_text = "Unknown Topic", task_text, ""
+        else:
+            topic, research_text, analysis_text = (sections.group(name).strip()
+                                                   for name in ("topic", "research", "analysis"))
+        
+        with span("summary.extractive"):
+            analysis_sentences = split_sentences(analysis_text)
+            sentences = analysis_sentences + split_sentences(research_text)
+            scores = textrank(sentences)
+            ranked = sorted(range(len(sentences)), key=lambda i: -scores[i])
+            findings = sorted(ranked[:config.SUMMARY_FAST_SENTENCES])
+            # The most central analysis sentence left over, since analysis is where conclusions are drawn
+            remaining = [i for i in ranked[config.SUMMARY_FAST_SENTENCES:] if i < len(analysis_sentences)]
+            themes = analyze_text(f"{analysis_text}\n\n{research_text}", top_k=3).theme_names()
+        inc("summary_extractive_total", reason=reason)
+        
+        theme_text = ", ".join(themes) if themes else "no recurring themes"
+        return {
+            "status": status,
+            "topic": topic,
+            "summary": f"Extractive summary of {len(sentences)} sentences about {topic}; main themes: {theme_text}",
+            "key_findings": [sentences[i] for i in findings] or ["No findings could be extracted from the research data"],
+            "conclusion": sentences[remaining[0]] if remaining else f"The sources on {topic} focus on {theme_text}."
+        }
+    
+    def _extractive_text(self, summary: Dict) -> str:
+        findings = "\n".join(f"  • {finding}" for finding in summary["key_findings"])
+        return f"{summary['summary']}\n\nKey Findings:\n{findings}\n\nConclusion: {summary['conclusion']}"
+    
+    @traced_stage("summary")
+    def _handle_message(self, message: AgentMessage):
+        """Handle different types of messages"""
+        try:
+            if message.message_type == "analysis":
+                topic, task_text = self._prepare_summary(message)
+                
+                sink = self._stream_sink(current_trace().trace_id)
+                if sink is not None:
+                    self._stream_summary(topic, task_text, sink)
+                    finish_trace("success")
+                    return
+                
+                # Use safe execution, unless a refresh found the stored summary still current
+                refresh = message.content.get("refresh")
+                summary_result = self._stored_summary(topic, refresh)
+                if summary_result is None:
+                    summary_result = self._safe_execute_task(task_text)
+                    self._record_summary(topic, refresh, summary_result)
+                
+                # Generate final output
+                final_summary = self._generate_final_output(topic, summary_result)
+                self.logger.debug("Summary generation completed for: %s", topic)
+                status = "success"
+                
+            elif message.message_type == "error":
+                topic, final_summary = self._error_summary(message)
+                status = "error"
+                sink = self._stream_sink(current_trace().trace_id)
+                if sink is not None:
+                    finish_trace(status)
+                    sink.put({"event": "error", "topic": topic, "error": message.content.get("error", "Unknown error")})
+                    return
+            else:
+                return
+        except Exception as e:
+            topic, final_summary = self._failure_summary(message, e)
+            status = "error"
+            sink = self._stream_sink(current_trace().trace_id)
+            if sink is not None:
+                finish_trace(status)
+                sink.put({"event": "error", "topic": topic, "error": f"Summary generation failed: {str(e)}"})
+                return
+        
+        finish_trace(status)
+        self._complete(current_trace().trace_id, topic, final_summary)
+    
+    def _stored_summary(self, topic: str, refresh: Optional[Dict]):
+        """The summary a refresh carried over from the topic's previous version, if any"""
+        if not refresh or not refresh.get("summary_reused") or get_result_store() is None:
+            return None
+        version = get_result_store().get(topic, refresh["version"])
+        if version is None or version.summary is None:
+            return None
+        inc("refresh_summaries_total", outcome="reused")
+        self.logger.debug("Reusing the stored summary for '%s' (analysis delta %s)", topic, refresh["analysis_delta"])
+        return version.summary
+    
+    def _record_summary(self, topic: str, refresh: Optional[Dict], summary_result):
+        """Store a new summary on the refreshed version (never fallbacks, so the next refresh retries)"""
+        if not refresh or get_result_store() is None:
+            return
+        if isinstance(summary_result, dict) and summary_result.get("status") == "fallback_summary":
+            return
+        if not isinstance(summary_result, (str, dict)):
+            summary_result = str(summary_result)
+        get_result_store().set_summary(topic, refresh["version"], summary_result)
+        inc("refresh_summaries_total", outcome="regenerated")
+    
+    def _stream_summary(self, topic: str, task_text: str, sink: queue.Queue):
+        """Push the summary for topic into sink token by token as the model produces it"""
+        tokens = self._stream_task(task_text)
+        if tokens is None:
+            # No streaming support: send the whole summary as a single chunk
+            summary_result = self._safe_execute_task(task_text)
+            sink.put({"event": "token", "topic": topic, "text": self._generate_final_output(topic, summary_result)})
+        else:
+            sink.put({"event": "token", "topic": topic, "text": f"=== RESEARCH SUMMARY ===\nTopic: {topic}\n\nSummary:\n"})
+            for text in tokens:
+                sink.put({"event": "token", "topic": topic, "text": text})
+            sink.put({"event": "token", "topic": topic,
+                      "text": f"\n\nGenerated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"})
+        
+        self.logger.debug("Summary streaming completed for: %s", topic)
+        sink.put({"event": "summary_done", "topic": topic})
+    
+    def _stream_task(self, task_text: str) -> Optional[Iterator[str]]:
+        """Iterator over model output chunks, or None if the model can't stream"""
+        if self._fast_summary_reason() is not None:
+            return None
+        cached = self._cached_response(task_text, use_cache=True)
+        if cached is not None:
+            return iter([cached])
+        
+        llm = getattr(self.agent, "llm", None)
+        if llm is None or not hasattr(llm, "stream"):
+            return None
+        return self._stream_llm(llm, task_text)
+    
+    def _stream_llm(self, llm, task_text: str) -> Iterator[str]:
+        started = time.perf_counter()
+        # Only buffer the full text when it is going to be cached
+        parts = [] if self.response_cache is not None else None
+        produced = False
+        try:
+            with span("summary.llm"):
+                # REQUEST_TIMEOUT bounds the wait for each chunk; a stream that fails before its first chunk is retried
+                for chunk in self.llm_policy.stream(llm.stream, task_text):
+                    text = getattr(chunk, "content", chunk)
+                    if not text:
+                        continue
+                    produced = True
+                    if parts is not None:
+                        parts.append(text)
+                    yield text
+        except Exception as e:
+            self.logger.error("Summary streaming error: %s", e)
+            if produced:
+                yield f"\n[Summary stream interrupted: {str(e)}]"
+            else:
+                yield self._extractive_text(self._fallback_summary(task_text))
+            return
+        
+        if parts is not None:
+            self._store_response(task_text, "".join(parts), started, use_cache=True)
+    
+    @traced_stage("summary")
+    async def _ahandle_message(self, message: AgentMessage):
+        """Async variant of _handle_message"""
+        try:
+            if message.message_type == "analysis":
+                topic, task_text = self._prepare_summary(message)
+                refresh = message.content.get("refresh")
+                summary_result = self._stored_summary(topic, refresh)
+                if summary_result is None:
+                    summary_result = await self._asafe_execute_task(task_text)
+                    self._record_summary(topic, refresh, summary_result)
+                final_summary = self._generate_final_output(topic, summary_result)
+                self.logger.debug("Summary generation completed for: %s", topic)
+                status = "success"
+                
+            elif message.message_type == "error":
+                topic, final_summary = self._error_summary(message)
+                status = "error"
+            else:
+                return
+        except Exception as e:
+            topic, final_summary = self._failure_summary(message, e)
+            status = "error"
+        
+        finish_trace(status)
+        self._complete(current_trace().trace_id, topic, final_summary)
+    
+    def _prepare_summary(self, message: AgentMessage):
+        """Validate an analysis message and build the summary prompt"""
+        self.logger.debug("Summary Agent received analysis data")
+        
+        content = message.content
+        if not isinstance(content, dict):
+            raise ValueError("Message content is not a dictionary")
+        
+        topic = content.get("topic", "Unknown topic")
+        research_data = resolve(content.get("research_data", ""))
+        analysis_data = resolve(content.get("analysis_data", ""))
+        
+        # Handle different formats of analysis_data; text is used as is
+        if isinstance(analysis_data, str):
+            analysis_text = analysis_data
+        elif isinstance(analysis_data, dict):
+            analysis_text = self._analysis_text(analysis_data)
+        elif hasattr(analysis_data, '__dict__'):
+            analysis_text = str(analysis_data.__dict__)
+        else:
+            analysis_text = str(analysis_data)
+        
+        # Create task text for summary generation
+        task_text = f"""
+        Create a comprehensive research summary based on the following analysis.
+        
+        TOPIC: {topic}
+        
+        RESEARCH DATA:
+        {research_data}
+        
+        ANALYSIS DATA:
+        {analysis_text}
+        
+        Please provide a well-structured summary that includes:
+        1. Key findings and insights
+        2. Main themes and patterns
+        3. Important conclusions
+        4. Potential implications or recommendations
+        
+        Format the summary in a clear, professional manner suitable for research reporting.
+        """
+        return topic, task_text
+    
+    def _analysis_text(self, analysis: Dict) -> str:
+        """Readable text for an analysis dict (the offline engine's output): one "Field: value" line each"""
+        lines = []
+        for key, value in analysis.items():
+            if key in ("status", "topic", "data_length", "source_themes"):
+                continue
+            if isinstance(value, (list, tuple)):
+                value = ", ".join(str(item) for item in value)
+            lines.append(f"{key.replace('_', ' ').capitalize()}: {value}")
+        return "\n".join(lines)
+    
+    def _error_summary(self, message: AgentMessage):
+        """Final output for a topic whose pipeline reported an error"""
+        self.logger.error("Summary Agent received error for topic: %s", message.content.get('topic', 'unknown'))
+        topic = message.content.get("topic", "Unknown topic")
+        error_msg = message.content.get("error", "Unknown error")
+        
+        error_summary = f"""
+        === RESEARCH SUMMARY ===
+        Topic: {topic}
+        
+        Status: ERROR
+        Error: {error_msg}
+        
+        The research pipeline encountered an error. Please try again.
+        Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        """
+        return topic, error_summary
+    
+    def _failure_summary(self, message: AgentMessage, error: Exception):
+        """Final output when the summary agent itself fails"""
+        self.logger.error("Summary agent failed: %s", error)
+        topic = message.content.get("topic", "Unknown") if isinstance(message.content, dict) else "Unknown"
+        error_summary = f"""
+        === RESEARCH SUMMARY ===
+        Topic: {topic}
+        
+        Status: ERROR
+        Error: Summary generation failed: {str(error)}
+        
+        The research pipeline encountered an error. Please try again.
+        Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        """
+        return topic, error_summary
+    
+    def _generate_final_output(self, topic, summary_result):
+        """Generate the final formatted output"""
+        if isinstance(summary_result, dict):
+            # Handle dictionary output
+            key_findings = summary_result.get('key_findings', ['No specific findings listed'])
+            conclusion = summary_result.get('conclusion', 'Analysis completed successfully.')
+            
+            final_output = f"""
+            === RESEARCH SUMMARY ===
+            Topic: {topic}
+            
+            Status: COMPLETED
+            {summary_result.get('summary', '')}
+            
+            Key Findings:
+            {chr(10).join(f'  • {finding}' for finding in key_findings)}
+            
+            Conclusion: {conclusion}
+            
+            Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            """
+        else:
+            # Handle string output
+            final_output = f"""
+            === RESEARCH SUMMARY ===
+            Topic: {topic}
+            
+            Status: COMPLETED
+            
+            Summary:
+            {summary_result}
+            
+            Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            """
+        
         return final_output
\ No newline at end of file
@@ -0,0 +1,23 @@
+from benchmark import StubSearchBackend
+from benchmark_suite import compare, flatten, percentiles
+
+
+def test_percentiles_use_the_nearest_rank():
+    stats = percentiles([float(value) for value in range(1, 101)])
+    assert (stats["p50"], stats["p90"], stats["p99"], stats["max"]) == (50.0, 90.0, 99.0, 100.0)
+    assert percentiles([3.0])["p99"] == 3.0
+
+
+def test_compare_flags_regressions_in_either_direction(capsys):
+    baseline = {"metrics": {"latency": {"end_to_end": {"p50": 1.0}}, "throughput": {"c4": 10.0}, "ok": True}}
+    current = {"metrics": {"latency": {"end_to_end": {"p50": 1.05}}, "throughput": {"c4": 7.0}, "ok": True}}
+    assert flatten(current["metrics"]) == {"latency.end_to_end.p50": 1.05, "throughput.c4": 7.0}
+    # Latency is a cost and throughput a benefit: only the throughput drop is beyond 10%
+    assert compare(current, baseline, tolerance=0.1) == ["throughput.c4"]
+    assert "REGRESSION" in capsys.readouterr().out
+
+
+def test_stub_search_is_deterministic():
+    first = StubSearchBackend(0, seed=1).search("transit", max_results=3)
+    assert first == StubSearchBackend(0, seed=1).search("transit", max_results=3)
+    assert len(first) == 3
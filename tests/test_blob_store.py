@@ -0,0 +1,49 @@
+import os
+import time
+
+import pytest
+
+from blob_store import BlobNotFoundError, BlobRef, FileBlobStore, MemoryBlobStore
+from communication import AgentMessage
+from durable_queue import DurableMessageQueue
+
+PAYLOAD = "Source 1:\nContent: " + "research text " * 1000
+
+
+def test_memory_blobs_are_shared_until_the_last_reference_is_released():
+    store = MemoryBlobStore()
+    first, second = store.put(PAYLOAD), store.put(PAYLOAD)
+    assert first == second and store.get_stats()["deduplicated"] == 1
+    assert store.text(first) is PAYLOAD
+    store.release(first)
+    assert first in store
+    store.release(second)
+    assert first not in store
+    with pytest.raises(BlobNotFoundError):
+        store.text(first)
+
+
+def test_file_blobs_are_readable_from_another_store_and_pruned_when_unused(tmp_path):
+    directory = str(tmp_path / "blobs")
+    ref = FileBlobStore(directory).put(PAYLOAD)
+    # Another process opens the same directory
+    other = FileBlobStore(directory, ttl=60)
+    assert other.text(ref) == PAYLOAD
+    assert bytes(other.view(ref)[:9]) == b"Source 1:"
+
+    stale = time.time() - 120
+    os.utime(other._path(ref.digest), (stale, stale))
+    assert other.prune() == 1
+    assert ref not in other
+
+
+def test_refs_survive_a_round_trip_through_the_durable_queue(tmp_path):
+    store = MemoryBlobStore()
+    ref = store.put(PAYLOAD)
+    queue = DurableMessageQueue(str(tmp_path / "queue.sqlite3"))
+    queue.send_message(AgentMessage(sender="a", receiver="sink", content={"research_data": ref},
+                                    message_type="research_data", timestamp="0"))
+    received = BlobRef.from_value(queue.receive_message("sink").content["research_data"])
+    assert received == ref and received.size == len(PAYLOAD.encode("utf-8"))
+    assert store.text(received) == PAYLOAD
+    queue.close()
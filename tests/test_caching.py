@@ -0,0 +1,80 @@
+import time
+
+from analysis_agent import AnalysisAgent, Task
+from benchmark import StubLLM
+from caching import ResponseCache, SearchCache
+from communication import MessageQueue
+from research_agent import ResearchAgent
+
+RESULTS = [{"title": "Transit plan", "href": "https://example.com/transit", "body": "Three new bus lines."}]
+
+
+class CountingSearch:
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, max_results=5):
+        self.calls += 1
+        return RESULTS
+
+
+class FailingLLM:
+    def kickoff(self, prompt):
+        raise ValueError("model unavailable")
+
+
+def test_search_cache_normalizes_queries_and_persists_to_disk(tmp_path):
+    path = str(tmp_path / "search.sqlite3")
+    cache = SearchCache(path=path, ttl=60)
+    cache.set("Transit  Plan", 5, RESULTS)
+    assert cache.get("transit plan", 5) == RESULTS
+    assert cache.get("transit plan", 10) is None
+
+    # A new process starts with an empty memory tier and reads the disk tier
+    reopened = SearchCache(path=path, ttl=60)
+    assert reopened.get("transit plan", 5) == RESULTS
+    assert reopened.get("transit plan", 5) == RESULTS
+    stats = reopened.get_stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_search_cache_entries_expire(tmp_path):
+    cache = SearchCache(path=str(tmp_path / "search.sqlite3"), ttl=0.05)
+    cache.set("transit", 5, RESULTS)
+    time.sleep(0.1)
+    assert cache.get("transit", 5) is None
+
+
+def test_research_agent_searches_each_query_once(tmp_path):
+    backend = CountingSearch()
+    agent = ResearchAgent(MessageQueue(), search_backend=backend,
+                          search_cache=SearchCache(path=str(tmp_path / "search.sqlite3")))
+    assert agent._search("transit", max_results=5) == RESULTS
+    assert agent._search(" Transit ", max_results=5) == RESULTS
+    assert backend.calls == 1
+
+
+def test_response_cache_ignores_prompt_whitespace_and_evicts_by_size(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite3"), max_bytes=300)
+    cache.set("model", "Data Analyst", "Analyze\n    this topic", "x" * 100, latency=1.5)
+    assert cache.get("model", "Data Analyst", "Analyze this topic") == "x" * 100
+    assert cache.get("model", "Research Summarizer", "Analyze this topic") is None
+    assert cache.get_stats()["latency_saved"] == 1.5
+
+    for index in range(3):
+        cache.set("model", "Data Analyst", f"prompt {index}", "y" * 100)
+    assert cache.get_stats()["disk"]["bytes"] <= 300
+
+
+def test_analysis_agent_caches_responses_but_not_failures(tmp_path):
+    agent = AnalysisAgent(MessageQueue(), response_cache=ResponseCache(str(tmp_path / "llm.sqlite3")))
+    agent.agent = StubLLM(0, "Key themes: transit.")
+    task = Task("Analyze the transit plan")
+    assert agent._safe_execute_task(task) == "Key themes: transit."
+    agent.agent = FailingLLM()
+    assert agent._safe_execute_task(task) == "Key themes: transit."
+
+    failed = Task("Analyze the wheat trials")
+    assert agent._safe_execute_task(failed).startswith("Analysis could not be completed")
+    agent.agent = StubLLM(0, "Key themes: wheat.")
+    assert agent._safe_execute_task(failed) == "Key themes: wheat."
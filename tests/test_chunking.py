@@ -0,0 +1,28 @@
+from chunking import CHARS_PER_TOKEN, build_digest, chunk_text, estimate_tokens, pack
+
+
+def test_pack_fills_chunks_greedily_without_splitting_units():
+    units = ["a" * 40, "b" * 40, "c" * 40]  # 10 tokens each, separators cost 1
+    assert pack(units, max_tokens=21) == ["a" * 40 + "\n\n" + "b" * 40, "c" * 40]
+    assert pack(units, max_tokens=20) == units
+
+
+def test_chunk_text_keeps_sources_whole_and_within_budget():
+    sources = [f"Source {i}:\nContent: " + "word " * 30 for i in range(1, 7)]
+    chunks = chunk_text("\n\n".join(sources), max_tokens=100)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    assert "\n\n".join(chunks).split("\n\n") == [source.strip() for source in sources]
+
+
+def test_oversized_sentence_is_cut_to_the_budget():
+    chunks = chunk_text("x" * (50 * CHARS_PER_TOKEN), max_tokens=20)
+    assert all(estimate_tokens(chunk) <= 20 for chunk in chunks)
+    assert "".join(chunks) == "x" * (50 * CHARS_PER_TOKEN)
+
+
+def test_digest_covers_every_paragraph_before_going_deep():
+    paragraphs = [f"Lead {i}. " + " ".join(f"Detail {i}.{j}." for j in range(10)) for i in range(4)]
+    digest = build_digest("\n\n".join(paragraphs), max_tokens=30)
+    assert estimate_tokens(digest) <= 30
+    assert all(f"Lead {i}." in digest for i in range(4))
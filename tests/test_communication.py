@@ -0,0 +1,45 @@
+import threading
+import time
+
+import pytest
+
+from communication import AgentMessage, MessageQueue, QueueFullError
+
+
+def message(receiver, number=0):
+    return AgentMessage(sender="a", receiver=receiver, content={"number": number},
+                        message_type="research_data", timestamp="0")
+
+
+def test_each_receiver_gets_its_own_messages_in_order():
+    queue = MessageQueue()
+    for number in range(3):
+        queue.send_message(message("x", number))
+        queue.send_message(message("y", number))
+    assert [queue.receive_message("x").content["number"] for _ in range(3)] == [0, 1, 2]
+    assert queue.receive_message("x") is None
+    assert queue.depth("y") == 3 and queue.depth() == 3
+
+
+def test_full_queue_rejects_or_blocks_until_there_is_room():
+    rejecting = MessageQueue(max_size=1, full_policy="reject")
+    rejecting.send_message(message("x"))
+    with pytest.raises(QueueFullError):
+        rejecting.send_message(message("x"))
+    assert rejecting.get_stats()["rejected"] == 1
+
+    blocking = MessageQueue(max_size=1, send_timeout=2)
+    blocking.send_message(message("x", 1))
+    threading.Timer(0.05, blocking.receive_message, args=("x",)).start()
+    started = time.perf_counter()
+    blocking.send_message(message("x", 2))
+    assert time.perf_counter() - started >= 0.04
+    assert blocking.receive_message("x").content["number"] == 2
+
+
+def test_subscribers_are_woken_on_delivery():
+    queue = MessageQueue()
+    woken = []
+    queue.subscribe("x", lambda: woken.append(queue.receive_message("x").content["number"]))
+    queue.send_message(message("x", 7))
+    assert woken == [7]
@@ -0,0 +1,71 @@
+from analysis_agent import AnalysisAgent
+from communication import AgentMessage, MessageQueue
+from dedup import SourceDeduplicator, simhash
+from sources import format_sources
+
+ARTICLE = ("The city council approved a new transit plan on Tuesday that adds three bus rapid transit lines, "
+           "extends light rail service to the airport and funds protected bike lanes across the downtown core "
+           "over the next decade, with construction starting next spring after a final environmental review")
+OTHER = ("Researchers reported that a drought resistant wheat variety yielded twenty percent more grain in field "
+         "trials across four countries, and seed companies plan to license the trait to farmers within two years")
+
+
+def research(*bodies):
+    results = [{"title": f"Title {i}", "href": f"https://site{i}.com/a", "body": body}
+               for i, body in enumerate(bodies)]
+    return format_sources(results, body_chars=1000)
+
+
+def test_simhash_is_close_for_mirrors_and_far_for_unrelated_text():
+    mirror = ARTICLE.replace("Tuesday", "Wednesday")
+    assert bin(simhash(ARTICLE) ^ simhash(mirror)).count("1") <= 9
+    assert bin(simhash(ARTICLE) ^ simhash(OTHER)).count("1") > 9
+    assert simhash("too short") is None
+
+
+def test_mirrors_within_a_topic_are_merged_into_the_longer_copy():
+    deduplicator = SourceDeduplicator()
+    longer = ARTICLE + " and a public comment period"
+    text = deduplicator.dedup("transit", research(ARTICLE, OTHER, longer))
+    assert text.count("Content: ") == 2
+    assert "public comment period" in text
+    assert "Also published as: Source 1: Title 0" in text
+    assert deduplicator.get_stats()["merged"] == 1
+
+
+def test_rerun_of_a_topic_is_not_a_cross_topic_duplicate():
+    deduplicator = SourceDeduplicator()
+    text = research(ARTICLE, OTHER)
+    deduplicator.dedup("transit", text)
+    assert deduplicator.dedup("transit", text) == text
+    assert deduplicator.get_stats()["cross_topic"] == 0
+
+
+def test_cross_topic_copy_is_found_behind_a_closer_same_topic_entry():
+    deduplicator = SourceDeduplicator()
+    deduplicator.dedup("city news", research(ARTICLE.replace("Tuesday", "Wednesday")))
+    deduplicator.dedup("transit", research(ARTICLE))
+    # The nearest indexed copy is transit's own, but city news analyzed it first
+    deduplicator.drop_across_topics = True
+    text = deduplicator.dedup("transit", research(ARTICLE, OTHER))
+    assert "near-duplicate of a source already analyzed for 'city news'" in text
+    assert OTHER in text
+    assert deduplicator.get_stats()["cross_topic"] == 2
+
+
+def test_pipelined_batches_skip_sources_sent_in_an_earlier_batch():
+    agent = AnalysisAgent(MessageQueue())
+    agent.deduplicator = SourceDeduplicator()
+    mirror = ARTICLE.replace("Tuesday", "Wednesday")
+
+    def partial(part, text):
+        return AgentMessage(sender="research_agent", receiver="analysis_agent",
+                            content={"topic": "transit", "research_data": text, "status": "success"},
+                            message_type="research_partial", timestamp="0",
+                            metadata={"trace": None, "pipeline": {"stream": "s1", "part": part, "final": False}})
+
+    first = agent._partial_tasks(partial(1, research(ARTICLE)))
+    second = agent._partial_tasks(partial(2, research(OTHER, mirror)))
+    assert ARTICLE in first[0].text
+    assert mirror not in second[0].text and OTHER in second[0].text
+    assert "analyzed with an earlier batch" in second[0].text
@@ -0,0 +1,60 @@
+import os
+
+from local_corpus import LocalCorpusIndex
+from sources import format_sources
+
+
+def write(path, text):
+    path.write_text(text)
+    # Same-second rewrites must still look changed
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_bm25_ranks_the_most_relevant_document_first(tmp_path):
+    corpus = tmp_path / "docs"
+    corpus.mkdir()
+    write(corpus / "retention.md", "# Retention\n\nLogs are deleted under the retention policy after ninety days.")
+    write(corpus / "other.txt", "The policy for travel expenses covers hotels and meals.")
+    index = LocalCorpusIndex(str(corpus), str(tmp_path / "index"))
+    index.update()
+    results = index.search("retention policy")
+    assert results[0]["href"].endswith("retention.md")
+    assert "ninety days" in results[0]["body"]
+
+
+def test_update_reindexes_only_changed_files(tmp_path):
+    corpus = tmp_path / "docs"
+    corpus.mkdir()
+    write(corpus / "a.txt", "Alpha document about glaciers.")
+    write(corpus / "b.txt", "Beta document about volcanoes.")
+    write(corpus / "c.txt", "Gamma document about deserts.")
+    index = LocalCorpusIndex(str(corpus), str(tmp_path / "index"))
+    assert index.update()["added"] == 3
+
+    write(corpus / "b.txt", "Beta document, now about coral reefs.")
+    (corpus / "c.txt").unlink()
+    write(corpus / "d.txt", "Delta document about rainforests.")
+    stats = index.update()
+    assert {key: stats[key] for key in ("added", "modified", "removed", "unchanged")} == \
+        {"added": 1, "modified": 1, "removed": 1, "unchanged": 1}
+    assert index.search("volcanoes") == [] and index.search("deserts") == []
+    assert index.search("coral reefs")[0]["href"].endswith("b.txt")
+    assert index.search("glaciers")[0]["href"].endswith("a.txt")
+    assert index.get_stats()["documents"] == 3
+
+    # Nothing changed: the current generation is kept
+    generation = index.get_stats()["generation"]
+    assert index.update()["unchanged"] == 3
+    assert index.get_stats()["generation"] == generation
+
+
+def test_formatted_sources_keep_the_whole_passage(tmp_path):
+    corpus = tmp_path / "docs"
+    corpus.mkdir()
+    write(corpus / "long.txt", "Retention " + "policy details for archived logs. " * 12)
+    index = LocalCorpusIndex(str(corpus), str(tmp_path / "index"))
+    index.update()
+    results = index.search("retention policy")
+    assert len(results[0]["body"]) > 200
+    assert results[0]["body"] in format_sources(results)
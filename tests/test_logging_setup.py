@@ -0,0 +1,44 @@
+import json
+import logging
+import queue
+
+from logging_setup import CappedFormatter, JsonFormatter, NonBlockingQueueHandler, SamplingFilter, capped, sampled
+from metrics import stage
+
+
+def record(message="hello %s", args=("world",), level=logging.INFO, **extra):
+    entry = logging.makeLogRecord({"name": "test", "levelno": level, "levelname": logging.getLevelName(level),
+                                   "msg": message, "args": args})
+    for key, value in extra.items():
+        setattr(entry, key, value)
+    return entry
+
+
+def test_sampling_keeps_one_in_rate_per_key_and_every_warning():
+    sampler = SamplingFilter(3)
+    kept = [sampler.filter(record(**sampled("queue.send"))) for _ in range(7)]
+    assert kept == [True, False, False, True, False, False, True]
+    assert sampler.filter(record(level=logging.WARNING, **sampled("queue.send")))
+    assert sampler.filter(record())
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(), max_size=2)
+    for _ in range(5):
+        handler.handle(record())
+    assert handler.queue.qsize() == 2 and handler.dropped == 3
+
+
+def test_json_lines_carry_the_trace_and_extra_fields():
+    handler = NonBlockingQueueHandler(queue.Queue())
+    with stage("research", topic="logged topic", trace_id="abc123"):
+        handler.handle(record(message="%s", args=("x" * 50,), attempt=2))
+    entry = json.loads(JsonFormatter(max_chars=10).format(handler.queue.get_nowait()))
+    assert (entry["trace_id"], entry["topic"], entry["attempt"]) == ("abc123", "logged topic", 2)
+    assert entry["message"] == "x" * 10 + "... [40 more chars]"
+
+
+def test_large_arguments_are_capped():
+    params = {"query": "q" * 1000, "items": list(range(100))}
+    text = CappedFormatter("%(message)s", 0).format(record("params: %s", (capped(params),)))
+    assert len(text) < 400 and "..." in text
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from mcp_tools import MCPToolServer
+from resilience import CircuitBreaker, ResiliencePolicy, RetryPolicy, TokenBucket
+
+
+def sleeper(seconds, result="done"):
+    def tool(params):
+        time.sleep(seconds)
+        return result
+    return tool
+
+
+def test_batched_calls_run_in_parallel_and_keep_call_order():
+    server = MCPToolServer()
+    server.register_tool("slow", sleeper(0.2, "slow done"))
+    server.register_tool("fast", sleeper(0.0, "fast done"))
+    started = time.perf_counter()
+    results = server.execute_tools([("slow", {}), ("slow", {}), ("fast", {}), ("missing", {})])
+    assert time.perf_counter() - started < 0.35
+    assert [r["result"] for r in results[:3]] == ["slow done", "slow done", "fast done"]
+    assert [r["status"] for r in results] == ["ok", "ok", "ok", "error"]
+
+
+def test_a_tool_over_its_timeout_does_not_hold_up_the_batch():
+    server = MCPToolServer()
+    # Its own policy, so the timeouts don't count against the shared mcp circuit
+    server.policy = ResiliencePolicy("test", TokenBucket(0, 1), RetryPolicy(1, 0, 0), CircuitBreaker("test", 0, 1), None)
+    server.register_tool("hangs", sleeper(1.0), timeout=0.05)
+    server.register_tool("fast", sleeper(0.0, "fast done"))
+    started = time.perf_counter()
+    results = server.execute_tools([("hangs", {}), ("fast", {})])
+    assert time.perf_counter() - started < 0.5
+    assert [r["status"] for r in results] == ["timeout", "ok"]
+
+
+def test_concurrency_limit_and_result_cache_per_tool():
+    server = MCPToolServer()
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def limited(params):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return params["query"]
+
+    server.register_tool("limited", limited, max_concurrency=2)
+    server.execute_tools([("limited", {"query": str(i)}) for i in range(6)])
+    assert peak[0] == 2
+
+    calls = []
+    server.register_tool("cached", lambda params: calls.append(params) or "hit", cacheable=True)
+    server.execute_tool("cached", {"query": "q"})
+    server.execute_tool("cached", {"query": "q"})
+    assert len(calls) == 1
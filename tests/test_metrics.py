@@ -0,0 +1,34 @@
+from benchmark import build_orchestrator
+from metrics import Histogram, MetricsRegistry, recent_traces
+
+
+def test_histogram_quantiles_are_bucket_upper_bounds():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+    assert (histogram.quantile(0.5), histogram.quantile(0.75), histogram.quantile(1.0)) == (0.1, 1.0, 1.0)
+    assert Histogram().quantile(0.5) is None
+
+
+def test_prometheus_export_has_cumulative_buckets_and_escaped_labels():
+    registry = MetricsRegistry()
+    registry.inc("topics_total", status='say "hi"')
+    registry.observe("stage_seconds", 0.2, stage="analysis")
+    text = registry.to_prometheus()
+    assert 'topics_total{status="say \\"hi\\""} 1' in text
+    assert 'stage_seconds_bucket{stage="analysis",le="0.1"} 0' in text
+    assert 'stage_seconds_bucket{stage="analysis",le="+Inf"} 1' in text
+    assert 'stage_seconds_count{stage="analysis"} 1' in text
+
+
+def test_a_topic_leaves_one_trace_with_a_span_per_stage():
+    orchestrator = build_orchestrator(llm_latency=0.01, research_latency=0.01)
+    try:
+        orchestrator.process_topic("traced topic", timeout=10)
+    finally:
+        orchestrator.shutdown()
+    trace = next(t for t in reversed(recent_traces()) if t["topic"] == "traced topic")
+    names = [span["name"] for span in trace["spans"]]
+    assert trace["status"] == "success"
+    for name in ("research", "queue_wait.analysis_agent", "analysis", "queue_wait.summary_agent", "summary"):
+        assert name in names
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from benchmark import StubLLM, build_orchestrator
+from config import config
+from research_agent import ResearchAgent
+
+
+@pytest.fixture
+def orchestrator():
+    orchestrator = build_orchestrator(llm_latency=0.01, research_latency=0.01)
+    yield orchestrator
+    orchestrator.shutdown()
+
+
+def test_process_topic_returns_summary(orchestrator):
+    result = orchestrator.process_topic("timeout test topic", timeout=10)
+    assert not result.lstrip().startswith("ERROR")
+    assert "RESEARCH SUMMARY" in result
+
+
+def test_process_topic_timeout_returns_at_deadline(orchestrator):
+    orchestrator.analysis_agent.agent = StubLLM(2.0, "Slow analysis.")
+    started = time.perf_counter()
+    result = orchestrator.process_topic("slow topic", timeout=0.3)
+    elapsed = time.perf_counter() - started
+    assert result.startswith("ERROR: Pipeline timeout")
+    assert elapsed < 1.0
+
+
+def test_concurrent_streams_of_the_same_topic_stay_apart(orchestrator):
+    outcomes = []
+
+    def consume():
+        events = list(orchestrator.process_topic_stream("shared topic", timeout=10))
+        headers = [e for e in events if e["event"] == "token" and "RESEARCH SUMMARY" in e["text"]]
+        outcomes.append((events[-1]["event"], len(headers)))
+
+    threads = [threading.Thread(target=consume) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=15)
+    assert outcomes == [("done", 1), ("done", 1)]
+
+
+def test_retry_after_timeout_does_not_get_the_late_summary(orchestrator):
+    orchestrator.analysis_agent.agent = StubLLM(0.4, "Slow analysis.")
+    assert orchestrator.process_topic("retried topic", timeout=0.1).startswith("ERROR: Pipeline timeout")
+    # Let the abandoned request finish; nobody is waiting for its summary any more
+    time.sleep(0.8)
+    assert not orchestrator.summary_agent._result_futures
+
+    orchestrator.analysis_agent.agent = StubLLM(0.01, "Fast analysis.")
+    orchestrator.summary_agent.agent = StubLLM(0.01, "Fresh summary.")
+    assert "Fresh summary." in orchestrator.process_topic("retried topic", timeout=10)
+
+
+class StubSearch:
+    cacheable = False
+
+    def search(self, query, max_results=5):
+        slug = query.replace(" ", "-")
+        return [{"title": f"{query} {i}", "href": f"https://example.com/{slug}/{i}", "body": f"Finding {i} on {query}."}
+                for i in range(2)]
+
+
+def test_pipelined_stream_reports_each_research_batch(orchestrator, monkeypatch):
+    monkeypatch.setattr(config, "RESEARCH_PIPELINED", True)
+    monkeypatch.setattr(config, "RESEARCH_PARTIAL_SOURCES", 2)
+    orchestrator.research_agent = ResearchAgent(orchestrator.message_queue, search_backend=StubSearch(),
+                                                fanout_queries=3)
+    kinds = [event["event"] for event in orchestrator.process_topic_stream("pipelined topic", timeout=10)]
+    assert kinds.count("research_partial") == 3
+    assert kinds.index("research_partial") < kinds.index("research_done")
+    assert kinds[-1] == "done"
+
+
+def test_async_batches_keep_their_own_stage_limits(orchestrator):
+    async def run_batches():
+        orchestrator._ensure_async_pipeline()
+        shared = orchestrator._async_limits
+        results = await asyncio.gather(
+            orchestrator.aprocess_topics(["serial one", "serial two"], concurrency=1, timeout=10),
+            orchestrator.aprocess_topics(["wide one", "wide two"], concurrency=4, timeout=10),
+            orchestrator.aprocess_topic("single topic", timeout=10)
+        )
+        assert orchestrator._async_limits is shared
+        return results
+
+    serial, wide, single = asyncio.run(run_batches())
+    for result in [*serial.values(), *wide.values(), single]:
+        assert "RESEARCH SUMMARY" in result
+    assert not orchestrator._request_limits
+
+
+def test_process_topics_runs_a_batch_in_input_order(orchestrator):
+    topics = ["batch one", "batch two", "batch one", "batch three"]
+    results = orchestrator.process_topics(topics, concurrency={"research": 3, "analysis": 2, "summary": 2},
+                                          timeout=10)
+    assert list(results) == ["batch one", "batch two", "batch three"]
+    assert all("RESEARCH SUMMARY" in result for result in results.values())
+    # The batch's pools are gone; later requests use the default ones again
+    assert not orchestrator._stage_pools
+    with pytest.raises(ValueError):
+        orchestrator.process_topics(topics, order="random")
+
+
+def test_aprocess_topic_times_out_without_blocking_the_loop(orchestrator):
+    orchestrator.analysis_agent.agent = StubLLM(2.0, "Slow analysis.")
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        result = await orchestrator.aprocess_topic("slow async topic", timeout=0.3)
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(run())
+    assert result.startswith("ERROR: Pipeline timeout")
+    assert ticks >= 10
+
+
+def test_cache_stats_with_the_mcp_research_agent(orchestrator):
+    assert "search" not in orchestrator.get_cache_stats()
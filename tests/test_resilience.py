@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from config import config
+from resilience import (POLICY_SETTINGS, CallTimeoutError, CircuitBreaker, ResiliencePolicy, RetryPolicy,
+                        TokenBucket, abandoned_calls, call_with_timeout, is_retryable, policy_settings)
+
+
+def policy(timeout=None, attempts=2):
+    return ResiliencePolicy("test", TokenBucket(0, 1), RetryPolicy(attempts, 0, 0),
+                            CircuitBreaker("test", 0, 1), timeout)
+
+
+def test_stream_times_out_between_items():
+    calls = []
+
+    def stalls_after(count):
+        calls.append(count)
+        for index in range(count):
+            yield index
+        time.sleep(1)
+        yield count
+
+    # Nothing produced yet: the attempt is retried
+    with pytest.raises(CallTimeoutError):
+        list(policy(timeout=0.05).stream(stalls_after, 0))
+    assert calls == [0, 0]
+
+    # Items already handed out can't be taken back, so a stall mid-stream is not retried
+    calls.clear()
+    received = []
+    with pytest.raises(CallTimeoutError):
+        for item in policy(timeout=0.05).stream(stalls_after, 2):
+            received.append(item)
+    assert received == [0, 1] and calls == [2]
+
+
+def test_policy_settings_apply_per_upstream_overrides():
+    settings = SimpleNamespace(**{key: getattr(config, key) for key in POLICY_SETTINGS},
+                               LLM_RESILIENCE="rate_limit_per_second=0.5, MAX_RETRIES=6", SEARCH_RESILIENCE="")
+    llm = policy_settings("llm", settings)
+    assert llm["RATE_LIMIT_PER_SECOND"] == 0.5 and llm["MAX_RETRIES"] == 6
+    assert llm["RETRY_BASE_DELAY"] == config.RETRY_BASE_DELAY
+    assert policy_settings("search", settings)["MAX_RETRIES"] == config.MAX_RETRIES
+    settings.LLM_RESILIENCE = "RETRIES=2"
+    with pytest.raises(ValueError):
+        policy_settings("llm", settings)
+
+
+def test_only_retryable_errors_are_retried():
+    calls = []
+
+    def fails(error):
+        calls.append(error)
+        raise error
+
+    with pytest.raises(ValueError):
+        policy(attempts=3).call(fails, ValueError("bad prompt"))
+    assert len(calls) == 1
+
+    calls.clear()
+    with pytest.raises(ConnectionError):
+        policy(attempts=3).call(fails, ConnectionError("reset"))
+    assert len(calls) == 3
+
+    assert is_retryable(HTTPError(429)) and not is_retryable(HTTPError(404))
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code=400):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+def test_timed_out_calls_are_counted_until_they_finish(monkeypatch):
+    # Threads abandoned by other tests may still be winding down
+    running = abandoned_calls()
+    monkeypatch.setattr(config, "MAX_ABANDONED_CALLS", running + 1)
+    release = threading.Event()
+    with pytest.raises(CallTimeoutError):
+        call_with_timeout(release.wait, 0.01)
+    assert abandoned_calls() == running + 1
+    # At the cap, new calls fail without starting another thread
+    with pytest.raises(CallTimeoutError, match="still running"):
+        call_with_timeout(lambda: None, 1)
+    release.set()
+    deadline = time.monotonic() + 2
+    while abandoned_calls() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert abandoned_calls() == 0
+    assert call_with_timeout(lambda: 42, 1) == 42
+
+
+def test_unfinished_half_open_trial_lets_the_next_call_through():
+    breaker = CircuitBreaker("test", 1, 0.05)
+    guarded = ResiliencePolicy("test", TokenBucket(0, 1), RetryPolicy(1, 0, 0), breaker, None)
+
+    def fails():
+        raise ConnectionError("down")
+
+    def reopen():
+        with pytest.raises(ConnectionError):
+            guarded.call(fails)
+        time.sleep(0.06)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # The trial is a stream closed after its first item
+    reopen()
+    items = guarded.stream(lambda: iter([1, 2]))
+    assert next(items) == 1
+    items.close()
+    assert guarded.call(lambda: "ok") == "ok"
+
+    # The trial is a coroutine cancelled mid-call
+    reopen()
+
+    async def cancelled_trial():
+        task = asyncio.create_task(guarded.acall(asyncio.sleep, 1))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancelled_trial())
+    assert guarded.call(lambda: "ok") == "ok"
@@ -0,0 +1,44 @@
+import time
+
+from result_store import TopicVersion, plan_refresh
+from sources import format_sources
+
+
+def research(*pages):
+    return format_sources([{"title": f"Title {url}", "href": url, "body": body} for url, body in pages],
+                          body_chars=1000)
+
+
+def version(plan):
+    plan.add_results([f"analysis of {group['sources']}" for group in plan.groups], failed=lambda result: False)
+    return TopicVersion("topic", 1, time.time(), plan.sources, plan.partials, "analysis", "summary",
+                        {"complete": True})
+
+
+PAGES = [("https://a.com/1", "First article body about the subject."),
+         ("https://b.com/2", "Second article body with other details."),
+         ("https://c.com/3", "Third article body closing the story.")]
+
+
+def test_first_run_analyzes_every_source_in_token_groups():
+    plan = plan_refresh(None, research(*PAGES), group_tokens=1)
+    assert len(plan.groups) == 3
+    assert plan.counts["added"] == 3 and plan.counts["analyzed_sources"] == 3
+    assert not plan.unchanged
+
+
+def test_refresh_reuses_partials_of_unchanged_sources():
+    previous = version(plan_refresh(None, research(*PAGES), group_tokens=1))
+    # Reordered (so renumbered), one page edited in place, one removed and one new
+    pages = [PAGES[1], (PAGES[0][0], "First article body, since corrected."), ("https://d.com/4", "A new page.")]
+    plan = plan_refresh(previous, research(*pages), group_tokens=1)
+    assert plan.counts == {"sources": 3, "unchanged": 1, "added": 1, "changed": 1, "removed": 1,
+                           "reused_partials": 1, "analyzed_sources": 2}
+    assert [partial["analysis"] for partial in plan.reused] == [previous.partials[1]["analysis"]]
+
+
+def test_refresh_with_the_same_sources_in_another_order_is_unchanged():
+    previous = version(plan_refresh(None, research(*PAGES), group_tokens=1))
+    plan = plan_refresh(previous, research(*reversed(PAGES)), group_tokens=1)
+    assert plan.unchanged
+    assert plan.groups == [] and plan.counts["reused_partials"] == 3
@@ -0,0 +1,23 @@
+from caching import SearchCache
+from search_backends import CachedSearchBackend, MergedSearchBackend
+
+
+class CountingBackend:
+    def __init__(self, href):
+        self.href = href
+        self.calls = 0
+
+    def search(self, query, max_results=5):
+        self.calls += 1
+        return [{"title": query, "href": self.href, "body": f"call {self.calls}"}]
+
+
+def test_merged_backend_caches_web_results_but_not_local_ones():
+    web, local = CountingBackend("https://web.com/a"), CountingBackend("https://local/a")
+    merged = MergedSearchBackend([CachedSearchBackend(web, SearchCache()), local])
+    merged.search("topic")
+    results = merged.search("topic")
+    assert web.calls == 1 and local.calls == 2
+    # The local hit is fresh on every search
+    assert {"https://local/a": "call 2"}.items() <= {r["href"]: r["body"] for r in results}.items()
+    assert merged.search_cache.get_stats()["memory_hits"] == 1
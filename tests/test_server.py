@@ -0,0 +1,42 @@
+import threading
+
+import pytest
+
+from benchmark import StubLLM, build_orchestrator
+from client import ResearchClient
+from server import ResearchService, ServerBusyError, create_server
+
+
+@pytest.fixture
+def orchestrator():
+    orchestrator = build_orchestrator(llm_latency=0.01, research_latency=0.01)
+    yield orchestrator
+    orchestrator.shutdown()
+
+
+def test_client_streams_a_summary_from_a_running_server(orchestrator, tmp_path):
+    socket_path = str(tmp_path / "research.sock")
+    server = create_server(ResearchService(orchestrator), socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = ResearchClient(socket_path=socket_path)
+        assert "RESEARCH SUMMARY" in client.research("served topic", timeout=10)
+        # The same warm orchestrator serves the next request
+        assert "RESEARCH SUMMARY" in client.research("second topic", timeout=10)
+        stats = client.stats()["server"]
+        assert (stats["accepted"], stats["completed"], stats["active"]) == (2, 2, 0)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_requests_beyond_the_pending_limit_are_rejected(orchestrator):
+    orchestrator.summary_agent.agent = StubLLM(0.3, "Slow summary.")
+    service = ResearchService(orchestrator, max_concurrent=1, max_pending=0)
+    running = service.stream("first topic", timeout=10)
+    next(running)
+    with pytest.raises(ServerBusyError):
+        next(service.stream("second topic", timeout=10))
+    assert [event["event"] for event in running][-1] == "done"
+    assert service.get_stats()["server"]["rejected"] == 1
@@ -0,0 +1,51 @@
+from sources import canonical_url, content_hash, format_sources, merge_ranked
+
+
+def result(href, body="", title="Title"):
+    return {"title": title, "href": href, "body": body}
+
+
+def test_canonical_url_normalizes_mirrors():
+    assert canonical_url("https://www.Example.com:443//a//b/?utm_source=x&b=2&a=1") == "//example.com/a/b?a=1&b=2"
+    assert canonical_url("http://example.com/a/b") == canonical_url("https://example.com/a/b/")
+
+
+def test_canonical_url_strips_only_tracking_params():
+    assert canonical_url("https://x.com/item?ref=feed&fbclid=1&utm_medium=email&id=3") == "//x.com/item?id=3"
+    # Parameters that merely start like a tracking parameter identify different pages
+    assert canonical_url("https://x.com/item?refid=10") != canonical_url("https://x.com/item?refid=20")
+    assert canonical_url("https://x.com/item?reference=1") == "//x.com/item?reference=1"
+
+
+def test_content_hash_ignores_case_punctuation_and_whitespace():
+    assert content_hash("Hello,  World!") == content_hash("hello world")
+    assert content_hash("hello world") != content_hash("hello there")
+
+
+def test_merge_ranked_deduplicates_by_url_and_content():
+    first = [result("https://a.com/1", "alpha"), result("https://b.com/2", "beta")]
+    second = [result("https://www.a.com/1/?utm_source=feed", "alpha, longer copy"), result("https://c.com/3", "Beta")]
+    merged = merge_ranked([first, second])
+    assert len(merged) == 2
+    # The most complete copy of a page is kept
+    assert merged[0]["body"] == "alpha, longer copy"
+
+
+def test_merge_ranked_orders_by_reciprocal_rank_and_caps():
+    lists = [
+        [result("https://a.com", "a"), result("https://b.com", "b")],
+        [result("https://c.com", "c"), result("https://b.com", "b")],
+        [result("https://b.com", "b")],
+    ]
+    merged = merge_ranked(lists, max_results=2)
+    assert [r["href"] for r in merged] == ["https://b.com", "https://a.com"]
+
+
+def test_merge_ranked_keeps_pages_with_distinct_query_params():
+    merged = merge_ranked([[result("https://x.com/item?refid=10", "one")], [result("https://x.com/item?refid=20", "two")]])
+    assert len(merged) == 2
+
+
+def test_format_sources_numbers_from_start():
+    text = format_sources([result("https://a.com", "body")], start=5)
+    assert text.startswith("Source 5:\nTitle: Title\nURL: https://a.com\nContent: body...")
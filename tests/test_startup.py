@@ -0,0 +1,16 @@
+from benchmark import measure_startup
+from enhanced_orchestrator import EnhancedResearchOrchestrator
+
+
+def test_cli_startup_does_not_import_deferred_packages():
+    result = measure_startup(runs=1)
+    assert result["deferred_loaded"] == []
+
+
+def test_agents_are_built_on_first_use():
+    orchestrator = EnhancedResearchOrchestrator(use_mcp=True)
+    try:
+        agents = (orchestrator.research_agent, orchestrator.analysis_agent, orchestrator.summary_agent)
+        assert all(agent._agent is None for agent in agents)
+    finally:
+        orchestrator.shutdown()
@@ -0,0 +1,115 @@
+from communication import AgentMessage, MessageQueue
+from config import config
+from resilience import CircuitBreaker, ResiliencePolicy, RetryPolicy, TokenBucket
+from summary_agent import SummaryAgent
+from text_analysis import BackgroundCorpus, analyze_text, split_sources, summarize, textrank
+
+
+def block(number, title, body):
+    return f"Source {number}:\nTitle: {title}\nURL: https://site{number}.com/a\nContent: {body}"
+
+
+RESEARCH = "\n\n".join([
+    block(1, "Heat pumps", "Heat pumps cut heating bills. Heat pumps move heat instead of burning fuel, "
+                           "and the market for heat pumps grew in cold climates."),
+    block(2, "Grid storage", "Battery storage smooths the grid. Battery storage projects doubled, "
+                             "and heat pumps add winter demand to the grid."),
+    block(3, "Solar panels", "Solar panels got cheaper again. Rooftop solar panels pair well with heat pumps "
+                             "and battery storage."),
+])
+
+
+def test_sources_are_split_and_labelled_by_their_headers():
+    labels = [label for label, _ in split_sources(RESEARCH)]
+    assert labels == ["Source 1: Heat pumps", "Source 2: Grid storage", "Source 3: Solar panels"]
+
+
+def test_phrases_rank_above_their_words_and_field_labels_are_skipped():
+    result = analyze_text(RESEARCH, top_k=5)
+    names = result.theme_names()
+    # Said less often than "heat pumps", but only by one source where that is in every source
+    assert names[:2] == ["solar panels", "heat pumps"]
+    assert "heat" not in names and "pumps" not in names
+    assert not {"source", "title", "url", "content"} & set(names)
+    assert result.documents == 3
+
+
+def test_each_source_gets_its_own_themes_and_shared_themes_span_sources():
+    result = analyze_text(RESEARCH, per_source=2)
+    themes = dict(result.source_themes)
+    assert "grid" in themes["Source 2: Grid storage"] or "battery storage" in themes["Source 2: Grid storage"]
+    assert "solar panels" in themes["Source 3: Solar panels"]
+    assert "heat pumps" in result.shared_themes
+
+
+def test_background_corpus_demotes_words_common_in_general_text():
+    text = "The report covers quantum annealing. Quantum annealing needs cold chips. The report is long report."
+    plain = analyze_text(text, top_k=1).theme_names()
+    background = BackgroundCorpus.from_texts([f"Another report, number {i}." for i in range(20)])
+    assert analyze_text(text, top_k=1, background=background).theme_names() == ["quantum annealing"]
+    assert plain != [] and background.df["report"] == 20
+
+
+def test_empty_text_has_no_themes():
+    result = analyze_text("   ")
+    assert result.themes == [] and result.tokens == 0
+
+
+SENTENCES = [
+    "Heat pumps lower heating bills in cold climates.",
+    "Heat pumps and heating bills were the focus of the survey.",
+    "Owners said heat pumps cut their heating bills by a third.",
+    "The survey ran for two winters in four countries.",
+    "A bakery on the corner sells sourdough bread.",
+]
+
+
+def test_textrank_ranks_the_sentence_most_like_the_others_first():
+    scores = textrank(SENTENCES)
+    assert scores.argmax() in (0, 1, 2)
+    assert scores[4] == scores.min()
+
+
+def test_summary_keeps_the_most_central_sentences_in_text_order():
+    text = "Title: Heat pumps\n\n" + " ".join(SENTENCES)
+    picked = summarize(text, max_sentences=2)
+    assert len(picked) == 2 and picked == sorted(picked, key=SENTENCES.index)
+    assert SENTENCES[4] not in summarize(text, max_sentences=3)
+    assert summarize("Too short. Also short.") == []
+
+
+def summary_prompt(agent):
+    message = AgentMessage(sender="analysis_agent", receiver="summary_agent",
+                           content={"topic": "heat pumps", "research_data": " ".join(SENTENCES),
+                                    "analysis_data": "Heat pumps save owners money on heating bills every winter."},
+                           message_type="analysis", timestamp="0")
+    return agent._prepare_summary(message)[1]
+
+
+class FailingLLM:
+    calls = 0
+
+    def kickoff(self, prompt):
+        self.calls += 1
+        raise RuntimeError("model unavailable")
+
+
+def test_fast_mode_summarizes_without_the_model(monkeypatch):
+    monkeypatch.setattr(config, "SUMMARY_MODE", "fast")
+    monkeypatch.setattr(config, "SUMMARY_FAST_SENTENCES", 2)
+    agent = SummaryAgent(MessageQueue())
+    agent.agent = FailingLLM()
+    summary = agent._safe_execute_task(summary_prompt(agent))
+    assert summary["status"] == "fast_summary" and summary["topic"] == "heat pumps"
+    assert len(summary["key_findings"]) == 2
+    assert summary["conclusion"] == "Heat pumps save owners money on heating bills every winter."
+    assert agent.agent.calls == 0
+
+
+def test_failed_model_call_falls_back_to_an_extractive_summary():
+    agent = SummaryAgent(MessageQueue())
+    agent.agent = FailingLLM()
+    agent.llm_policy = ResiliencePolicy("test", TokenBucket(0, 1), RetryPolicy(1, 0, 0), CircuitBreaker("test", 5, 1), None)
+    summary = agent._safe_execute_task(summary_prompt(agent))
+    assert summary["status"] == "fallback_summary" and agent.agent.calls == 1
+    assert "heat pumps" in summary["summary"]
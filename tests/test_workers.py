@@ -0,0 +1,45 @@
+import functools
+import time
+
+import pytest
+
+from benchmark import install_stub_llm
+from config import config
+from enhanced_orchestrator import EnhancedResearchOrchestrator
+
+
+@pytest.fixture
+def orchestrator(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "QUEUE_BACKEND", "sqlite")
+    monkeypatch.setattr(config, "QUEUE_PATH", str(tmp_path / "queue.sqlite3"))
+    monkeypatch.setattr(config, "ANALYSIS_PROCESSES", 1)
+    monkeypatch.setattr(config, "SUMMARY_PROCESSES", 2)
+    stub = functools.partial(install_stub_llm, latency=0.01, response_chars=200)
+    orchestrator = EnhancedResearchOrchestrator(use_mcp=True, worker_initializer=stub)
+    yield orchestrator
+    orchestrator.shutdown(timeout=10)
+
+
+def test_stages_run_in_worker_processes(orchestrator):
+    stats = orchestrator.stage_workers.get_stats()
+    assert sorted(stats) == ["analysis-0", "summary-0", "summary-1"]
+    assert all(worker["alive"] for worker in stats.values())
+
+    results = orchestrator.process_topics(["worker topic one", "worker topic two"], timeout=60)
+    assert all("RESEARCH SUMMARY" in result for result in results.values())
+    # A repeated topic is a separate request, not the earlier one's summary
+    assert "RESEARCH SUMMARY" in orchestrator.process_topic("worker topic one", timeout=60)
+
+
+def test_worker_that_dies_is_restarted(orchestrator):
+    pool = orchestrator.stage_workers
+    victim = pool._processes[("analysis", 0)]
+    victim.kill()
+    victim.join()
+    for _ in range(100):
+        replacement = pool._processes[("analysis", 0)]
+        if replacement is not victim and replacement.is_alive():
+            break
+        time.sleep(0.1)
+    assert pool.get_stats()["analysis-0"]["restarts"] == 1
+    assert "RESEARCH SUMMARY" in orchestrator.process_topic("after restart", timeout=60)
@@ -0,0 +1,296 @@
+"""
+Offline keyphrase analysis of research text.
+
+Scores unigrams and bigrams by TF-IDF with NumPy. Each "Source N:" block
+(any blank-line separated paragraph) is one document, so the themes that
+set a source apart rank above words every source shares. Document
+frequencies can be pooled with a background corpus (a text file of
+blank-line separated documents, ANALYSIS_BACKGROUND_CORPUS). Words that are
+common in general text then rank below the vocabulary specific to the
+research.
+
+Tokenization is one regex pass over the text. Everything after that is
+array arithmetic over integer term ids, so a megabyte of research text is
+analyzed in about a tenth of a second, most of it in the regex.
+AnalysisAgent uses the engine as its fallback when the model fails, and as
+a no-LLM analysis mode (ANALYSIS_MODE).
+
+summarize() is the extractive counterpart for the summary stage. It splits
+the text into sentences, builds TF-IDF sentence vectors and ranks the
+sentences by TextRank (power iteration over their cosine similarity
+matrix). SummaryAgent uses it as its fallback and fast mode (SUMMARY_MODE).
+"""
+import functools
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Words, plus what ends a phrase (a bigram never spans one): URLs, punctuation and
+# paragraph breaks, which also separate sources
+_TOKEN = re.compile(r"https?://\S+|\w+(?:['\-]\w+)*|[.!?;:,()\[\]]|\n\s*\n")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SOURCE_HEADER = re.compile(r"^\s*(Source \d+):?\s*$", re.MULTILINE)
+_TITLE = re.compile(r"^\s*Title:\s*(.+)$", re.MULTILINE)
+
+# Field labels of the research agents' source blocks, never themes
+_FIELD_WORDS = {"source", "title", "url", "content", "http", "https", "www", "com", "org", "html"}
+
+STOPWORDS = frozenset("""
+a about above after again against all almost also although always am among an and another any are around as at
+be became because become been before being below between both but by can could did do does doing done down during
+each either else enough etc even ever every few first for from further get gets getting given go goes going got had
+has have having he her here hers herself him himself his how however i if in including into is it its itself just
+last least less let like made make makes many may me might more most much must my myself near need new next no nor
+not now of off often on once one only or other others our ours ourselves out over own per perhaps quite rather
+really said same say says see seen several she should since so some still such than that the their theirs them
+themselves then there therefore these they this those though through thus to too toward towards two under until
+up upon us use used uses using very via was we well were what whatever when where whether which while who whom
+whose why will with within without would yet you your yours yourself yourselves eg ie vs
+""".split()) | _FIELD_WORDS
+
+
+@dataclass
+class BackgroundCorpus:
+    """Document frequencies of a reference corpus, pooled into the IDF of every analysis"""
+    n_docs: int = 0
+    df: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "BackgroundCorpus":
+        corpus = cls()
+        for text in texts:
+            words = [token for token in _TOKEN.findall(text.lower()) if _is_word(token)]
+            terms = set(words)
+            terms.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+            for term in terms:
+                corpus.df[term] = corpus.df.get(term, 0) + 1
+            corpus.n_docs += 1
+        return corpus
+
+    @classmethod
+    def from_file(cls, path: str) -> "BackgroundCorpus":
+        """Corpus from a UTF-8 text file of blank-line separated documents"""
+        with open(path, encoding="utf-8") as f:
+            return cls.from_texts(p for p in _PARAGRAPH_BREAK.split(f.read()) if p.strip())
+
+
+@functools.lru_cache(maxsize=4)
+def load_background(path: str) -> Optional[BackgroundCorpus]:
+    """Background corpus at path, loaded once per process; None for an empty path"""
+    return BackgroundCorpus.from_file(path) if path else None
+
+
+@dataclass
+class TextAnalysis:
+    """Result of analyze_text"""
+    themes: List[Tuple[str, float]]
+    source_themes: List[Tuple[str, List[str]]]
+    shared_themes: List[str]
+    documents: int
+    tokens: int
+    vocabulary: int
+
+    def theme_names(self) -> List[str]:
+        return [term for term, _ in self.themes]
+
+
+def _is_word(token: str) -> bool:
+    return (len(token) > 1 and token not in STOPWORDS and token[0].isalpha() and "/" not in token)
+
+
+def split_sources(text: str) -> List[Tuple[str, str]]:
+    """(label, body) per blank-line separated block, labelled "Source N: title" where present"""
+    sources = []
+    for block in _PARAGRAPH_BREAK.split(text.strip()):
+        if not block.strip():
+            continue
+        header = _SOURCE_HEADER.search(block)
+        title = _TITLE.search(block)
+        label = header.group(1) if header else f"Part {len(sources) + 1}"
+        if title:
+            label = f"{label}: {title.group(1).strip()}"
+        sources.append((label, block))
+    return sources
+
+
+def analyze_text(text: str, top_k: int = 10, per_source: int = 3,
+                 background: Optional[BackgroundCorpus] = None) -> TextAnalysis:
+    """Top keyphrases of text overall, per source, and those most sources share"""
+    text = text.strip()
+    sources = split_sources(text)
+    tokens = _TOKEN.findall(text.lower())
+    if not tokens:
+        return TextAnalysis([], [(label, []) for label, _ in sources], [], len(sources), 0, 0)
+
+    # Word ids without a per-token Python loop: dict.fromkeys and map run in C
+    words = list(dict.fromkeys(tokens))
+    vocab = {word: i for i, word in enumerate(words)}
+    V = len(words)
+    token_ids = np.fromiter(map(vocab.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+    is_word = np.fromiter((_is_word(word) for word in words), dtype=bool, count=V)
+    is_break = np.fromiter((word[0] == "\n" for word in words), dtype=bool, count=V)
+    doc_of = np.cumsum(is_break[token_ids])
+
+    # Term keys: a unigram is its word id, a bigram V + first * V + second
+    valid = is_word[token_ids]
+    # Consecutive words only; a break between them is a token of its own. "data data" is no phrase
+    pair = valid[:-1] & valid[1:] & (token_ids[:-1] != token_ids[1:])
+    keys = np.concatenate([token_ids[valid], V + token_ids[:-1][pair] * V + token_ids[1:][pair]])
+    docs = np.concatenate([doc_of[valid], doc_of[:-1][pair]])
+    if not len(keys):
+        return TextAnalysis([], [(label, []) for label, _ in sources], [], len(sources), len(tokens), V)
+
+    terms, term_index = np.unique(keys, return_inverse=True)
+    T = len(terms)
+    doc_terms, doc_term_counts = np.unique(docs * T + term_index, return_counts=True)
+    doc_index, doc_term_index = np.divmod(doc_terms, T)
+    df = np.bincount(doc_term_index, minlength=T).astype(np.float64)
+    tf = np.bincount(term_index, minlength=T).astype(np.float64)
+    n_words = np.where(terms < V, 1.0, 2.0)
+
+    def term_name(key: int) -> str:
+        if key < V:
+            return words[key]
+        first, second = divmod(int(key) - V, V)
+        return f"{words[first]} {words[second]}"
+
+    n_docs = float(len(sources))
+    if background is not None and background.n_docs:
+        # Only terms that could reach the results are looked up in the background corpus
+        candidates = np.flatnonzero((tf >= 2) | (n_words == 1) | (n_docs == 1))
+        background_df = np.zeros(T)
+        background_df[candidates] = [background.df.get(term_name(terms[i]), 0) for i in candidates]
+        df_total = df + background_df
+        n_docs += background.n_docs
+    else:
+        df_total = df
+    idf = np.log((1.0 + n_docs) / (1.0 + df_total)) + 1.0
+
+    # Sublinear term frequency; a phrase outranks its words when it occurs as often.
+    # Phrases seen once in a multi-source text are noise more often than themes
+    score = (1.0 + np.log(tf)) * idf * n_words
+    if len(sources) > 1:
+        score[(n_words == 2) & (tf < 2)] = 0.0
+    themes = _top_terms(score, terms, top_k, term_name)
+
+    # Per source, the same scoring over that source's counts, among terms that scored overall
+    pair_score = (1.0 + np.log(doc_term_counts)) * idf[doc_term_index] * n_words[doc_term_index]
+    scored = score[doc_term_index] > 0
+    order = np.lexsort((-pair_score[scored], doc_index[scored]))
+    ranked_docs, ranked_terms = doc_index[scored][order], doc_term_index[scored][order]
+    starts = np.searchsorted(ranked_docs, np.arange(len(sources)))
+    ends = np.searchsorted(ranked_docs, np.arange(len(sources)), side="right")
+    source_themes = []
+    for (label, _), start, end in zip(sources, starts, ends):
+        picked: List[str] = []
+        for i in ranked_terms[start:end]:
+            name = term_name(terms[i])
+            if not any(_overlaps(name, other) for other in picked):
+                picked.append(name)
+            if len(picked) >= per_source:
+                break
+        source_themes.append((label, picked))
+
+    shared: List[str] = []
+    if len(sources) > 1:
+        common = np.flatnonzero(df >= max(2, math.ceil(len(sources) / 2)))
+        shared = [name for name, _ in _top_terms(score[common] * df[common], terms[common], per_source, term_name)]
+
+    return TextAnalysis(themes, source_themes, shared, len(sources), len(tokens), V)
+
+
+def _overlaps(a: str, b: str) -> bool:
+    """Whether one term is a word of the other (a phrase and its own words)"""
+    return a in b.split(" ") or b in a.split(" ")
+
+
+def _top_terms(score: np.ndarray, terms: np.ndarray, k: int, term_name) -> List[Tuple[str, float]]:
+    """The k best-scoring terms, skipping words already covered by a higher-ranked phrase and vice versa"""
+    if not k or not len(score):
+        return []
+    # A generous candidate pool, so overlaps can be skipped without a second pass
+    pool = min(len(score), k * 4)
+    candidates = np.argpartition(-score, pool - 1)[:pool]
+    picked: List[Tuple[str, float]] = []
+    for i in candidates[np.argsort(-score[candidates], kind="stable")]:
+        if score[i] <= 0:
+            break
+        name = term_name(terms[i])
+        if any(_overlaps(name, other) for other, _ in picked):
+            continue
+        picked.append((name, round(float(score[i]), 3)))
+        if len(picked) >= k:
+            break
+    return picked
+
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+# Source block fields that are labels rather than prose
+_FIELD_LINE = re.compile(r"^(?:Source \d+:?|Title:.*|URL:.*|Key themes:.*)$")
+_FIELD_PREFIX = re.compile(r"^(?:Content|Summary|Insights):\s*")
+
+
+def split_sentences(text: str, min_words: int = 4) -> List[str]:
+    """Prose sentences of text, without source block labels and fragments under min_words words"""
+    sentences = []
+    for sentence in _SENTENCE_SPLIT.split(text):
+        sentence = sentence.strip()
+        if not sentence or _FIELD_LINE.match(sentence):
+            continue
+        sentence = _FIELD_PREFIX.sub("", sentence)
+        if len(sentence.split()) >= min_words:
+            sentences.append(sentence)
+    return sentences
+
+
+def textrank(sentences: List[str], damping: float = 0.85, iterations: int = 50,
+             tolerance: float = 1e-6) -> np.ndarray:
+    """TextRank centrality of each sentence over TF-IDF cosine similarity"""
+    n = len(sentences)
+    if n < 3:
+        return np.ones(n)
+    vocab: Dict[str, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    for row, sentence in enumerate(sentences):
+        for token in _TOKEN.findall(sentence.lower()):
+            if _is_word(token):
+                rows.append(row)
+                cols.append(vocab.setdefault(token, len(vocab)))
+    if not vocab:
+        return np.ones(n)
+
+    counts = np.zeros((n, len(vocab)))
+    np.add.at(counts, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), 1.0)
+    present = counts > 0
+    df = present.sum(axis=0)
+    weights = np.where(present, 1.0 + np.log(np.maximum(counts, 1.0)), 0.0) * (np.log((1.0 + n) / (1.0 + df)) + 1.0)
+    norms = np.linalg.norm(weights, axis=1)
+    norms[norms == 0] = 1.0
+    # Words in one sentence only add nothing to any similarity, just to the norms above
+    shared = weights[:, df > 1] / norms[:, None]
+    similarity = shared @ shared.T
+    np.fill_diagonal(similarity, 0.0)
+
+    # Row-normalized transition matrix; a sentence similar to none links to every sentence
+    totals = similarity.sum(axis=1, keepdims=True)
+    transition = np.where(totals > 0, similarity / np.where(totals > 0, totals, 1.0), 1.0 / n)
+    scores = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        updated = (1.0 - damping) / n + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < tolerance:
+            return updated
+        scores = updated
+    return scores
+
+
+def summarize(text: str, max_sentences: int = 5, max_candidates: int = 400) -> List[str]:
+    """The max_sentences most central sentences of text, in their original order"""
+    sentences = split_sentences(text)[:max_candidates]
+    if len(sentences) <= max_sentences:
+        return sentences
+    top = np.argsort(-textrank(sentences), kind="stable")[:max_sentences]
+    return [sentences[i] for i in sorted(top)]
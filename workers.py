@@ -0,0 +1,225 @@
+"""
+Multi-process stage workers.
+
+Runs AnalysisAgent and SummaryAgent in separate processes that consume from
+the durable SQLite message queue, so CPU-bound work in those stages (the
+fallback analysis, map-reduce bookkeeping, local text processing) is not
+limited to one core by the GIL. The orchestrator starts a StageWorkerPool
+when ANALYSIS_PROCESSES or SUMMARY_PROCESSES is set:
+
+    QUEUE_BACKEND=sqlite ANALYSIS_PROCESSES=4 SUMMARY_PROCESSES=2 python main.py
+
+Summary workers send each finished summary back to the orchestrator as a
+"summary" message for RESULTS_RECEIVER. Workers shut down gracefully on
+SIGTERM: the message in hand is finished and acknowledged before the
+process exits. A worker that dies is restarted, up to WORKER_MAX_RESTARTS
+times per slot, and the messages it had claimed are released straight away
+rather than waiting out the visibility timeout.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, List, Optional
+
+from blob_store import release_refs
+from communication import AgentMessage
+from config import config
+from logging_setup import setup_logging
+
+# Receiver name for finished summaries sent back from summary workers
+RESULTS_RECEIVER = "orchestrator"
+
+STAGES = ("analysis", "summary")
+
+
+def _build_agent(stage: str, message_queue):
+    if stage == "analysis":
+        from analysis_agent import AnalysisAgent
+        return AnalysisAgent(message_queue)
+    from summary_agent import SummaryAgent
+    return SummaryAgent(message_queue)
+
+
+def run_worker(stage: str, queue_path: str, initializer: Optional[Callable] = None, ready=None):
+    """Entry point of a worker process: handle stage messages until SIGTERM"""
+    from durable_queue import DurableMessageQueue
+
+    stopping = threading.Event()
+    wake = threading.Event()
+
+    def stop(signum, frame):
+        stopping.set()
+        wake.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    # Ctrl+C reaches the whole process group; the supervisor decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Console only: the parent process owns LOG_FILE
+    setup_logging(config, log_file="", process_name=True)
+    logger = logging.getLogger(__name__)
+
+    # Claims from live workers must survive, so this process never releases them on start.
+    # One claim at a time: messages prefetched here would sit idle while sibling workers wait
+    message_queue = DurableMessageQueue(
+        queue_path,
+        visibility_timeout=config.QUEUE_VISIBILITY_TIMEOUT,
+        commit_interval=config.QUEUE_COMMIT_INTERVAL,
+        max_deliveries=config.QUEUE_MAX_DELIVERIES,
+        recover=False,
+        poll_interval=config.QUEUE_POLL_INTERVAL,
+        prefetch=1
+    )
+    agent = _build_agent(stage, message_queue)
+    if stage == "summary":
+        # Nobody waits in this process: keep summaries so they can be forwarded
+        agent.unclaimed = []
+    if initializer is not None:
+        initializer(agent)
+    message_queue.subscribe(agent.agent_name, wake.set)
+    logger.info("%s worker %s ready", stage, os.getpid())
+    if ready is not None:
+        ready.set()
+
+    try:
+        while not stopping.is_set():
+            wake.wait(config.QUEUE_POLL_INTERVAL)
+            wake.clear()
+            while not stopping.is_set():
+                message = message_queue.receive_message(agent.agent_name)
+                if message is None:
+                    break
+                agent._handle_message(message)
+                if stage == "summary":
+                    _forward_results(agent, message_queue)
+                message_queue.ack(message)
+                release_refs(message.content)
+    finally:
+        logger.info("%s worker %s stopping", stage, os.getpid())
+        message_queue.close()
+
+
+def _forward_results(agent, message_queue):
+    """Send summaries completed in this process to the orchestrator (before the input is acked)"""
+    # The trace id tells the orchestrator which request a summary belongs to
+    while agent.unclaimed:
+        trace_id, topic, summary = agent.unclaimed.pop(0)
+        message_queue.send_message(AgentMessage(
+            sender=agent.agent_name,
+            receiver=RESULTS_RECEIVER,
+            content={"topic": topic, "summary": summary, "trace_id": trace_id},
+            message_type="summary",
+            timestamp=datetime.now().isoformat()
+        ))
+
+
+class StageWorkerPool:
+    """Starts, supervises and stops the worker processes for each stage"""
+
+    def __init__(self, message_queue, workers: Dict[str, int], initializer: Optional[Callable] = None,
+                 max_restarts: int = 5, shutdown_timeout: float = 30.0, start_timeout: float = 60.0):
+        unknown = set(workers) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown worker stages: {sorted(unknown)}")
+        self.message_queue = message_queue
+        self.workers = {stage: count for stage, count in workers.items() if count > 0}
+        self.initializer = initializer
+        self.max_restarts = max_restarts
+        self.shutdown_timeout = shutdown_timeout
+        self.start_timeout = start_timeout
+        self.logger = logging.getLogger(__name__)
+        # Workers start from a fresh interpreter; forking would copy the parent's threads and SQLite handles
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: Dict[tuple, Any] = {}
+        self._restarts: Dict[tuple, int] = {}
+        # Kept referenced until the worker has started; a collected Event can't be unpickled in the child
+        self._ready: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._supervisor: Optional[threading.Thread] = None
+
+    def start(self):
+        """Spawn every worker and wait (up to start_timeout) until each is consuming"""
+        with self._lock:
+            ready = [self._spawn((stage, slot)) for stage, count in self.workers.items() for slot in range(count)]
+        self._supervisor = threading.Thread(target=self._supervise, name="stage-worker-supervisor", daemon=True)
+        self._supervisor.start()
+        deadline = time.monotonic() + self.start_timeout
+        if not all(event.wait(max(0.0, deadline - time.monotonic())) for event in ready):
+            self.logger.warning("Not every stage worker was ready after %ss", self.start_timeout)
+        self.logger.info("Started stage worker processes: %s", self.workers)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask every worker to finish its current message and exit; kill any still running after timeout"""
+        timeout = self.shutdown_timeout if timeout is None else timeout
+        self._stopping.set()
+        with self._lock:
+            processes = list(self._processes.values())
+        for process in processes:
+            if process.is_alive():
+                process.terminate()  # SIGTERM, handled as a graceful stop
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                self.logger.warning("Worker %s did not stop within %ss; killing it", process.name, timeout)
+                process.kill()
+                process.join()
+                self.message_queue.release_claims(str(process.pid))
+        if self._supervisor is not None:
+            self._supervisor.join(timeout=5)
+        self.logger.info("Stage worker processes stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                f"{stage}-{slot}": {"pid": process.pid, "alive": process.is_alive(),
+                                    "restarts": self._restarts.get((stage, slot), 0)}
+                for (stage, slot), process in self._processes.items()
+            }
+
+    def _spawn(self, key: tuple):
+        """Start the worker for (stage, slot), returning an event set once it is consuming"""
+        stage, slot = key
+        ready = self._context.Event()
+        process = self._context.Process(
+            target=run_worker,
+            args=(stage, self.message_queue.path, self.initializer, ready),
+            name=f"{stage}-worker-{slot}",
+            # Daemonic workers are stopped (with SIGTERM) if the parent exits without stop()
+            daemon=True
+        )
+        process.start()
+        self._processes[key] = process
+        self._ready[key] = ready
+        return ready
+
+    def _supervise(self):
+        """Restart workers that exit while the pool is running"""
+        while not self._stopping.is_set():
+            with self._lock:
+                sentinels = {process.sentinel: key for key, process in self._processes.items()
+                             if process.is_alive()}
+            ready: List = wait(list(sentinels), timeout=0.5) if sentinels else []
+            if not sentinels:
+                self._stopping.wait(0.5)
+            if self._stopping.is_set():
+                return
+            for sentinel in ready:
+                key = sentinels[sentinel]
+                with self._lock:
+                    process = self._processes[key]
+                    process.join()
+                    self.logger.error("Worker %s (pid %s) exited with code %s", process.name, process.pid, process.exitcode)
+                    self.message_queue.release_claims(str(process.pid))
+                    restarts = self._restarts.get(key, 0)
+                    if restarts >= self.max_restarts:
+                        self.logger.error("Worker %s restarted %s times; giving up on it", process.name, restarts)
+                        continue
+                    self._restarts[key] = restarts + 1
+                    self._spawn(key)